@@ -0,0 +1,147 @@
+import logging
+import threading
+import time
+import typing
+
+from concurrent.futures import ThreadPoolExecutor
+
+from connectors.rate_limiter import BACKGROUND_BUDGET_SHARE
+from database.candles_database import CandlesDatabase, exchange_key
+from Trading.models import Contract
+from Trading.strategies import TF_EQUIV
+
+if typing.TYPE_CHECKING:
+    from connectors.bitmex import BitmexClient
+    from connectors.binance import BinanceClient
+
+logger = logging.getLogger()
+
+# Candles returned by one history request
+PAGE_SIZE = {"binance_spot": 1000, "binance_futures": 1000, "bitmex": 500}
+
+
+class HistoryBackfill:
+    '''
+    Downloads the candles of a time range, page by page, from the most recent page to the oldest one.
+    The pages are requested concurrently as background requests of the client rate limiter, within a share of the
+    exchange limits, and saved in the candles
+    database as soon as they arrive. The pages completely downloaded are recorded, so running the same backfill
+    again after an interruption only requests the missing pages.
+    '''
+
+    def __init__(self, client: typing.Union["BinanceClient", "BitmexClient"], store: CandlesDatabase,
+                 max_workers: int = 4, budget_share: float = BACKGROUND_BUDGET_SHARE):
+        '''
+        :param client:
+        :param store:
+        :param max_workers: Pages requested at the same time
+        :param budget_share: Share of the rate limits of the client the backfill can use
+        '''
+
+        self._client = client
+        self._store = store
+        self._max_workers = max_workers
+        self._budget_share = budget_share
+
+        self._page_size = PAGE_SIZE[client.platform]
+
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        '''
+        Interrupt the backfill, the pages in flight are still saved
+        :return:
+        '''
+
+        self._stop_event.set()
+
+    def pages(self, timeframe: str, start_time: int, end_time: int) -> typing.List[typing.Tuple[int, int]]:
+        '''
+        Split a time range in pages, aligned on the timeframe so the same pages are computed when resuming
+        :return: (open time of the first candle, open time of the last candle) of each page, most recent first
+        '''
+
+        tf_ms = TF_EQUIV[timeframe] * 1000
+        page_ms = tf_ms * self._page_size
+
+        first = start_time - start_time % page_ms
+        last = end_time - end_time % tf_ms
+
+        pages = []
+
+        page_start = last - last % page_ms
+        while page_start >= first:
+            pages.append((max(page_start, start_time - start_time % tf_ms), min(page_start + page_ms - tf_ms, last)))
+            page_start -= page_ms
+
+        return pages
+
+    def run(self, contract: Contract, timeframe: str, start_time: int, end_time: int = None,
+            progress_callback: typing.Callable[[typing.Dict], None] = None) -> typing.Dict:
+        '''
+        Download the candles between start_time and end_time
+        :param contract:
+        :param timeframe:
+        :param start_time: In milliseconds
+        :param end_time: In milliseconds, now when None
+        :param progress_callback: Called with the current statistics after each page
+        :return: Statistics of the backfill, including the candles downloaded per second
+        '''
+
+        exchange = exchange_key(self._client)
+        tf_ms = TF_EQUIV[timeframe] * 1000
+        now = int(time.time() * 1000)
+
+        if end_time is None:
+            end_time = now
+
+        done = self._store.get_backfilled_ranges(exchange, contract.symbol, timeframe)
+        pages = self.pages(timeframe, start_time, end_time)
+
+        stats = {'pages': len(pages), 'skipped_pages': 0, 'downloaded_pages': 0, 'failed_pages': 0, 'candles': 0,
+                 'seconds': 0.0, 'candles_per_second': 0.0}
+        stats_lock = threading.Lock()
+        started_at = time.monotonic()
+
+        def download(page: typing.Tuple[int, int]):
+            if self._stop_event.is_set():
+                return
+
+            with self._client.background_requests(self._budget_share):
+                candles = self._client.get_historical_candles(contract, timeframe, start_time=page[0],
+                                                              end_time=page[1])
+            candles = [c for c in candles if page[0] <= c.timestamp <= page[1]]
+
+            if len(candles) > 0:
+                self._store.save_candles(exchange, contract.symbol, timeframe, candles)
+
+            # A page is complete once its last candle is closed, empty pages are retried by the next run
+            complete = len(candles) > 0 and page[1] + tf_ms <= now
+            if complete:
+                self._store.add_backfilled_range(exchange, contract.symbol, timeframe, page[0], page[1])
+
+            with stats_lock:
+                stats['candles'] += len(candles)
+                stats['downloaded_pages' if len(candles) > 0 else 'failed_pages'] += 1
+                stats['seconds'] = time.monotonic() - started_at
+                stats['candles_per_second'] = stats['candles'] / stats['seconds'] if stats['seconds'] > 0 else 0.0
+                snapshot = dict(stats)
+
+            if progress_callback is not None:
+                progress_callback(snapshot)
+
+        missing = [page for page in pages if not any(s <= page[0] and page[1] <= e for s, e in done)]
+        stats['skipped_pages'] = len(pages) - len(missing)
+
+        with ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix='backfill') as executor:
+            for future in [executor.submit(download, page) for page in missing]:
+                future.result()
+
+        stats['seconds'] = time.monotonic() - started_at
+        stats['candles_per_second'] = stats['candles'] / stats['seconds'] if stats['seconds'] > 0 else 0.0
+
+        logger.info("%s %s %s backfill: %s candles in %.1f seconds (%.0f candles/s), %s pages skipped, "
+                    "%s pages without data", exchange, contract.symbol, timeframe, stats['candles'], stats['seconds'],
+                    stats['candles_per_second'], stats['skipped_pages'], stats['failed_pages'])
+
+        return stats
@@ -0,0 +1,285 @@
+import typing
+
+import numpy as np
+
+from Trading.strategies import rsi_series, macd_series, technical_signal, breakout_signal
+
+
+class BacktestResult:
+    '''
+    Statistics of a backtest. The trades are kept as columns, the optimizer only reads the summary: the trade
+    dictionaries are built when the trades property is read.
+    '''
+
+    def __init__(self, trade_columns: typing.Dict[str, np.ndarray], equity: np.ndarray):
+        '''
+        :param trade_columns: entry_time, exit_time, side, entry_price, exit_price, return_pct and exit_reason arrays
+        :param equity: Equity after each trade, starting from 1
+        '''
+
+        self._trade_columns = trade_columns
+        self.equity = equity
+
+        returns = trade_columns['return_pct']
+
+        self.nb_trades = len(returns)
+        self.pnl_pct = float((equity[-1] - 1) * 100) if len(equity) > 0 else 0.0
+        self.win_rate = float((returns > 0).mean() * 100) if len(returns) > 0 else 0.0
+
+        if len(equity) > 0:
+            curve = np.concatenate(([1.0], equity))
+            peaks = np.maximum.accumulate(curve)
+            self.max_drawdown_pct = float(((peaks - curve) / peaks).max() * 100)
+        else:
+            self.max_drawdown_pct = 0.0
+
+    @property
+    def trades(self) -> typing.List[typing.Dict]:
+        names = list(self._trade_columns)
+        return [dict(zip(names, values)) for values in zip(*(c.tolist() for c in self._trade_columns.values()))]
+
+    def summary(self) -> typing.Dict[str, float]:
+        return {'trades': self.nb_trades, 'pnl_pct': self.pnl_pct, 'max_drawdown_pct': self.max_drawdown_pct,
+                'win_rate': self.win_rate}
+
+
+def candle_columns(candles) -> typing.Tuple[np.ndarray, ...]:
+    '''
+    Accepts a CandleBuffer / CandleView, or an array of rows (timestamp, open, high, low, close, volume)
+    like the Binance klines
+    :param candles:
+    :return: timestamps, opens, highs, lows, closes, volumes
+    '''
+
+    if hasattr(candles, 'closes'):
+        return candles.timestamps, candles.opens, candles.highs, candles.lows, candles.closes, candles.volumes
+
+    candles = np.asarray(candles, dtype=np.float64)
+
+    return (candles[:, 0].astype(np.int64), candles[:, 1], candles[:, 2], candles[:, 3], candles[:, 4],
+            candles[:, 5])
+
+
+def technical_entries(opens: np.ndarray, closes: np.ndarray, other_params: typing.Dict) -> typing.Tuple:
+    '''
+    The live TechnicalStrategy checks the indicators of the candle that just closed when a new candle starts,
+    the position is opened at the first price of the new candle.
+    :return: entry candle indexes, entry signals, entry prices
+    '''
+
+    rsi = rsi_series(closes, other_params['rsi_length'])
+    macd_line, macd_signal = macd_series(closes, other_params['ema_fast'], other_params['ema_slow'],
+                                         other_params['ema_signal'])
+
+    signals = technical_signal(rsi, macd_line, macd_signal)
+
+    indexes = np.flatnonzero(signals[:-1]) + 1
+
+    return indexes, signals[indexes - 1], opens[indexes]
+
+
+def breakout_entries(highs: np.ndarray, lows: np.ndarray, closes: np.ndarray, volumes: np.ndarray,
+                     other_params: typing.Dict) -> typing.Tuple:
+    '''
+    The live BreakoutStrategy compares the candle in progress to the previous candle, here each candle is only
+    compared once it is closed and the position is opened at its close price.
+    :return: entry candle indexes, entry signals, entry prices
+    '''
+
+    signals = np.zeros(len(closes), dtype=np.int64)
+    signals[1:] = breakout_signal(closes[1:], highs[:-1], lows[:-1], volumes[1:], other_params['min_volume'])
+
+    indexes = np.flatnonzero(signals)
+
+    return indexes, signals[indexes], closes[indexes]
+
+
+class _MaxTree:
+    '''
+    Binary tree of the price maxima stored as an array: node 1 is the whole series, the children of node i are the
+    nodes 2i and 2i + 1, the candles are the leaves. Used to find for many price levels at once the first candle
+    reaching each level.
+    '''
+
+    def __init__(self, prices: np.ndarray):
+        self._size = len(prices)
+        self._leaves = 1 << max(self._size - 1, 0).bit_length()
+
+        # The padding leaves never reach a level
+        self._maxima = np.full(2 * self._leaves, -np.inf)
+        self._maxima[self._leaves:self._leaves + self._size] = prices
+
+        width = self._leaves
+        while width > 1:
+            self._maxima[width // 2:width] = np.maximum(self._maxima[width:2 * width:2],
+                                                        self._maxima[width + 1:2 * width:2])
+            width //= 2
+
+        # Highest price from each candle to the end, the levels above it are never reached
+        self._suffix_maxima = np.maximum.accumulate(np.asarray(prices, dtype=np.float64)[::-1])[::-1]
+
+    def first_reached(self, starts: np.ndarray, levels: np.ndarray) -> np.ndarray:
+        '''
+        :param starts: First candle searched for each level
+        :param levels: Price levels, inf for a level never reached
+        :return: Index of the first candle from its start with a price >= level, the number of candles if none
+        '''
+
+        result = np.full(len(starts), self._size, dtype=np.int64)
+
+        query = np.flatnonzero(starts < self._size)
+        query = query[self._suffix_maxima[starts[query]] >= levels[query]]
+        node = starts[query].astype(np.int64) + self._leaves
+        level = levels[query]
+
+        found_query, found_node = [query[:0]], [node[:0]]
+
+        # Up: while the level is not reached, the next node on the right, through its largest ancestor starting
+        # at the same candle. The suffix maxima guarantee that a node is found.
+        while len(query) > 0:
+            reached = self._maxima[node] >= level
+
+            found_query.append(query[reached])
+            found_node.append(node[reached])
+
+            missed = ~reached
+            query, node, level = query[missed], node[missed] + 1, level[missed]
+            node //= node & -node
+
+        # Down: into the left child if it reaches the level, into the right child otherwise
+        query = np.concatenate(found_query)
+        node = np.concatenate(found_node)
+        level = levels[query]
+
+        while len(query) > 0:
+            leaf = node >= self._leaves
+            result[query[leaf]] = node[leaf] - self._leaves
+
+            inner = ~leaf
+            query, node, level = query[inner], node[inner] * 2, level[inner]
+            node += self._maxima[node] < level
+
+        return result
+
+
+def _first_exits(highs: np.ndarray, lows: np.ndarray, starts: np.ndarray, sides: np.ndarray,
+                 tp_prices: np.ndarray, sl_prices: np.ndarray) -> typing.Tuple[np.ndarray, np.ndarray]:
+    '''
+    First candle from each start where the take profit or the stop loss is reached, for all the entries at once
+    :param sides: 1 long, -1 short
+    :param tp_prices: inf / -inf when not used
+    :param sl_prices:
+    :return: take profit candle indexes, stop loss candle indexes, len(highs) when not reached
+    '''
+
+    longs = sides == 1
+
+    # Long take profit and short stop loss are reached by the highs, the others by the lows (searched as -lows)
+    up_hits = _MaxTree(highs).first_reached(starts, np.where(longs, tp_prices, sl_prices))
+    down_hits = _MaxTree(-lows).first_reached(starts, -np.where(longs, sl_prices, tp_prices))
+
+    return np.where(longs, up_hits, down_hits), np.where(longs, down_hits, up_hits)
+
+
+def _chain(next_entries: np.ndarray) -> np.ndarray:
+    '''
+    Entries opening a position: the first one, then the first entry after the exit of each position
+    :param next_entries: For each entry, index of the first entry after its exit (len(next_entries) if none)
+    :return: Indexes of the entries taken, in order
+    '''
+
+    n = len(next_entries)
+    if n == 0:
+        return np.empty(0, dtype=np.int64)
+
+    # The first 2 ** k entries of the chain, and the entry 2 ** k positions further in the chain of each entry
+    chain = np.zeros(1, dtype=np.int64)
+    jump = np.append(next_entries, n)
+
+    while True:
+        following = jump[chain]
+        following = following[following < n]
+        chain = np.concatenate((chain, following))
+
+        if len(following) < len(chain) - len(following):
+            return chain
+
+        jump = jump[jump]
+
+
+def run_backtest(strategy_type: str, candles, take_profit: typing.Optional[float], stop_loss: typing.Optional[float],
+                 other_params: typing.Dict, balance_pct: float = 100, allow_short: bool = True) -> BacktestResult:
+    '''
+    Backtest a strategy over a candle series. The signals of the whole series are computed at once with numpy,
+    then the first take profit / stop loss of every entry, with the same exit rules as the live strategies.
+    The positions are then chained from one exit to the next entry.
+    When a candle reaches both the take profit and the stop loss, the stop loss is assumed to come first.
+    :param strategy_type: Technical or Breakout
+    :param candles: see candle_columns()
+    :param take_profit: In percent, None to disable
+    :param stop_loss: In percent, None to disable
+    :param other_params: Parameters of the strategy, like in the StrategyEditor popup
+    :param balance_pct: Percentage of the equity used by each trade
+    :param allow_short: False for Binance Spot
+    :return:
+    '''
+
+    timestamps, opens, highs, lows, closes, volumes = candle_columns(candles)
+
+    if strategy_type == "Technical":
+        entry_indexes, entry_signals, entry_prices = technical_entries(opens, closes, other_params)
+        first_check_offset = 0  # The entry is at the open, the rest of the candle can reach an exit
+    elif strategy_type == "Breakout":
+        entry_indexes, entry_signals, entry_prices = breakout_entries(highs, lows, closes, volumes, other_params)
+        first_check_offset = 1
+    else:
+        raise ValueError(f"Unknown strategy type {strategy_type}")
+
+    if not allow_short:
+        longs = entry_signals == 1
+        entry_indexes, entry_signals, entry_prices = entry_indexes[longs], entry_signals[longs], entry_prices[longs]
+
+    position_pct = balance_pct / 100
+
+    entry_prices = entry_prices.astype(np.float64)
+    sides = np.asarray(entry_signals, dtype=np.int64)
+
+    # Same formulas as exit_prices(), for all the entries, an unused level is never reached
+    if take_profit is not None:
+        tp_prices = entry_prices * (1 + sides * take_profit / 100)
+    else:
+        tp_prices = np.where(sides == 1, np.inf, -np.inf)
+
+    if stop_loss is not None:
+        sl_prices = entry_prices * (1 - sides * stop_loss / 100)
+    else:
+        sl_prices = np.where(sides == 1, -np.inf, np.inf)
+
+    tp_hits, sl_hits = _first_exits(highs, lows, entry_indexes + first_check_offset, sides, tp_prices, sl_prices)
+    exit_indexes = np.minimum(tp_hits, sl_hits)
+
+    selected = _chain(np.searchsorted(entry_indexes, exit_indexes + 1))
+
+    sides = sides[selected]
+    entry_indexes = entry_indexes[selected]
+    entry_prices = entry_prices[selected]
+    exit_indexes = exit_indexes[selected]
+
+    # Still open at the end of the data: closed at the last price. The stop loss comes first on the same candle
+    at_end = exit_indexes == len(closes)
+    stopped = ~at_end & (sl_hits[selected] == exit_indexes)
+
+    fill_prices = np.where(stopped, sl_prices[selected], tp_prices[selected])
+    fill_prices[at_end] = closes[-1] if len(closes) > 0 else 0.0
+    exit_indexes[at_end] = len(closes) - 1
+
+    returns = sides * (fill_prices / entry_prices - 1) * 100
+    equity = np.cumprod(1 + position_pct * returns / 100)
+
+    trade_columns = {'entry_time': timestamps[entry_indexes].astype(np.int64),
+                     'exit_time': timestamps[exit_indexes].astype(np.int64),
+                     'side': np.where(sides == 1, "long", "short"),
+                     'entry_price': entry_prices, 'exit_price': fill_prices, 'return_pct': returns,
+                     'exit_reason': np.where(at_end, "end", np.where(stopped, "stop_loss", "take_profit"))}
+
+    return BacktestResult(trade_columns, equity)
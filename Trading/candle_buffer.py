@@ -0,0 +1,251 @@
+import typing
+
+import numpy as np
+
+from Trading.models import Candle
+
+# Number of candles kept per buffer, larger than the history returned by the exchanges (1000 on Binance)
+DEFAULT_CAPACITY = 2000
+
+OHLCV_FIELDS = ('open', 'high', 'low', 'close', 'volume')
+
+
+class CandleBuffer:
+    '''
+    Fixed capacity columnar candle store with ring buffer semantics.
+    Every candle is written twice, at position i and i + capacity, so the most recent candles are always
+    contiguous in memory and the column properties can return views instead of copies.
+    Once the buffer is full, appending a candle overwrites the oldest one: the memory used never grows.
+    '''
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        self.capacity = capacity
+
+        self._timestamps = np.zeros(2 * capacity, dtype=np.int64)
+        self._ohlcv = np.zeros((len(OHLCV_FIELDS), 2 * capacity), dtype=np.float64)
+
+        self._count = 0  # Total number of candles appended since the creation of the buffer
+        self._head = -1  # Position of the most recent candle in the first half of the arrays
+
+    @classmethod
+    def from_candles(cls, candles: typing.Iterable[Candle], capacity: int = DEFAULT_CAPACITY) -> "CandleBuffer":
+        buffer = cls(capacity)
+        buffer.extend(candles)
+        return buffer
+
+    def __len__(self) -> int:
+        return min(self._count, self.capacity)
+
+    def _window(self) -> slice:
+        end = self._head + self.capacity + 1
+        return slice(end - len(self), end)
+
+    def _column(self, row: int) -> np.ndarray:
+        view = self._ohlcv[row, self._window()]
+        view.flags.writeable = False
+        return view
+
+    @property
+    def timestamps(self) -> np.ndarray:
+        view = self._timestamps[self._window()]
+        view.flags.writeable = False
+        return view
+
+    @property
+    def opens(self) -> np.ndarray:
+        return self._column(0)
+
+    @property
+    def highs(self) -> np.ndarray:
+        return self._column(1)
+
+    @property
+    def lows(self) -> np.ndarray:
+        return self._column(2)
+
+    @property
+    def closes(self) -> np.ndarray:
+        return self._column(3)
+
+    @property
+    def volumes(self) -> np.ndarray:
+        return self._column(4)
+
+    @property
+    def last_timestamp(self) -> int:
+        return int(self._timestamps[self._head])
+
+    @property
+    def last_close(self) -> float:
+        return float(self._ohlcv[3, self._head])
+
+    def last_values(self) -> typing.Tuple[int, float, float, float, float, float]:
+        '''
+        :return: timestamp, open, high, low, close and volume of the candle in progress
+        '''
+
+        o, h, l, c, v = self._ohlcv[:, self._head].tolist()
+        return int(self._timestamps[self._head]), o, h, l, c, v
+
+    def _position(self, index: int) -> int:
+        size = len(self)
+
+        if index < 0:
+            index += size
+        if index < 0 or index >= size:
+            raise IndexError("candle index out of range")
+
+        return self._head + self.capacity + 1 - size + index
+
+    def __getitem__(self, index: int) -> Candle:
+        '''
+        Copy of one candle as a Candle object, candles[-1] is the candle in progress
+        :param index:
+        :return:
+        '''
+
+        pos = self._position(index)
+        o, h, l, c, v = self._ohlcv[:, pos].tolist()
+
+        return Candle({'ts': int(self._timestamps[pos]), 'open': o, 'high': h, 'low': l, 'close': c, 'volume': v},
+                      None, "parse_trade")
+
+    def __iter__(self) -> typing.Iterator[Candle]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def append(self, timestamp: int, open_price: float, high: float, low: float, close: float, volume: float):
+        '''
+        Add a new candle, overwriting the oldest one if the buffer is full
+        :return:
+        '''
+
+        self._head = (self._head + 1) % self.capacity
+        self._count += 1
+
+        for pos in (self._head, self._head + self.capacity):
+            self._timestamps[pos] = timestamp
+            self._ohlcv[0, pos] = open_price
+            self._ohlcv[1, pos] = high
+            self._ohlcv[2, pos] = low
+            self._ohlcv[3, pos] = close
+            self._ohlcv[4, pos] = volume
+
+    def append_candle(self, candle: Candle):
+        self.append(candle.timestamp, candle.open, candle.high, candle.low, candle.close, candle.volume)
+
+    def clear(self):
+        self._count = 0
+        self._head = -1
+
+    def extend(self, candles: typing.Iterable[Candle]):
+        for candle in candles:
+            self.append_candle(candle)
+
+    def extend_records(self, records: np.ndarray):
+        '''
+        Append the candles of a structured array with timestamp, open, high, low, close and volume fields
+        (database.candle_archive.RECORD), column by column instead of one candle at a time
+        :param records:
+        :return:
+        '''
+
+        records = records[-self.capacity:]
+        n = len(records)
+
+        if n == 0:
+            return
+
+        positions = (self._head + 1 + np.arange(n)) % self.capacity
+
+        for offset in (0, self.capacity):
+            self._timestamps[positions + offset] = records['timestamp']
+            for row, field in enumerate(OHLCV_FIELDS):
+                self._ohlcv[row, positions + offset] = records[field]
+
+        self._head = int(positions[-1])
+        self._count += n
+
+    def update_last(self, price: float, size: float):
+        '''
+        Update the candle in progress with a new trade
+        :param price: The trade price
+        :param size: The trade size
+        :return:
+        '''
+
+        high = max(self._ohlcv[1, self._head], price)
+        low = min(self._ohlcv[2, self._head], price)
+        volume = self._ohlcv[4, self._head] + size
+
+        for pos in (self._head, self._head + self.capacity):
+            self._ohlcv[1, pos] = high
+            self._ohlcv[2, pos] = low
+            self._ohlcv[3, pos] = price
+            self._ohlcv[4, pos] = volume
+
+    def set_last(self, high: float, low: float, close: float, volume: float):
+        '''
+        Overwrite the high, low, close and volume of the candle in progress
+        :return:
+        '''
+
+        for pos in (self._head, self._head + self.capacity):
+            self._ohlcv[1, pos] = high
+            self._ohlcv[2, pos] = low
+            self._ohlcv[3, pos] = close
+            self._ohlcv[4, pos] = volume
+
+    def read_only(self) -> "CandleView":
+        return CandleView(self)
+
+
+class CandleView:
+    '''
+    Read-only access to a CandleBuffer shared by several strategies: same indexing and column views,
+    without the methods that modify the candles.
+    '''
+
+    def __init__(self, buffer: CandleBuffer):
+        self._buffer = buffer
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    def __getitem__(self, index: int) -> Candle:
+        return self._buffer[index]
+
+    def __iter__(self) -> typing.Iterator[Candle]:
+        return iter(self._buffer)
+
+    @property
+    def timestamps(self) -> np.ndarray:
+        return self._buffer.timestamps
+
+    @property
+    def opens(self) -> np.ndarray:
+        return self._buffer.opens
+
+    @property
+    def highs(self) -> np.ndarray:
+        return self._buffer.highs
+
+    @property
+    def lows(self) -> np.ndarray:
+        return self._buffer.lows
+
+    @property
+    def closes(self) -> np.ndarray:
+        return self._buffer.closes
+
+    @property
+    def volumes(self) -> np.ndarray:
+        return self._buffer.volumes
+
+    @property
+    def last_timestamp(self) -> int:
+        return self._buffer.last_timestamp
+
+    @property
+    def last_close(self) -> float:
+        return self._buffer.last_close
@@ -0,0 +1,135 @@
+import collections
+import logging
+import threading
+import time
+import typing
+
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger()
+
+# Above this many pending tasks on one symbol a warning is logged, the strategies can't keep up with the market data
+QUEUE_WARNING_DEPTH = 1000
+
+
+class SymbolExecutor:
+    '''
+    Runs the strategy work off the websocket thread.
+    Every symbol has its own FIFO queue, drained by at most one worker of a bounded thread pool at a time, so
+    the messages of one symbol are processed in order while different symbols run in parallel.
+    '''
+
+    def __init__(self, max_workers: int = 4, name: str = 'strategies'):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+
+        # symbol -> deque of (enqueue time, function, args)
+        self._queues: typing.Dict[str, collections.deque] = dict()
+        self._running: typing.Set[str] = set()
+
+        self._last_lag: typing.Dict[str, float] = dict()
+        self._max_lag = 0.0
+        self._processed = 0
+        self._closed = False
+
+    def submit(self, symbol: str, func: typing.Callable, *args):
+        '''
+        Queue a task for a symbol. Called from the websocket thread, it never blocks on the strategies.
+        :param symbol:
+        :param func:
+        :param args:
+        :return:
+        '''
+
+        with self._lock:
+            if self._closed:
+                return
+
+            queue = self._queues.get(symbol)
+            if queue is None:
+                queue = self._queues[symbol] = collections.deque()
+
+            queue.append((time.monotonic(), func, args))
+
+            if len(queue) == QUEUE_WARNING_DEPTH:
+                logger.warning("%s tasks waiting for %s, strategies are lagging behind the market data",
+                               QUEUE_WARNING_DEPTH, symbol)
+
+            if symbol in self._running:
+                return
+
+            self._running.add(symbol)
+
+            # Under the lock: shutdown() can't close the pool between the _closed check and the submit
+            self._pool.submit(self._drain, symbol)
+
+    def _drain(self, symbol: str):
+        '''
+        Run the queued tasks of a symbol in order, until its queue is empty
+        :param symbol:
+        :return:
+        '''
+
+        queue = self._queues[symbol]
+        processed = 0
+
+        while True:
+            with self._lock:
+                # The task run by the previous iteration is counted with the next pop, the workers share the metrics
+                self._processed += processed
+
+                if len(queue) == 0:
+                    self._running.discard(symbol)
+                    if len(self._running) == 0:
+                        self._idle.notify_all()
+                    return
+                enqueued_at, func, args = queue.popleft()
+
+                lag = time.monotonic() - enqueued_at
+                self._last_lag[symbol] = lag
+                if lag > self._max_lag:
+                    self._max_lag = lag
+
+            try:
+                func(*args)
+            except Exception:
+                logger.exception("Error while running strategy task for %s", symbol)
+
+            processed = 1
+
+    def wait_idle(self, timeout: float = None) -> bool:
+        '''
+        Wait until all the queued tasks are run, used by the replay of recorded messages
+        :param timeout: In seconds
+        :return: False if tasks are still queued after the timeout
+        '''
+
+        with self._idle:
+            return self._idle.wait_for(lambda: len(self._running) == 0, timeout)
+
+    def metrics(self) -> typing.Dict:
+        '''
+        Backpressure metrics: queue depth and queue lag (seconds between enqueue and execution) per symbol
+        :return:
+        '''
+
+        now = time.monotonic()
+
+        with self._lock:
+            depth = {symbol: len(queue) for symbol, queue in self._queues.items()}
+            oldest = {symbol: now - queue[0][0] for symbol, queue in self._queues.items() if len(queue) > 0}
+            last_lag = dict(self._last_lag)
+            max_lag = self._max_lag
+            processed = self._processed
+
+        return {'queue_depth': depth, 'total_depth': sum(depth.values()), 'oldest_task_age': oldest,
+                'last_lag': last_lag, 'max_lag': max_lag, 'processed': processed}
+
+    def shutdown(self, wait: bool = False):
+        with self._lock:
+            self._closed = True
+            for queue in self._queues.values():
+                queue.clear()
+
+        self._pool.shutdown(wait=wait)
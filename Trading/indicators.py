@@ -0,0 +1,154 @@
+import math
+import typing
+
+import numpy as np
+
+
+class ExponentialMean:
+    '''
+    Exponentially weighted mean updated in constant time per value.
+    It reproduces the recursion used by pandas for .ewm(adjust=True).mean(), operation by operation, so the
+    values are identical to the ones of the pandas implementation and not only close to them.
+    '''
+
+    def __init__(self, com: float = None, span: float = None, min_periods: int = 0):
+        if span is not None:
+            com = (span - 1) / 2
+
+        alpha = 1. / (1. + com)
+        self._old_wt_factor = 1. - alpha
+        self._new_wt = 1.
+        self._min_periods = max(min_periods, 1)
+
+        self._weighted = math.nan
+        self._old_wt = 1.
+        self._nobs = 0
+        self._started = False
+
+    def update(self, value: float) -> float:
+        '''
+        Add a new observation
+        :param value:
+        :return: The mean including the new observation, NaN while there are less than min_periods observations
+        '''
+
+        is_observation = value == value
+
+        if not self._started:
+            self._started = True
+            self._weighted = value
+            self._nobs = int(is_observation)
+            self._old_wt = 1.
+
+        else:
+            self._nobs += is_observation
+
+            if self._weighted == self._weighted:
+                self._old_wt *= self._old_wt_factor
+                if is_observation:
+                    if self._weighted != value:  # Same check as pandas, avoids numerical errors on constant series
+                        self._weighted = (self._old_wt * self._weighted + self._new_wt * value) / \
+                                         (self._old_wt + self._new_wt)
+                    self._old_wt += self._new_wt
+
+            elif is_observation:
+                self._weighted = value
+
+        return self.value
+
+    @property
+    def value(self) -> float:
+        return self._weighted if self._nobs >= self._min_periods else math.nan
+
+
+class RelativeStrengthIndex:
+    '''
+    Incremental version of rsi_series(): Wilder's average gain and average loss as exponential means.
+    '''
+
+    def __init__(self, length: int):
+        self._avg_gain = ExponentialMean(com=length - 1, min_periods=length)
+        self._avg_loss = ExponentialMean(com=length - 1, min_periods=length)
+        self._previous_close = None
+        self.value = math.nan
+
+    def update(self, close: float) -> float:
+        if self._previous_close is None:
+            self._previous_close = close
+            return self.value
+
+        delta = close - self._previous_close
+        self._previous_close = close
+
+        avg_gain = np.float64(self._avg_gain.update(delta if delta > 0 else 0.))
+        avg_loss = np.float64(self._avg_loss.update(-delta if delta < 0 else 0.))
+
+        # numpy arithmetic to keep the same inf / NaN results as pandas when the average loss is 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rsi = 100 - 100 / (1 + avg_gain / avg_loss)
+
+        self.value = float(np.round(rsi, 2))
+
+        return self.value
+
+
+class MACD:
+    '''
+    Incremental version of macd_series(): fast EMA, slow EMA and the signal line of their difference.
+    '''
+
+    def __init__(self, ema_fast: int, ema_slow: int, ema_signal: int):
+        self._ema_fast = ExponentialMean(span=ema_fast)
+        self._ema_slow = ExponentialMean(span=ema_slow)
+        self._ema_signal = ExponentialMean(span=ema_signal)
+
+        self.macd_line = math.nan
+        self.macd_signal = math.nan
+
+    def update(self, close: float) -> typing.Tuple[float, float]:
+        self.macd_line = self._ema_fast.update(close) - self._ema_slow.update(close)
+        self.macd_signal = self._ema_signal.update(self.macd_line)
+
+        return self.macd_line, self.macd_signal
+
+
+class TechnicalIndicators:
+    '''
+    Indicators of the TechnicalStrategy, updated once per closed candle.
+    The first update() call seeds them with the closes of the historical candles, afterwards only the candles
+    closed since the previous call are processed.
+    '''
+
+    def __init__(self, ema_fast: int, ema_slow: int, ema_signal: int, rsi_length: int):
+        self._macd = MACD(ema_fast, ema_slow, ema_signal)
+        self._rsi = RelativeStrengthIndex(rsi_length)
+
+        self.last_timestamp = None  # Open time of the last candle added to the indicators
+
+    def add_close(self, timestamp: int, close: float):
+        self._macd.update(close)
+        self._rsi.update(close)
+        self.last_timestamp = timestamp
+
+    def update(self, timestamps: np.ndarray, closes: np.ndarray):
+        '''
+        Add the closed candles that were not processed yet
+        :param timestamps: Open times of the closed candles, in ascending order
+        :param closes: Close prices of the same candles
+        :return:
+        '''
+
+        start = 0
+        if self.last_timestamp is not None:
+            start = int(np.searchsorted(timestamps, self.last_timestamp, side='right'))
+
+        for timestamp, close in zip(timestamps[start:].tolist(), closes[start:].tolist()):
+            self.add_close(timestamp, close)
+
+    @property
+    def rsi(self) -> float:
+        return self._rsi.value
+
+    @property
+    def macd(self) -> typing.Tuple[float, float]:
+        return self._macd.macd_line, self._macd.macd_signal
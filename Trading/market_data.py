@@ -0,0 +1,442 @@
+import logging
+import threading
+import time
+import typing
+
+import numpy as np
+
+from database.candle_archive import CandleArchive, RECORD, candle_records
+from database.candles_database import CandlesDatabase, DEFAULT_HISTORY_LENGTH, exchange_key
+from Trading.backfill import HistoryBackfill
+from Trading.candle_buffer import CandleBuffer, CandleView
+from Trading.models import Candle, Contract
+from Trading.strategies import TF_EQUIV
+
+if typing.TYPE_CHECKING:
+    from connectors.bitmex import BitmexClient
+    from connectors.binance import BinanceClient
+    from Trading.strategies import Strategy
+
+logger = logging.getLogger()
+
+# Timeframe built from the trades, the higher timeframes are folded from its candles
+BASE_TIMEFRAME = "1m"
+
+# Longest run of missing candles accepted in the archived history (Bitmex skips the buckets without trades),
+# a longer hole means the bot was stopped: the warm-up history starts after it
+MAX_ARCHIVE_GAP = 10
+
+
+class CandleAggregator:
+    '''
+    Turns the trades of one symbol into candles, once for all the strategies running on that symbol.
+    The trades update the base timeframe candles, every higher timeframe candle in progress is then derived from
+    the current base candle and the base candles already closed in its period.
+    '''
+
+    def __init__(self, exchange: str, symbol: str, archive: CandleArchive = None, archive_key: str = None):
+        self.exchange = exchange
+        self.symbol = symbol
+
+        # The closed candles of the timeframes started from a history are appended to the archive
+        self._archive = archive
+        self._archive_key = archive_key
+        self._archived: typing.Set[str] = set()
+
+        self._base = CandleBuffer()
+        self._base_ms = TF_EQUIV[BASE_TIMEFRAME] * 1000
+
+        self._higher: typing.Dict[str, CandleBuffer] = dict()
+
+        # Volume of the higher timeframe candle in progress, without the volume of the base candle in progress
+        self._closed_volume: typing.Dict[str, float] = dict()
+        # Volume of the base candle in progress already counted in the historical higher timeframe candle
+        self._volume_offset: typing.Dict[str, float] = dict()
+
+        self._lock = threading.Lock()
+
+    def has_timeframe(self, timeframe: str) -> bool:
+        if timeframe == BASE_TIMEFRAME:
+            return len(self._base) > 0
+        return timeframe in self._higher
+
+    def view(self, timeframe: str) -> CandleView:
+        if timeframe == BASE_TIMEFRAME:
+            return self._base.read_only()
+        return self._higher[timeframe].read_only()
+
+    def add_timeframe(self, timeframe: str, candles: typing.Union[typing.List[Candle], np.ndarray]):
+        '''
+        Start building a timeframe, from the historical candles
+        :param timeframe:
+        :param candles: Candle objects or RECORD array
+        :return:
+        '''
+
+        with self._lock:
+            self._archived.add(timeframe)
+
+            if timeframe == BASE_TIMEFRAME:
+                # Keep the candles already built from the trades if they are more recent than the history
+                live_candles = list(self._base)
+                self._base.clear()
+                _fill(self._base, candles)
+                for candle in live_candles:
+                    if len(self._base) == 0 or candle.timestamp > self._base.last_timestamp:
+                        self._base.append_candle(candle)
+                return
+
+            buffer = CandleBuffer()
+            _fill(buffer, candles)
+
+            self._higher[timeframe] = buffer
+            self._closed_volume[timeframe] = buffer.last_values()[5] if len(buffer) > 0 else 0.0
+            self._volume_offset[timeframe] = 0.0
+
+            if len(self._base) > 0 and len(buffer) > 0 and self._base.last_timestamp >= buffer.last_timestamp:
+                self._volume_offset[timeframe] = self._base.last_values()[5]
+
+    def remove_timeframe(self, timeframe: str):
+        with self._lock:
+            self._archived.discard(timeframe)
+            self._higher.pop(timeframe, None)
+            self._closed_volume.pop(timeframe, None)
+            self._volume_offset.pop(timeframe, None)
+
+    def parse_trades(self, price: float, size: float, timestamp: int) -> typing.Dict[str, str]:
+        '''
+        Update the candles of every timeframe with a new trade
+        :param price: The trade price
+        :param size: The trade size
+        :param timestamp: Unix timestamp in milliseconds
+        :return: same_candle or new_candle for each timeframe
+        '''
+
+        with self._lock:
+            base_event = self._update_base(price, size, timestamp)
+
+            events = {BASE_TIMEFRAME: base_event}
+
+            ts, o, h, l, c, v = self._base.last_values()
+
+            for timeframe, buffer in self._higher.items():
+                events[timeframe] = self._fold(timeframe, buffer, base_event, ts, o, h, l, c, v)
+
+            closed = self._closed_candles(events)
+
+        # The files are written outside of the lock, once per closed candle
+        for timeframe, records in closed:
+            self._archive.append(self._archive_key, self.symbol, timeframe, records)
+
+        return events
+
+    def _closed_candles(self, events: typing.Dict[str, str]) -> typing.List[typing.Tuple[str, np.ndarray]]:
+        '''
+        Candles closed by the last trade and not archived yet, the candle in progress is always the last one
+        :param events:
+        :return: (timeframe, RECORD array)
+        '''
+
+        if self._archive is None:
+            return []
+
+        closed = []
+
+        for timeframe in self._archived:
+            if events.get(timeframe) != "new_candle":
+                continue
+
+            buffer = self._base if timeframe == BASE_TIMEFRAME else self._higher[timeframe]
+            timestamps = buffer.timestamps[:-1]
+
+            last_timestamp = self._archive.last_timestamp(self._archive_key, self.symbol, timeframe)
+            start = 0 if last_timestamp is None else int(np.searchsorted(timestamps, last_timestamp, side="right"))
+
+            if start == len(timestamps):
+                continue
+
+            records = np.empty(len(timestamps) - start, dtype=RECORD)
+            records["timestamp"] = timestamps[start:]
+            for field in RECORD.names[1:]:
+                records[field] = getattr(buffer, field + "s")[start:-1]
+
+            closed.append((timeframe, records))
+
+        return closed
+
+    def _update_base(self, price: float, size: float, timestamp: int) -> str:
+
+        if len(self._base) == 0:
+            self._base.append(timestamp - timestamp % self._base_ms, price, price, price, price, size)
+            return "new_candle"
+
+        last_timestamp = self._base.last_timestamp
+
+        # Same Candle
+        if timestamp < last_timestamp + self._base_ms:
+            self._base.update_last(price, size)
+            return "same_candle"
+
+        # Missing Candle(s)
+        missing_candles = int((timestamp - last_timestamp) / self._base_ms) - 1
+
+        if missing_candles > 0:
+            logger.info("%s missing %s candles for %s %s (%s %s)", self.exchange, missing_candles, self.symbol,
+                        BASE_TIMEFRAME, timestamp, last_timestamp)
+
+            last_close = self._base.last_close
+
+            for missing in range(missing_candles):
+                last_timestamp += self._base_ms
+                self._base.append(last_timestamp, last_close, last_close, last_close, last_close, 0)
+
+        # New Candle
+        self._base.append(last_timestamp + self._base_ms, price, price, price, price, size)
+
+        return "new_candle"
+
+    def _fold(self, timeframe: str, buffer: CandleBuffer, base_event: str, ts: int, o: float, h: float, l: float,
+              c: float, v: float) -> str:
+        '''
+        Derive the higher timeframe candle in progress from the base candle in progress
+        :return: same_candle or new_candle
+        '''
+
+        tf_ms = TF_EQUIV[timeframe] * 1000
+
+        if len(buffer) == 0:
+            buffer.append(ts - ts % tf_ms, o, h, l, c, v)
+            self._closed_volume[timeframe] = 0.0
+            self._volume_offset[timeframe] = 0.0
+            return "new_candle"
+
+        last_ts, _, last_high, last_low, _, last_volume = buffer.last_values()
+
+        if base_event == "new_candle":
+            # The previous base candle is closed, its volume is now final
+            self._closed_volume[timeframe] = last_volume
+            self._volume_offset[timeframe] = 0.0
+
+        if ts >= last_ts + tf_ms:
+            missing_candles = int((ts - last_ts) / tf_ms) - 1
+            last_close = buffer.last_close
+
+            for missing in range(missing_candles):
+                last_ts += tf_ms
+                buffer.append(last_ts, last_close, last_close, last_close, last_close, 0)
+
+            buffer.append(last_ts + tf_ms, o, h, l, c, v)
+            self._closed_volume[timeframe] = 0.0
+
+            return "new_candle"
+
+        buffer.set_last(max(last_high, h), min(last_low, l), c,
+                        self._closed_volume[timeframe] + v - self._volume_offset[timeframe])
+
+        return "same_candle"
+
+
+def _fill(buffer: CandleBuffer, candles: typing.Union[typing.List[Candle], np.ndarray]):
+    if isinstance(candles, np.ndarray):
+        buffer.extend_records(candles)
+    else:
+        buffer.extend(candles)
+
+
+class MarketDataHub:
+    '''
+    One CandleAggregator per symbol of an exchange client. Strategies subscribe to a (symbol, timeframe),
+    share the candles of that timeframe as a read-only view and receive new_candle / same_candle events.
+    The strategies warm up from the candle archive, only the candles closed since the last archived one are
+    downloaded. Without a recent archive the history comes from the local candles database.
+    '''
+
+    def __init__(self, client: typing.Union["BinanceClient", "BitmexClient"], store: CandlesDatabase = None,
+                 archive: CandleArchive = None):
+        self._client = client
+        self._store = store if store is not None else CandlesDatabase()
+        self._archive = archive if archive is not None else CandleArchive()
+
+        # Current time in seconds, the replay of recorded messages replaces it with the time of the recording
+        self.clock = time.time
+
+        self._aggregators: typing.Dict[str, CandleAggregator] = dict()
+
+        # symbol -> timeframe -> strategies, replaced (copy-on-write) on every change like the clients' symbol index
+        self._subscribers: typing.Dict[str, typing.Dict[str, typing.Tuple["Strategy", ...]]] = dict()
+
+        self._lock = threading.Lock()
+
+    def subscribe(self, strategy: "Strategy") -> bool:
+        '''
+        Attach a strategy to the candles of its symbol and timeframe, the history is downloaded only by the first
+        strategy of a (symbol, timeframe)
+        :param strategy:
+        :return: False if no historical data could be obtained
+        '''
+
+        symbol = strategy.contract.symbol
+
+        with self._lock:
+            aggregator = self._aggregators.get(symbol)
+            if aggregator is None:
+                aggregator = CandleAggregator(self._client.platform, symbol, self._archive,
+                                              exchange_key(self._client))
+
+            if not aggregator.has_timeframe(strategy.tf):
+                start = time.perf_counter()
+                records = self.warm_up_candles(strategy.contract, strategy.tf)
+                if len(records) == 0:
+                    return False
+                aggregator.add_timeframe(strategy.tf, records)
+
+                logger.info("%s %s %s: warm-up with %s candles in %.1f ms", self._client.platform, symbol,
+                            strategy.tf, len(records), (time.perf_counter() - start) * 1000)
+
+            self._aggregators[symbol] = aggregator
+
+            strategy.candles = aggregator.view(strategy.tf)
+
+            # Before the strategy is a subscriber: afterwards its state is only updated on the SymbolExecutor
+            strategy.warm_up()
+
+            subscribers = dict(self._subscribers.get(symbol, dict()))
+            subscribers[strategy.tf] = subscribers.get(strategy.tf, ()) + (strategy,)
+            self._subscribers[symbol] = subscribers
+
+        return True
+
+    def historical_candles(self, contract: Contract, timeframe: str) -> typing.List[Candle]:
+        '''
+        Historical candles of a contract, refreshed from the exchange since the last candle stored
+        :param contract:
+        :param timeframe:
+        :return:
+        '''
+
+        try:
+            return self._store.refresh(self._client, exchange_key(self._client), contract, timeframe)
+        except Exception as e:
+            logger.error("%s error while reading the stored %s %s candles: %s", self._client.platform,
+                         contract.symbol, timeframe, e)
+            return self._client.get_historical_candles(contract, timeframe)
+
+    def warm_up_candles(self, contract: Contract, timeframe: str,
+                        limit: int = DEFAULT_HISTORY_LENGTH) -> np.ndarray:
+        '''
+        History of a new strategy: the last candles of the archive are mapped, and only the candles more recent
+        are downloaded (usually just the candle in progress). The closed candles downloaded are archived.
+        :param contract:
+        :param timeframe:
+        :param limit: Number of candles returned
+        :return: RECORD array, the last candle is the candle in progress
+        '''
+
+        key = exchange_key(self._client)
+        symbol = contract.symbol
+        tf_ms = TF_EQUIV[timeframe] * 1000
+        now = int(self.clock() * 1000)
+
+        last_timestamp = self._archive.last_timestamp(key, symbol, timeframe)
+
+        if last_timestamp is None or (now - last_timestamp) / tf_ms > limit:
+            records = candle_records(self.historical_candles(contract, timeframe))
+            self._archive.append(key, symbol, timeframe, records[records["timestamp"] + tf_ms <= now])
+            return records
+
+        recent = []
+        start_time = last_timestamp + tf_ms
+
+        while start_time <= now:
+            candles = self._client.get_historical_candles(contract, timeframe, start_time=start_time)
+            candles = [c for c in candles if c.timestamp >= start_time]
+            if len(candles) == 0:
+                break
+
+            recent += candles
+            start_time = candles[-1].timestamp + tf_ms
+
+        if len(recent) > 0:
+            self._store.save_candles(key, symbol, timeframe, recent)
+
+        recent = candle_records(recent)
+        closed = recent[recent["timestamp"] + tf_ms <= now]
+        self._archive.append(key, symbol, timeframe, closed)
+
+        history = self._archive.tail(key, symbol, timeframe, limit - (len(recent) - len(closed)))
+
+        # Start after the last long hole, the candles before it are not contiguous with the recent ones
+        holes = np.flatnonzero(np.diff(history["timestamp"]) > MAX_ARCHIVE_GAP * tf_ms)
+        if len(holes) > 0:
+            history = history[holes[-1] + 1:]
+
+        return np.concatenate((history, recent[len(closed):]))
+
+    def backfill(self, contract: Contract, timeframe: str, start_time: int, end_time: int = None,
+                 max_workers: int = 4) -> typing.Dict:
+        '''
+        Download a long history into the candles database, see HistoryBackfill.run()
+        :param contract:
+        :param timeframe:
+        :param start_time: In milliseconds
+        :param end_time: In milliseconds, now when None
+        :param max_workers: Number of pages requested at the same time
+        :return:
+        '''
+
+        return HistoryBackfill(self._client, self._store, max_workers).run(contract, timeframe, start_time, end_time)
+
+    def stored_candles(self, contract: Contract, timeframe: str, start_time: int = None,
+                       end_time: int = None) -> typing.List[Candle]:
+        return self._store.get_candles(exchange_key(self._client), contract.symbol, timeframe,
+                                       start_time=start_time, end_time=end_time)
+
+    def unsubscribe(self, strategy: "Strategy"):
+        symbol = strategy.contract.symbol
+
+        with self._lock:
+            subscribers = dict(self._subscribers.get(symbol, dict()))
+
+            remaining = tuple(s for s in subscribers.get(strategy.tf, ()) if s is not strategy)
+            if remaining:
+                subscribers[strategy.tf] = remaining
+            else:
+                subscribers.pop(strategy.tf, None)
+                if strategy.tf != BASE_TIMEFRAME and symbol in self._aggregators:
+                    self._aggregators[symbol].remove_timeframe(strategy.tf)
+
+            if subscribers:
+                self._subscribers[symbol] = subscribers
+            else:
+                self._subscribers.pop(symbol, None)
+                self._aggregators.pop(symbol, None)
+
+    def on_trade(self, symbol: str, price: float, size: float, timestamp: int):
+        '''
+        Parse a trade once and dispatch the candle events to the strategies subscribed to the symbol
+        :param symbol:
+        :param price: The trade price
+        :param size: The trade size
+        :param timestamp: Unix timestamp in milliseconds
+        :return:
+        '''
+
+        aggregator = self._aggregators.get(symbol)
+        if aggregator is None:
+            return
+
+        timestamp_diff = int(self.clock() * 1000) - timestamp
+
+        if timestamp_diff >= 2000:
+            logger.warning("%s %s: %s milliseconds of difference between the current time and the trade time",
+                           aggregator.exchange, symbol, timestamp_diff)
+
+        events = aggregator.parse_trades(price, size, timestamp)
+
+        for timeframe, strategies in self._subscribers.get(symbol, dict()).items():
+            tick_type = events.get(timeframe)
+            if tick_type is None:
+                continue
+
+            for strat in strategies:
+                strat.on_candle_event(tick_type)
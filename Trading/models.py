@@ -1,12 +1,19 @@
-import dateutil.parser
-import datetime
+import typing
+
+from Trading.utils import iso_to_ms
 
 
 BITMEX_MULTIPLIER = 0.00000001  # Converts satoshi numbers to Bitcoin on Bitmex
 BITMEX_TF_MINUTES = {"1m": 1, "5m": 5, "1h": 60, "1d": 1440}
 
 
+# The models use __slots__: thousands of candles and contracts are kept in memory, without a __dict__ each
+# instance only holds its attributes. The attributes not set for an exchange stay missing, like before.
+
 class Balance:
+    __slots__ = ('initial_margin', 'maintenance_margin', 'margin_balance', 'wallet_balance', 'unrealized_pnl',
+                 'free', 'locked')
+
     def __init__(self, info, exchange):
         if exchange == "binance_futures":
             self.initial_margin = float(info['initialMargin'])
@@ -28,6 +35,8 @@ class Balance:
 
 
 class Candle:
+    __slots__ = ('timestamp', 'open', 'high', 'low', 'close', 'volume')
+
     def __init__(self, candle_info, timeframe, exchange):
         if exchange in ["binance_futures", "binance_spot"]:
             self.timestamp = candle_info[0]
@@ -38,9 +47,8 @@ class Candle:
             self.volume = float(candle_info[5])
 
         elif exchange == "bitmex":
-            self.timestamp = dateutil.parser.isoparse(candle_info['timestamp'])
-            self.timestamp = self.timestamp - datetime.timedelta(minutes=BITMEX_TF_MINUTES[timeframe])
-            self.timestamp = int(self.timestamp.timestamp() * 1000)
+            # Bitmex timestamps are the close time of the bucket
+            self.timestamp = iso_to_ms(candle_info['timestamp']) - BITMEX_TF_MINUTES[timeframe] * 60000
             self.open = candle_info['open']
             self.high = candle_info['high']
             self.low = candle_info['low']
@@ -55,6 +63,83 @@ class Candle:
             self.close = candle_info['close']
             self.volume = candle_info['volume']
 
+    @classmethod
+    def from_rows(cls, rows: typing.Iterable[typing.Sequence]) -> typing.List['Candle']:
+        '''
+        Build the candles of (timestamp, open, high, low, close, volume) rows in one pass, without the exchange
+        dispatch of __init__
+        :param rows:
+        :return:
+        '''
+
+        new = cls.__new__
+        candles = []
+
+        for ts, o, h, l, c, v in rows:
+            candle = new(cls)
+            candle.timestamp = ts
+            candle.open = o
+            candle.high = h
+            candle.low = l
+            candle.close = c
+            candle.volume = v
+            candles.append(candle)
+
+        return candles
+
+    @classmethod
+    def from_klines(cls, klines: typing.Iterable[typing.Sequence]) -> typing.List['Candle']:
+        '''
+        Build the candles of raw Binance klines, [open time, "open", "high", "low", "close", "volume", ...]
+        :param klines:
+        :return:
+        '''
+
+        new = cls.__new__
+        candles = []
+
+        for k in klines:
+            candle = new(cls)
+            candle.timestamp = k[0]
+            candle.open = float(k[1])
+            candle.high = float(k[2])
+            candle.low = float(k[3])
+            candle.close = float(k[4])
+            candle.volume = float(k[5])
+            candles.append(candle)
+
+        return candles
+
+    @classmethod
+    def from_buckets(cls, buckets: typing.Iterable[typing.Dict], timeframe: str) -> typing.List['Candle']:
+        '''
+        Build the candles of Bitmex trade buckets, the buckets missing prices are skipped
+        :param buckets:
+        :param timeframe:
+        :return:
+        '''
+
+        new = cls.__new__
+        candles = []
+
+        # Bitmex timestamps are the close time of the bucket
+        offset = BITMEX_TF_MINUTES[timeframe] * 60000
+
+        for b in buckets:
+            if b['open'] is None or b['close'] is None:  # Some candles returned by Bitmex miss data
+                continue
+
+            candle = new(cls)
+            candle.timestamp = iso_to_ms(b['timestamp']) - offset
+            candle.open = b['open']
+            candle.high = b['high']
+            candle.low = b['low']
+            candle.close = b['close']
+            candle.volume = b['volume']
+            candles.append(candle)
+
+        return candles
+
 
 def tick_to_decimals(tick_size: float) -> int:
     tick_size_str = "{0:.8f}".format(tick_size)
@@ -70,6 +155,9 @@ def tick_to_decimals(tick_size: float) -> int:
 
 
 class Contract:
+    __slots__ = ('symbol', 'base_asset', 'quote_asset', 'price_decimals', 'quantity_decimals', 'tick_size',
+                 'lot_size', 'min_ls', 'max_ls', 'minNotional', 'quanto', 'inverse', 'multiplier', 'exchange')
+
     def __init__(self, contract_info, exchange):
         if exchange == "binance_futures":
             self.symbol = str(contract_info['symbol'])
@@ -120,6 +208,8 @@ class Contract:
 
 
 class OrderStatus:
+    __slots__ = ('order_id', 'status', 'avg_price', 'executed_qty')
+
     def __init__(self, order_info, exchange):
         if exchange == "binance_futures":
             self.order_id = order_info['orderId']
@@ -139,6 +229,8 @@ class OrderStatus:
 
 
 class Trade:
+    __slots__ = ('time', 'contract', 'strategy', 'side', 'entry_price', 'status', 'pnl', 'quantity', 'entry_id',
+                 'exit_price', 'exit_time')
 
     def __init__(self, trade_info):
         self.time: int = trade_info['time']
@@ -150,3 +242,5 @@ class Trade:
         self.pnl: float = trade_info['pnl']
         self.quantity: str = trade_info['quantity']
         self.entry_id: str = trade_info['entry_id']
+        self.exit_price: typing.Optional[float] = trade_info.get('exit_price')
+        self.exit_time: typing.Optional[int] = trade_info.get('exit_time')
@@ -0,0 +1,153 @@
+import itertools
+import logging
+import random
+import typing
+
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from Trading.backtest import candle_columns, run_backtest
+
+logger = logging.getLogger()
+
+# Values searched when no grid is given, same parameters as the StrategyEditor popup plus the TP / SL
+DEFAULT_GRIDS = {
+    'Technical': {
+        'rsi_length': [7, 10, 14, 21],
+        'ema_fast': [5, 8, 12, 16],
+        'ema_slow': [21, 26, 34, 50],
+        'ema_signal': [5, 9, 12],
+        'take_profit': [0.5, 1.0, 2.0, 4.0],
+        'stop_loss': [0.25, 0.5, 1.0, 2.0],
+    },
+    'Breakout': {
+        'min_volume': [1, 10, 100, 1000],
+        'take_profit': [0.5, 1.0, 2.0, 4.0],
+        'stop_loss': [0.25, 0.5, 1.0, 2.0],
+    }
+}
+
+# Metrics where a lower value ranks first
+LOWER_IS_BETTER = {'max_drawdown_pct'}
+
+# Candles of the optimization, mapped from the shared memory block once per worker process
+_worker_candles = None
+_worker_memory = None
+
+
+def _attach_candles(name: str, shape: typing.Tuple[int, int]):
+    '''
+    Worker process initializer: map the candle array created by the parent process, without copying it
+    :param name: Name of the shared memory block
+    :param shape:
+    :return:
+    '''
+
+    global _worker_candles, _worker_memory
+
+    # The workers share the resource tracker of the parent process, which unlinks the block in optimize()
+    _worker_memory = shared_memory.SharedMemory(name=name)
+
+    _worker_candles = np.ndarray(shape, dtype=np.float64, buffer=_worker_memory.buf)
+
+
+def _evaluate(strategy_type: str, parameter_sets: typing.List[typing.Dict], balance_pct: float,
+              allow_short: bool) -> typing.List[typing.Tuple[typing.Dict, typing.Dict]]:
+    '''
+    Backtest a batch of parameter sets on the shared candles
+    :return: (parameters, backtest summary) for each set
+    '''
+
+    results = []
+
+    for params in parameter_sets:
+        other_params = {k: v for k, v in params.items() if k not in ('take_profit', 'stop_loss')}
+        result = run_backtest(strategy_type, _worker_candles, params.get('take_profit'), params.get('stop_loss'),
+                              other_params, balance_pct, allow_short)
+        results.append((params, result.summary()))
+
+    return results
+
+
+def parameter_sets(strategy_type: str, grid: typing.Dict[str, typing.List] = None, method: str = 'grid',
+                   n_samples: int = 100, seed: int = None) -> typing.List[typing.Dict]:
+    '''
+    Build the parameter sets to evaluate
+    :param strategy_type: Technical or Breakout
+    :param grid: parameter -> values, DEFAULT_GRIDS when None
+    :param method: grid (every combination) or random (n_samples combinations drawn from the grid)
+    :param n_samples:
+    :param seed:
+    :return:
+    '''
+
+    grid = grid if grid is not None else DEFAULT_GRIDS[strategy_type]
+    names = list(grid.keys())
+
+    if method == 'grid':
+        combinations = [dict(zip(names, values)) for values in itertools.product(*grid.values())]
+    elif method == 'random':
+        rng = random.Random(seed)
+        combinations = [{name: rng.choice(grid[name]) for name in names} for _ in range(n_samples)]
+    else:
+        raise ValueError(f"Unknown search method {method}")
+
+    # The MACD needs a fast EMA shorter than the slow one
+    return [c for c in combinations if c.get('ema_fast', 0) < c.get('ema_slow', 1)]
+
+
+def optimize(strategy_type: str, candles, grid: typing.Dict[str, typing.List] = None, method: str = 'grid',
+             n_samples: int = 100, metric: str = 'pnl_pct', max_workers: int = None, balance_pct: float = 100,
+             allow_short: bool = True, batch_size: int = 8, seed: int = None) -> typing.List[typing.Dict]:
+    '''
+    Search the strategy parameters over a process pool. The candles are copied once into a shared memory block
+    that every worker maps, only the parameter sets and the result summaries are pickled.
+    :param strategy_type: Technical or Breakout
+    :param candles: see Trading.backtest.candle_columns()
+    :param grid: see parameter_sets()
+    :param method: grid or random
+    :param n_samples: number of random parameter sets
+    :param metric: pnl_pct, win_rate, max_drawdown_pct or trades
+    :param max_workers: number of processes, all the CPU cores by default
+    :param balance_pct:
+    :param allow_short: False for Binance Spot
+    :param batch_size: parameter sets evaluated per task
+    :param seed:
+    :return: results sorted from the best to the worst, each one is {'params': ..., metric: ..., ...}
+    '''
+
+    columns = np.column_stack([np.asarray(c, dtype=np.float64) for c in candle_columns(candles)])
+
+    sets = parameter_sets(strategy_type, grid, method, n_samples, seed)
+    batches = [sets[i:i + batch_size] for i in range(0, len(sets), batch_size)]
+
+    memory = shared_memory.SharedMemory(create=True, size=max(columns.nbytes, 1))
+
+    try:
+        shared = np.ndarray(columns.shape, dtype=np.float64, buffer=memory.buf)
+        shared[:] = columns
+
+        results = []
+
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_attach_candles,
+                                 initargs=(memory.name, columns.shape)) as executor:
+            futures = [executor.submit(_evaluate, strategy_type, batch, balance_pct, allow_short) for batch in batches]
+
+            for future in futures:
+                for params, summary in future.result():
+                    results.append({'params': params, **summary})
+
+        del shared
+
+    finally:
+        memory.close()
+        memory.unlink()
+
+    results.sort(key=lambda r: r[metric], reverse=metric not in LOWER_IS_BETTER)
+
+    logger.info("%s optimization: %s parameter sets evaluated, best %s = %s", strategy_type, len(results), metric,
+                results[0][metric] if results else None)
+
+    return results
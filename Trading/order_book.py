@@ -0,0 +1,164 @@
+import bisect
+import threading
+import typing
+
+
+class BookSide:
+    '''
+    Price levels of one side of the book: a sorted array of keys for the best-N queries and a dict for the sizes.
+    The bids are stored with negative keys, so the best level of both sides is always the first key.
+    Finding a level is a binary search, adding or removing one shifts the array (a memmove, fast at book sizes).
+    '''
+
+    def __init__(self, descending: bool):
+        self._sign = -1 if descending else 1
+        self._keys: typing.List[float] = []
+        self._sizes: typing.Dict[float, float] = dict()
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def set(self, price: float, size: float):
+        '''
+        Set the size of a price level, a size of 0 removes the level
+        :param price:
+        :param size:
+        :return:
+        '''
+
+        key = self._sign * price
+
+        if size == 0:
+            if key in self._sizes:
+                del self._sizes[key]
+                del self._keys[bisect.bisect_left(self._keys, key)]
+            return
+
+        if key not in self._sizes:
+            bisect.insort(self._keys, key)
+
+        self._sizes[key] = size
+
+    def clear(self):
+        self._keys.clear()
+        self._sizes.clear()
+
+    def best(self) -> typing.Union[typing.Tuple[float, float], None]:
+        if len(self._keys) == 0:
+            return None
+        key = self._keys[0]
+        return self._sign * key, self._sizes[key]
+
+    def __iter__(self) -> typing.Iterator[typing.Tuple[float, float]]:
+        for k in self._keys:
+            yield self._sign * k, self._sizes[k]
+
+    def levels(self, depth: int = None) -> typing.List[typing.Tuple[float, float]]:
+        '''
+        :param depth: Number of levels, all of them when None
+        :return: (price, size) from the best price
+        '''
+
+        keys = self._keys if depth is None else self._keys[:depth]
+        return [(self._sign * k, self._sizes[k]) for k in keys]
+
+
+class OrderBook:
+    '''
+    Local copy of the order book of a symbol, kept up to date by the depth updates of the exchange.
+    The connector applies the updates on the websocket thread, the strategies read it from theirs.
+    '''
+
+    def __init__(self, symbol: str):
+        self.symbol = symbol
+
+        self.bids = BookSide(descending=True)
+        self.asks = BookSide(descending=False)
+
+        self.last_update_id = None  # Sequence number of the last update applied (Binance)
+        self.synced = False
+
+        self.lock = threading.Lock()
+
+    def apply_snapshot(self, bids: typing.Iterable, asks: typing.Iterable, last_update_id: int = None,
+                       synced: bool = True):
+        '''
+        Replace the book with a snapshot
+        :param bids: (price, size) pairs, strings or numbers
+        :param asks:
+        :param last_update_id:
+        :param synced: False if buffered updates still have to be applied
+        :return:
+        '''
+
+        with self.lock:
+            self.bids.clear()
+            self.asks.clear()
+
+            for price, size in bids:
+                self.bids.set(float(price), float(size))
+            for price, size in asks:
+                self.asks.set(float(price), float(size))
+
+            self.last_update_id = last_update_id
+            self.synced = synced
+
+    def update(self, bids: typing.Iterable, asks: typing.Iterable, last_update_id: int = None):
+        with self.lock:
+            for price, size in bids:
+                self.bids.set(float(price), float(size))
+            for price, size in asks:
+                self.asks.set(float(price), float(size))
+
+            if last_update_id is not None:
+                self.last_update_id = last_update_id
+
+    def best_bid(self) -> typing.Union[typing.Tuple[float, float], None]:
+        with self.lock:
+            return self.bids.best()
+
+    def best_ask(self) -> typing.Union[typing.Tuple[float, float], None]:
+        with self.lock:
+            return self.asks.best()
+
+    def top(self, depth: int = 10) -> typing.Tuple[typing.List[typing.Tuple[float, float]], ...]:
+        '''
+        :param depth:
+        :return: best bids and best asks, (price, size) from the best price
+        '''
+
+        with self.lock:
+            return self.bids.levels(depth), self.asks.levels(depth)
+
+    def estimate_fill(self, side: str, quantity: float) -> typing.Union[typing.Tuple[float, float], None]:
+        '''
+        Average price of a market order walking the book, and its slippage compared to the best price
+        :param side: buy (takes the asks) or sell (takes the bids)
+        :param quantity:
+        :return: (average price, slippage in percent), None if the book is not deep enough
+        '''
+
+        if quantity <= 0:
+            return None
+
+        remaining = quantity
+        cost = 0.0
+        best_price = None
+
+        with self.lock:
+            for price, size in (self.asks if side.lower() == "buy" else self.bids):
+                if best_price is None:
+                    best_price = price
+
+                filled = min(size, remaining)
+                cost += filled * price
+                remaining -= filled
+                if remaining <= 0:
+                    break
+
+        if best_price is None or remaining > 0:
+            return None
+
+        avg_price = cost / quantity
+
+        return avg_price, abs(avg_price - best_price) / best_price * 100
@@ -1,14 +1,14 @@
 import logging
-import threading
-import time
 
-from database.trades_database import TradesDatabase
+from database.trades_database import trades_writer
 from typing import *
-from threading import Timer
 
+import numpy as np
 import pandas as pd
 
 from Trading.models import *
+from Trading.candle_buffer import CandleBuffer
+from Trading.indicators import TechnicalIndicators
 
 if TYPE_CHECKING:  # Import the connector class names only for typing purpose (the classes aren't actually imported)
     from connectors.bitmex import BitmexClient
@@ -16,10 +16,119 @@ if TYPE_CHECKING:  # Import the connector class names only for typing purpose (t
 
 logger = logging.getLogger()
 
-# TF_EQUIV is used in parse_trades() to compare the last candle timestamp to the new trade timestamp
+# TF_EQUIV is used by the CandleAggregator to compare the last candle timestamp to the new trade timestamp
 TF_EQUIV = {"1m": 60, "5m": 300, "15m": 900, "30m": 1800, "1h": 3600, "4h": 14400}
 
 
+# The signal and exit rules below work on single values as well as on numpy arrays, so the live strategies and the
+# backtesting engine (Trading/backtest.py) share them
+
+def rsi_series(closes: np.ndarray, rsi_length: int) -> np.ndarray:
+
+    """
+    Compute the Relative Strength Index of every candle.
+    :param closes: Close prices
+    :param rsi_length:
+    :return: RSI values, aligned with the closes (NaN for the first one)
+    """
+
+    closes = pd.Series(closes, copy=False)
+
+    # Calculate the different between the value of one row and the value of the row before
+    delta = closes.diff().dropna()
+
+    up, down = delta.copy(), delta.copy()
+    up[up < 0] = 0
+    down[down > 0] = 0  # Keep only the negative change, others are set to 0
+
+    avg_gain = up.ewm(com=(rsi_length - 1), min_periods=rsi_length).mean()
+    avg_loss = down.abs().ewm(com=(rsi_length - 1), min_periods=rsi_length).mean()
+
+    rs = avg_gain / avg_loss  # Relative Strength
+
+    rsi = 100 - 100 / (1 + rs)
+    rsi = rsi.round(2)
+
+    return np.concatenate(([np.nan], rsi.to_numpy()))
+
+
+def macd_series(closes: np.ndarray, ema_fast: int, ema_slow: int, ema_signal: int) -> Tuple[np.ndarray, np.ndarray]:
+
+    """
+    Compute the MACD and its Signal line for every candle.
+    :param closes: Close prices
+    :return: The MACD line and the MACD Signal line, aligned with the closes
+    """
+
+    closes = pd.Series(closes, copy=False)
+
+    ema_fast = closes.ewm(span=ema_fast).mean()  # Exponential Moving Average method
+    ema_slow = closes.ewm(span=ema_slow).mean()
+
+    macd_line = ema_fast - ema_slow
+    macd_signal = macd_line.ewm(span=ema_signal).mean()
+
+    return macd_line.to_numpy(), macd_signal.to_numpy()
+
+
+def technical_signal(rsi, macd_line, macd_signal):
+
+    """
+    :return: 1 for a Long signal, -1 for a Short signal, 0 for no signal
+    """
+
+    return np.where((rsi < 30) & (macd_line > macd_signal), 1, np.where((rsi > 70) & (macd_line < macd_signal), -1, 0))
+
+
+def breakout_signal(close, previous_high, previous_low, volume, min_volume: float):
+
+    """
+    :return: 1 for a Long signal, -1 for a Short signal, 0 for no signal
+    """
+
+    enough_volume = volume > min_volume
+
+    return np.where((close > previous_high) & enough_volume, 1,
+                    np.where((close < previous_low) & enough_volume, -1, 0))
+
+
+def exit_prices(entry_price, side: str, take_profit: Optional[float], stop_loss: Optional[float]) -> Tuple:
+
+    """
+    Take profit and stop loss prices of a position, None when the level is not used.
+    :param entry_price:
+    :param side: long or short
+    :param take_profit: In percent
+    :param stop_loss: In percent
+    :return: take profit price, stop loss price
+    """
+
+    direction = 1 if side == "long" else -1
+
+    tp_price = entry_price * (1 + direction * take_profit / 100) if take_profit is not None else None
+    sl_price = entry_price * (1 - direction * stop_loss / 100) if stop_loss is not None else None
+
+    return tp_price, sl_price
+
+
+def exits_triggered(side: str, low_price, high_price, tp_price, sl_price) -> Tuple:
+
+    """
+    Whether the prices reached the take profit or the stop loss of a position. Live trading passes the last
+    price as both low_price and high_price, the backtest passes the candle lows and highs.
+    :return: take profit triggered, stop loss triggered
+    """
+
+    if side == "long":
+        tp_triggered = high_price >= tp_price if tp_price is not None else False
+        sl_triggered = low_price <= sl_price if sl_price is not None else False
+    else:
+        tp_triggered = low_price <= tp_price if tp_price is not None else False
+        sl_triggered = high_price >= sl_price if sl_price is not None else False
+
+    return tp_triggered, sl_triggered
+
+
 class Strategy:
     def __init__(self, client: Union["BitmexClient", "BinanceClient"], contract: Contract, exchange: str,
                  timeframe: str, balance_pct: float, take_profit: float, stop_loss: float, strat_name):
@@ -38,7 +147,7 @@ class Strategy:
 
         self.ongoing_position = False
 
-        self.candles: List[Candle] = []
+        self.candles = CandleBuffer()
         self.trades: List[Trade] = []
         self.logs = []
 
@@ -46,34 +155,15 @@ class Strategy:
         logger.info("%s", msg)
         self.logs.append({"log": msg, "displayed": False})
 
-    def parse_trades(self, price: float, size: float, timestamp: int) -> str:
+    def on_candle_event(self, tick_type: str):
 
         """
-        Parse new trades coming in from the websocket and update the Candle list based on the timestamp.
-        :param price: The trade price
-        :param size: The trade size
-        :param timestamp: Unix timestamp in milliseconds
+        Called by the MarketDataHub after each trade on the strategy symbol, once the shared candles are updated.
+        :param tick_type: same_candle or new_candle for the strategy timeframe
         :return:
         """
 
-        timestamp_diff = int(time.time() * 1000) - timestamp
-
-        if timestamp_diff >= 2000:
-            logger.warning("%s %s: %s milliseconds of difference between the current time and the trade time",
-                           self.exchange, self.contract.symbol, timestamp_diff)
-
-        last_candle = self.candles[-1]
-
-        # Same Candle
-        if timestamp < last_candle.timestamp + self.tf_equiv:
-
-            last_candle.close = price
-            last_candle.volume += size
-
-            if price > last_candle.high:
-                last_candle.high = price
-            elif price < last_candle.low:
-                last_candle.low = price
+        if tick_type == "same_candle":
 
             # Check Take profit / Stop loss
 
@@ -81,72 +171,34 @@ class Strategy:
                 if trade.status == "open" and trade.entry_price is not None:
                     self._check_tp_sl(trade)
 
-            return "same_candle"
+        self.check_trade(tick_type)
 
-        # Missing Candle(s)
-
-        elif timestamp >= last_candle.timestamp + 2 * self.tf_equiv:
-
-            missing_candles = int((timestamp - last_candle.timestamp) / self.tf_equiv) - 1
-
-            logger.info("%s missing %s candles for %s %s (%s %s)", self.exchange, missing_candles, self.contract.symbol,
-                        self.tf, timestamp, last_candle.timestamp)
-
-            for missing in range(missing_candles):
-                new_ts = last_candle.timestamp + self.tf_equiv
-                candle_info = {'ts': new_ts, 'open': last_candle.close, 'high': last_candle.close,
-                               'low': last_candle.close, 'close': last_candle.close, 'volume': 0}
-                new_candle = Candle(candle_info, self.tf, "parse_trade")
-
-                self.candles.append(new_candle)
-
-                last_candle = new_candle
-
-            new_ts = last_candle.timestamp + self.tf_equiv
-            candle_info = {'ts': new_ts, 'open': price, 'high': price, 'low': price, 'close': price, 'volume': size}
-            new_candle = Candle(candle_info, self.tf, "parse_trade")
-
-            self.candles.append(new_candle)
-
-            return "new_candle"
-
-        # New Candle
-
-        elif timestamp >= last_candle.timestamp + self.tf_equiv:
-            new_ts = last_candle.timestamp + self.tf_equiv
-            candle_info = {'ts': new_ts, 'open': price, 'high': price, 'low': price, 'close': price, 'volume': size}
-            new_candle = Candle(candle_info, self.tf, "parse_trade")
-
-            self.candles.append(new_candle)
-
-            logger.info("%s New candle for %s %s", self.exchange, self.contract.symbol, self.tf)
-
-            return "new_candle"
-
-    def _check_order_status(self, order_id):
+    def warm_up(self):
 
         """
-        Called regularly after an order has been placed, until it is filled.
-        :param order_id: The order id to check.
+        Called by the MarketDataHub once the historical candles are loaded, before the strategy receives the candle
+        events: nothing else uses the strategy yet.
         :return:
         """
 
-        order_status = self.client.get_order_status(self.contract, order_id)
+        pass
 
-        if order_status is not None:
+    def _on_order_update(self, order_status: OrderStatus):
 
-            logger.info("%s order status: %s", self.exchange, order_status.status)
+        """
+        Called by the client's OrderTracker every time the status of an entry order changes, until it is closed.
+        :param order_status: The new status of the order.
+        :return:
+        """
 
-            if order_status.status == "filled":
-                for trade in self.trades:
-                    if trade.entry_id == order_id:
-                        trade.entry_price = order_status.avg_price
-                        trade.quantity = order_status.executed_qty
-                        break
-                return
+        logger.info("%s order status: %s", self.exchange, order_status.status)
 
-        t = Timer(2.0, lambda: self._check_order_status(order_id))
-        t.start()
+        if order_status.status == "filled":
+            for trade in self.trades:
+                if trade.entry_id == order_status.order_id:
+                    trade.entry_price = order_status.avg_price
+                    trade.quantity = order_status.executed_qty
+                    break
 
     def _open_position(self, signal_result: int):
 
@@ -160,7 +212,7 @@ class Strategy:
         if self.client.platform == "binance_spot" and signal_result == -1:
             return
 
-        trade_size = self.client.get_trade_size(self.contract, self.candles[-1].close, self.balance_pct)
+        trade_size = self.client.get_trade_size(self.contract, self.candles.last_close, self.balance_pct)
         if trade_size is None:
             return
 
@@ -169,6 +221,12 @@ class Strategy:
 
         self._add_log(f"{position_side.capitalize()} signal on {self.contract.symbol} {self.tf}")
 
+        # Expected cost of the market order, when the local order book of the contract is maintained
+        estimate = self.client.estimate_slippage(self.contract, order_side, trade_size)
+        if estimate is not None:
+            logger.info("%s %s: expected average fill price %s, slippage %.3f%%", self.exchange,
+                        self.contract.symbol, estimate[0], estimate[1])
+
         order_status = self.client.place_order(self.contract, "MARKET", trade_size, order_side)
 
         if order_status is not None:
@@ -181,10 +239,9 @@ class Strategy:
             if order_status.status == "filled" or order_status.status == 'FILLED':
                 avg_fill_price = order_status.avg_price
             else:
-                t = Timer(2.0, lambda: self._check_order_status(order_status.order_id))
-                t.start()
+                self.client.order_tracker.track(self.contract, order_status.order_id, self._on_order_update)
 
-            new_trade = Trade({"time": int(time.time() * 1000), "entry_price": avg_fill_price,
+            new_trade = Trade({"time": int(self.client.market_data.clock() * 1000), "entry_price": avg_fill_price,
                                "contract": self.contract, "strategy": self.strat_name, "side": position_side,
                                "status": "open", "pnl": 0, "quantity": order_status.executed_qty, "entry_id": order_status.order_id})
             self.trades.append(new_trade)
@@ -200,26 +257,10 @@ class Strategy:
         :return:
         """
 
-        tp_triggered = False
-        sl_triggered = False
+        price = self.candles.last_close
 
-        price = self.candles[-1].close
-
-        if trade.side == "long":
-            if self.stop_loss is not None:
-                if price <= trade.entry_price * (1 - self.stop_loss / 100):
-                    sl_triggered = True
-            if self.take_profit is not None:
-                if price >= trade.entry_price * (1 + self.take_profit / 100):
-                    tp_triggered = True
-
-        elif trade.side == "short":
-            if self.stop_loss is not None:
-                if price >= trade.entry_price * (1 + self.stop_loss / 100):
-                    sl_triggered = True
-            if self.take_profit is not None:
-                if price <= trade.entry_price * (1 - self.take_profit / 100):
-                    tp_triggered = True
+        tp_price, sl_price = exit_prices(trade.entry_price, trade.side, self.take_profit, self.stop_loss)
+        tp_triggered, sl_triggered = exits_triggered(trade.side, price, price, tp_price, sl_price)
 
         if tp_triggered or sl_triggered:
 
@@ -230,7 +271,7 @@ class Strategy:
 
             if not self.client.futures:
                 # Make sure we don't sell more than what's in the available balance on Binance Spot
-                current_balances = self.client.get_balances()
+                current_balances = self.client.cached_balances()
                 if current_balances is not None:
                     if order_side == "SELL" and self.contract.base_asset in current_balances:
                         trade.quantity = min(current_balances[self.contract.base_asset].free, trade.quantity)
@@ -240,17 +281,18 @@ class Strategy:
             if order_status is not None:
                 self._add_log(f"Exit order on {self.contract.symbol} {self.tf} placed successfully")
                 trade.status = "closed"
+                trade.exit_time = int(self.client.market_data.clock() * 1000)
+
+                # The average price is only known once filled, the last price is the best estimate otherwise
+                if order_status.status == "filled" and order_status.avg_price:
+                    trade.exit_price = order_status.avg_price
+                else:
+                    trade.exit_price = price
                 self.ongoing_position = False
-                threading.Thread(target=self._add_trade_to_database, args=(trade,)).start()
+                trades_writer().add_trade(trade)
             else:
                 self._add_log(f"Order not placed due to quantity filtering on {self.exchange}")
 
-    @staticmethod
-    def _add_trade_to_database(trade):
-        db = TradesDatabase()
-        db.add_new_trade(trade)
-        db.close()
-
 
 class TechnicalStrategy(Strategy):
     def __init__(self, client, contract: Contract, exchange: str, timeframe: str, balance_pct: float, take_profit: float,
@@ -263,56 +305,26 @@ class TechnicalStrategy(Strategy):
 
         self._rsi_length = other_params['rsi_length']
 
-    def _rsi(self) -> float:
+        self._indicators = TechnicalIndicators(self._ema_fast, self._ema_slow, self._ema_signal, self._rsi_length)
+
+    def _update_indicators(self):
 
         """
-        Compute the Relative Strength Index.
-        :return: The RSI value of the previous candlestick
+        Feed the candles closed since the last signal check to the incremental indicators. The first call seeds them
+        with the historical candles. The last candle of the buffer is still in progress and is left out.
+        :return:
         """
 
-        close_list = []
-        for candle in self.candles:
-            close_list.append(candle.close)
-
-        closes = pd.Series(close_list)
-
-        # Calculate the different between the value of one row and the value of the row before
-        delta = closes.diff().dropna()
-
-        up, down = delta.copy(), delta.copy()
-        up[up < 0] = 0
-        down[down > 0] = 0  # Keep only the negative change, others are set to 0
-
-        avg_gain = up.ewm(com=(self._rsi_length - 1), min_periods=self._rsi_length).mean()
-        avg_loss = down.abs().ewm(com=(self._rsi_length - 1), min_periods=self._rsi_length).mean()
-
-        rs = avg_gain / avg_loss  # Relative Strength
+        self._indicators.update(self.candles.timestamps[:-1], self.candles.closes[:-1])
 
-        rsi = 100 - 100 / (1 + rs)
-        rsi = rsi.round(2)
-
-        return rsi.iloc[-2]
-
-    def _macd(self) -> Tuple[float, float]:
+    def warm_up(self):
 
         """
-        Compute the MACD and its Signal line.
-        :return: The MACD and the MACD Signal value of the previous candlestick
+        Seed the indicators with the historical candles, before the worker threads update them.
+        :return:
         """
 
-        close_list = []
-        for candle in self.candles:
-            close_list.append(candle.close)  # Use only the close price of each candlestick for the calculations
-
-        closes = pd.Series(close_list)  # Converts the close prices list to a pandas Series.
-
-        ema_fast = closes.ewm(span=self._ema_fast).mean()  # Exponential Moving Average method
-        ema_slow = closes.ewm(span=self._ema_slow).mean()
-
-        macd_line = ema_fast - ema_slow
-        macd_signal = macd_line.ewm(span=self._ema_signal).mean()
-
-        return macd_line.iloc[-2], macd_signal.iloc[-2]
+        self._update_indicators()
 
     def _check_signal(self) -> int:
 
@@ -322,15 +334,12 @@ class TechnicalStrategy(Strategy):
         :return: 1 for a Long signal, -1 for a Short signal, 0 for no signal
         """
 
-        macd_line, macd_signal = self._macd()
-        rsi = self._rsi()
+        self._update_indicators()
 
-        if rsi < 30 and macd_line > macd_signal:
-            return 1
-        elif rsi > 70 and macd_line < macd_signal:
-            return -1
-        else:
-            return 0
+        macd_line, macd_signal = self._indicators.macd
+        rsi = self._indicators.rsi
+
+        return int(technical_signal(rsi, macd_line, macd_signal))
 
     def check_trade(self, tick_type: str):
 
@@ -362,12 +371,8 @@ class BreakoutStrategy(Strategy):
         :return: 1 for a Long signal, -1 for a Short signal, 0 for no signal
         """
 
-        if self.candles[-1].close > self.candles[-2].high and self.candles[-1].volume > self._min_volume:
-            return 1
-        elif self.candles[-1].close < self.candles[-2].low and self.candles[-1].volume > self._min_volume:
-            return -1
-        else:
-            return 0
+        return int(breakout_signal(self.candles.closes[-1], self.candles.highs[-2], self.candles.lows[-2],
+                                   self.candles.volumes[-1], self._min_volume))
 
     def check_trade(self, tick_type: str):
 
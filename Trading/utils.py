@@ -1,3 +1,12 @@
+import calendar
+
+import dateutil.parser
+
+# Epoch milliseconds of the recent 'YYYY-MM-DDTHH:MM:SS' prefixes, the messages of the same second share one
+_SECOND_PREFIXES = dict()
+_MAX_CACHED_PREFIXES = 4096
+
+
 def check_integer_format(text: str):
     if text == '':
         return True
@@ -30,3 +39,45 @@ def check_float_format(text: str):
 
 def calculate_trade_value(asset_quantity: float, lot_size: float) -> float:
     return float(asset_quantity * lot_size)
+
+
+def iso_to_ms(timestamp: str) -> int:
+    '''
+    Convert an ISO-8601 UTC timestamp as sent by Bitmex ('2021-03-04T05:06:07.890Z') to epoch milliseconds.
+    The date and time are read at fixed positions and the seconds prefix is cached, the other formats
+    (time zone offsets...) go through dateutil.
+    :param timestamp:
+    :return:
+    '''
+
+    if len(timestamp) < 20 or timestamp[-1] != 'Z' or timestamp[10] != 'T':
+        return _iso_to_ms_slow(timestamp)
+
+    prefix = timestamp[:19]
+    seconds_ms = _SECOND_PREFIXES.get(prefix)
+
+    if seconds_ms is None:
+        try:
+            seconds_ms = calendar.timegm((int(prefix[0:4]), int(prefix[5:7]), int(prefix[8:10]),
+                                          int(prefix[11:13]), int(prefix[14:16]), int(prefix[17:19]))) * 1000
+        except ValueError:
+            return _iso_to_ms_slow(timestamp)
+
+        if len(_SECOND_PREFIXES) >= _MAX_CACHED_PREFIXES:
+            _SECOND_PREFIXES.clear()
+        _SECOND_PREFIXES[prefix] = seconds_ms
+
+    if len(timestamp) == 20:  # No fraction: 2021-03-04T05:06:07Z
+        return seconds_ms
+
+    if timestamp[19] != '.' or not timestamp[20:-1].isdigit():
+        return _iso_to_ms_slow(timestamp)
+
+    # Milliseconds, truncated like the exchange does for longer fractions
+    return seconds_ms + int((timestamp[20:-1] + '00')[:3])
+
+
+def _iso_to_ms_slow(timestamp: str) -> int:
+    dt = dateutil.parser.isoparse(timestamp)
+    seconds = calendar.timegm(dt.utctimetuple())
+    return seconds * 1000 + dt.microsecond // 1000
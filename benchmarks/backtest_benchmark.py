@@ -0,0 +1,29 @@
+# Duration of one backtest over a year of 1m candles, from a few trades up to a trade-heavy case where a position
+# is opened on most candles. Run from the repository root: python -m benchmarks.backtest_benchmark
+import time
+
+from benchmarks.optimizer_benchmark import synthetic_candles
+from Trading.backtest import run_backtest
+
+CANDLES_PER_YEAR = 365 * 24 * 60
+
+CASES = [("Breakout", 0.1, 0.05, {'min_volume': 0}),
+         ("Breakout", 1, 0.5, {'min_volume': 0}),
+         ("Breakout", None, 0.5, {'min_volume': 5}),
+         ("Technical", 0.2, 0.2, {'rsi_length': 14, 'ema_fast': 12, 'ema_slow': 26, 'ema_signal': 9})]
+
+
+def main():
+    candles = synthetic_candles(CANDLES_PER_YEAR)
+
+    for strategy_type, take_profit, stop_loss, other_params in CASES:
+        start = time.perf_counter()
+        result = run_backtest(strategy_type, candles, take_profit, stop_loss, other_params)
+        elapsed = time.perf_counter() - start
+
+        print(f"{strategy_type:<9} TP {str(take_profit):<4} SL {str(stop_loss):<4}: {result.nb_trades:>7} trades "
+              f"in {elapsed:.3f} s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+# Strategy warm-up time from the candle archive (database/candle_archive.py) for growing archive sizes: mapping the
+# last 1000 candles and loading them in a CandleBuffer, against parsing a 1000 klines JSON response as before.
+# The warm-up from the archive should stay constant whatever the number of candles archived.
+# Run from the repository root: python -m benchmarks.candle_archive_benchmark
+import json
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.models_memory_benchmark import synthetic_klines
+from database.candle_archive import CandleArchive, RECORD
+from Trading.candle_buffer import CandleBuffer
+from Trading.models import Candle
+
+HISTORY = 1000
+ARCHIVE_SIZES = (10000, 100000, 1000000, 5000000)
+
+
+def best_time(function, repeat: int = 50) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def synthetic_records(start: int, n: int) -> np.ndarray:
+    records = np.empty(n, dtype=RECORD)
+    records["timestamp"] = 1600000000000 + np.arange(start, start + n, dtype=np.int64) * 60000
+    for field in RECORD.names[1:]:
+        records[field] = np.random.default_rng(start).random(n) * 100
+    return records
+
+
+def main():
+    payload = json.dumps(synthetic_klines(HISTORY))
+
+    def from_json():
+        CandleBuffer().extend(Candle.from_klines(json.loads(payload)))
+
+    print(f"{HISTORY} klines parsed from JSON: {best_time(from_json) * 1000:8.2f} ms")
+
+    root = tempfile.mkdtemp()
+    archive = CandleArchive(root)
+    archived = 0
+
+    try:
+        for size in ARCHIVE_SIZES:
+            while archived < size:
+                n = min(1000000, size - archived)
+                archive.append("binance_spot", "BTCUSDT", "1m", synthetic_records(archived, n))
+                archived += n
+
+            def from_archive():
+                CandleBuffer().extend_records(archive.tail("binance_spot", "BTCUSDT", "1m", HISTORY))
+
+            buffer = CandleBuffer()
+            buffer.extend_records(archive.tail("binance_spot", "BTCUSDT", "1m", HISTORY))
+            assert len(buffer) == HISTORY and buffer.last_timestamp == 1600000000000 + (size - 1) * 60000
+
+            print(f"{HISTORY} candles mapped from a {size:>9} candles archive: {best_time(from_archive) * 1000:8.2f} ms")
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
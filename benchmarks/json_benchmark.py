@@ -0,0 +1,123 @@
+# Websocket message decoding throughput: json, orjson and msgspec when installed, and the typed decoders of
+# connectors/decoding.py against json.loads followed by the field lookups, in messages per second.
+# Run from the repository root: python -m benchmarks.json_benchmark [corpus.txt]
+# A recorded corpus has one raw message per line, a synthetic corpus is generated without it.
+import json
+import random
+import sys
+import time
+
+from connectors import decoding
+
+
+def synthetic_corpus(n: int, seed: int = 0):
+    rng = random.Random(seed)
+    messages = []
+
+    for i in range(n):
+        price = 30000 + rng.random() * 100
+        kind = i % 5
+
+        if kind == 0:
+            messages.append(json.dumps({"stream": "btcusdt@bookTicker", "data": {
+                "e": "bookTicker", "u": 400900217 + i, "s": "BTCUSDT", "b": f"{price:.2f}", "B": "31.21000000",
+                "a": f"{price + 0.01:.2f}", "A": "40.66000000", "T": 1568014460891, "E": 1568014460893}},
+                separators=(',', ':')))
+        elif kind == 1:
+            messages.append(json.dumps({"stream": "btcusdt@aggTrade", "data": {
+                "e": "aggTrade", "E": 123456789, "s": "BTCUSDT", "a": 5933014 + i, "p": f"{price:.2f}",
+                "q": "0.012", "f": 100, "l": 105, "T": 1568014460891 + i, "m": True}}, separators=(',', ':')))
+        elif kind == 2:
+            messages.append(json.dumps({"stream": "btcusdt@depth@100ms", "data": {
+                "e": "depthUpdate", "E": 123456789, "s": "BTCUSDT", "U": 157 + i, "u": 160 + i,
+                "b": [[f"{price - k:.2f}", "0.5"] for k in range(10)],
+                "a": [[f"{price + k:.2f}", "0.5"] for k in range(10)]}}, separators=(',', ':')))
+        elif kind == 3:
+            messages.append(json.dumps({"table": "trade", "action": "insert", "data": [
+                {"timestamp": "2021-05-19T13:00:00.123Z", "symbol": "XBTUSD", "side": "Buy", "size": 100 * (k + 1),
+                 "price": price, "tickDirection": "PlusTick", "trdMatchID": "00000000-006d-1000-0000-000000000000",
+                 "grossValue": 286000, "homeNotional": 0.00286, "foreignNotional": 100} for k in range(3)]},
+                separators=(',', ':')))
+        else:
+            messages.append(json.dumps({"table": "quote", "action": "insert", "data": [
+                {"timestamp": "2021-05-19T13:00:00.123Z", "symbol": "XBTUSD", "bidSize": 1000, "bidPrice": price,
+                 "askPrice": price + 0.5, "askSize": 2000}]}, separators=(',', ':')))
+
+    return messages
+
+
+def typed_decode(msg: str):
+    channel = decoding.binance_stream_channel(msg)
+    if channel == 'bookTicker':
+        return decoding.decode_binance_book_ticker(msg)
+    if channel == 'aggTrade':
+        return decoding.decode_binance_agg_trade(msg)
+
+    table = decoding.bitmex_table(msg)
+    if table in ('instrument', 'quote'):
+        return decoding.decode_bitmex_quotes(msg)
+    if table == 'trade':
+        return decoding.decode_bitmex_trades(msg)
+
+    return decoding.loads(msg)
+
+
+def stdlib_decode(msg: str):
+    # What the connectors did before: a full decode, then the field lookups
+    data = json.loads(msg)
+
+    if 'stream' in data:
+        d = data['data']
+        if d['e'] == 'bookTicker':
+            return d['s'], float(d['b']), float(d['a'])
+        if d['e'] == 'aggTrade':
+            return d['s'], float(d['p']), float(d['q']), d['T']
+        return data
+
+    if data.get('table') in ('instrument', 'quote'):
+        return [(d['symbol'], d.get('bidPrice'), d.get('askPrice')) for d in data['data']]
+    if data.get('table') == 'trade':
+        return [(d['symbol'], float(d['price']), float(d['size']), d['timestamp']) for d in data['data']]
+
+    return data
+
+
+def rate(decode, messages) -> float:
+    start = time.perf_counter()
+    for msg in messages:
+        decode(msg)
+    return len(messages) / (time.perf_counter() - start)
+
+
+def main():
+    if len(sys.argv) > 1:
+        with open(sys.argv[1]) as f:
+            messages = [line.rstrip('\n') for line in f if line.strip()]
+    else:
+        messages = synthetic_corpus(200000)
+
+    print(f"{len(messages)} messages, {sum(len(m) for m in messages) / 1e6:.1f} MB, "
+          f"decoding backend: {decoding.BACKEND}, msgspec typed decoders: {decoding.msgspec is not None}")
+
+    for msg in messages[:1000]:
+        assert typed_decode(msg) == stdlib_decode(msg), msg
+
+    baseline = rate(json.loads, messages)
+    print(f"{'json.loads':<30}{baseline:12.0f} msgs/s")
+
+    if decoding.orjson is not None:
+        r = rate(decoding.orjson.loads, messages)
+        print(f"{'orjson.loads':<30}{r:12.0f} msgs/s (x{r / baseline:.2f})")
+
+    if decoding.msgspec is not None:
+        r = rate(decoding.msgspec.json.decode, messages)
+        print(f"{'msgspec.json.decode':<30}{r:12.0f} msgs/s (x{r / baseline:.2f})")
+
+    baseline = rate(stdlib_decode, messages)
+    r = rate(typed_decode, messages)
+    print(f"{'json.loads + field lookups':<30}{baseline:12.0f} msgs/s")
+    print(f"{'typed decoders':<30}{r:12.0f} msgs/s (x{r / baseline:.2f})")
+
+
+if __name__ == '__main__':
+    main()
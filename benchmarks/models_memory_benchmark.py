@@ -0,0 +1,85 @@
+# Memory of the models of Trading/models.py, in bytes per candle and per contract, with __slots__ (current) and
+# with a __dict__ per instance (the models before), plus the Candle build time.
+# Both layouts are filled with the same attribute values, so only the memory of the instances is compared.
+# Run from the repository root: python -m benchmarks.models_memory_benchmark
+import gc
+import random
+import time
+import tracemalloc
+
+from Trading.models import Candle, Contract
+
+
+class _DictModel:
+    # Same attributes in a __dict__, the layout of the models before __slots__
+    pass
+
+
+def copy_model(obj, cls):
+    new = cls.__new__(cls)
+    for name in type(obj).__slots__:
+        if hasattr(obj, name):
+            setattr(new, name, getattr(obj, name))
+    return new
+
+
+def synthetic_klines(n: int, seed: int = 0):
+    rng = random.Random(seed)
+    return [[1600000000000 + i * 60000, f"{30000 + rng.random() * 100:.2f}", f"{30100 + rng.random():.2f}",
+             f"{29900 + rng.random():.2f}", f"{30000 + rng.random() * 100:.2f}", f"{rng.random() * 10:.6f}",
+             1600000000000 + i * 60000 + 59999, "1.0", 100, "0.5", "0.5", "0"] for i in range(n)]
+
+
+def synthetic_spot_symbols(n: int):
+    return [{'symbol': f"SYM{i}USDT", 'baseAsset': f"SYM{i}", 'quoteAsset': "USDT",
+             'filters': [{'filterType': 'PRICE_FILTER', 'tickSize': '0.00010000'},
+                         {'filterType': 'LOT_SIZE', 'stepSize': '0.01000000', 'minQty': '0.01000000',
+                          'maxQty': '90000.00000000'},
+                         {'filterType': 'MIN_NOTIONAL', 'minNotional': '10.00000000'}]} for i in range(n)]
+
+
+def allocated_per_object(build, n: int) -> float:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    assert len(objects) == n
+    return (after - before) / n
+
+
+def main():
+    n_candles = 100000
+    klines = synthetic_klines(n_candles)
+    candles = Candle.from_klines(klines)
+
+    slots = allocated_per_object(lambda: [copy_model(c, Candle) for c in candles], n_candles)
+    legacy = allocated_per_object(lambda: [copy_model(c, _DictModel) for c in candles], n_candles)
+    print(f"Candle:   {legacy:7.1f} bytes with __dict__, {slots:7.1f} bytes with __slots__ "
+          f"({(1 - slots / legacy) * 100:.0f}% less)")
+
+    n_contracts = 2500
+    symbols = synthetic_spot_symbols(n_contracts)
+    contracts = [Contract(s, "binance_spot") for s in symbols]
+
+    slots = allocated_per_object(lambda: [copy_model(c, Contract) for c in contracts], n_contracts)
+    legacy = allocated_per_object(lambda: [copy_model(c, _DictModel) for c in contracts], n_contracts)
+    print(f"Contract: {legacy:7.1f} bytes with __dict__, {slots:7.1f} bytes with __slots__ "
+          f"({(1 - slots / legacy) * 100:.0f}% less)")
+
+    start = time.perf_counter()
+    [Candle(k, "1m", "binance_spot") for k in klines]
+    one_by_one = time.perf_counter() - start
+
+    start = time.perf_counter()
+    Candle.from_klines(klines)
+    bulk = time.perf_counter() - start
+
+    print(f"{n_candles} klines: {one_by_one * 1000:.0f} ms with Candle(), {bulk * 1000:.0f} ms with "
+          f"Candle.from_klines()")
+
+
+if __name__ == '__main__':
+    main()
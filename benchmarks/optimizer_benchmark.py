@@ -0,0 +1,44 @@
+# Parameter-sweep throughput of Trading/optimizer.py, in backtests per second, for 1 worker up to all the cores.
+# Run from the repository root: python -m benchmarks.optimizer_benchmark
+import os
+import time
+
+import numpy as np
+
+from Trading.optimizer import optimize, parameter_sets
+
+
+def synthetic_candles(n: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+
+    closes = 100 * np.exp(np.cumsum(rng.normal(0, 0.001, n)))
+    opens = np.concatenate(([closes[0]], closes[:-1]))
+    highs = np.maximum(opens, closes) * (1 + rng.random(n) * 0.0005)
+    lows = np.minimum(opens, closes) * (1 - rng.random(n) * 0.0005)
+    volumes = rng.random(n) * 10
+
+    return np.column_stack([np.arange(n) * 60000, opens, highs, lows, closes, volumes])
+
+
+def main():
+    candles = synthetic_candles(100000)
+    n_sets = len(parameter_sets('Technical', method='random', n_samples=256, seed=1))
+
+    cores = os.cpu_count() or 1
+    workers = sorted({1, 2, 4, cores} & set(range(1, cores + 1)))
+
+    baseline = None
+
+    for w in workers:
+        start = time.perf_counter()
+        optimize('Technical', candles, method='random', n_samples=256, seed=1, max_workers=w)
+        elapsed = time.perf_counter() - start
+
+        rate = n_sets / elapsed
+        baseline = baseline or rate
+
+        print(f"{w:>3} workers: {rate:8.1f} evaluations/s (speedup x{rate / baseline:.2f})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+# Loading months of candles for a backtest: from the SQLite candle store (Candle objects) against the Parquet
+# dataset read into NumPy arrays (database/parquet_store.py). Needs pyarrow.
+# Run from the repository root: python -m benchmarks.parquet_benchmark [number of days]
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from database.candles_database import CandlesDatabase
+from database.parquet_store import export_candles, load_candles, import_candles
+
+
+def fill(store: CandlesDatabase, days: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    n = days * 1440
+
+    timestamps = 1600000000000 - 1600000000000 % 86400000 + np.arange(n, dtype=np.int64) * 60000
+    closes = 10000 * np.exp(np.cumsum(rng.normal(0, 0.001, n)))
+
+    rows = [("binance_futures", "BTCUSDT", "1m", int(t), c, c * 1.001, c * 0.999, c, 1.0)
+            for t, c in zip(timestamps.tolist(), closes.tolist())]
+    store.save_rows(rows)
+
+    return n
+
+
+def timed(name: str, f):
+    start = time.perf_counter()
+    result = f()
+    print(f"{name:<44}{(time.perf_counter() - start) * 1000:9.1f} ms")
+    return result
+
+
+def main():
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 180
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = CandlesDatabase(os.path.join(tmp, 'candles.db'))
+        n = fill(store, days)
+        print(f"{n} 1m candles ({days} days)")
+
+        root = os.path.join(tmp, 'parquet')
+        timed("export to Parquet", lambda: export_candles(store, root))
+
+        candles = timed("CandlesDatabase.get_candles()",
+                        lambda: store.get_candles("binance_futures", "BTCUSDT", "1m"))
+        columns = timed("load_candles() (all days)", lambda: load_candles(root, "binance_futures", "BTCUSDT", "1m"))
+
+        assert len(columns) == len(candles) == n
+        assert columns.timestamps[-1] == candles[-1].timestamp and columns.closes[-1] == candles[-1].close
+
+        start = int(columns.timestamps[0]) + (days - 30) * 86400000
+        month = timed("load_candles() (last 30 days)",
+                      lambda: load_candles(root, "binance_futures", "BTCUSDT", "1m", start_time=start))
+        assert len(month) == 30 * 1440
+
+        other = CandlesDatabase(os.path.join(tmp, 'imported.db'))
+        timed("import from Parquet", lambda: import_candles(root, other))
+        assert len(other.get_candles("binance_futures", "BTCUSDT", "1m")) == n
+
+        store.close()
+        other.close()
+
+
+if __name__ == '__main__':
+    main()
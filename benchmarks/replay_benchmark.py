@@ -0,0 +1,150 @@
+# Throughput of the full market data pipeline, replaying a recording through the connectors without network:
+# message decoding, candles, indicators and strategies, paper orders. The recording is synthetic: Binance Spot
+# BTCUSDT aggTrade / bookTicker and Bitmex XBTUSD trade / quote messages, 20 per second for 3 hours.
+# The replay is run twice to check that it gives the same orders.
+# Run from the repository root: python -m benchmarks.replay_benchmark [recording directory]
+# With a directory recorded by the TickRecorder, its segments are replayed instead (candle history not included).
+import datetime
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+from connectors.replay import ReplayBinanceClient, ReplayBitmexClient, ReplayEngine
+from connectors.tick_recorder import TickRecorder, segment_paths
+from database.candles_database import CandlesDatabase
+from Trading.models import Balance, Candle, Contract
+from Trading.strategies import TechnicalStrategy, BreakoutStrategy
+
+START_TIME = 1600000000000
+MESSAGES = 216000
+INTERVAL_MS = 50
+
+BINANCE_CONTRACT = Contract({'symbol': "BTCUSDT", 'baseAsset': "BTC", 'quoteAsset': "USDT",
+                             'filters': [{'filterType': 'PRICE_FILTER', 'tickSize': '0.01000000'},
+                                         {'filterType': 'LOT_SIZE', 'stepSize': '0.00000100', 'minQty': '0.00000100',
+                                          'maxQty': '9000.00000000'},
+                                         {'filterType': 'MIN_NOTIONAL', 'minNotional': '10.00000000'}]},
+                            "binance_spot")
+
+BITMEX_CONTRACT = Contract({'symbol': "XBTUSD", 'rootSymbol': "XBT", 'quoteCurrency': "USD", 'tickSize': 0.5,
+                            'lotSize': 100, 'isQuanto': False, 'isInverse': True, 'multiplier': -100000000},
+                           "bitmex")
+
+
+def bitmex_time(ms: int) -> str:
+    return datetime.datetime.fromtimestamp(ms / 1000, datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.") + \
+           f"{ms % 1000:03d}Z"
+
+
+def synthetic_recording(root: str, seed: int = 0):
+    rng = random.Random(seed)
+    recorder = TickRecorder(root)
+    price = 30000.0
+
+    for i in range(MESSAGES):
+        ms = START_TIME + i * INTERVAL_MS
+        price = max(100.0, price * (1 + rng.gauss(0, 0.0004)))
+        qty = rng.random() * 2
+
+        if i % 4 == 0:
+            msg = {"stream": "btcusdt@aggTrade", "data": {"e": "aggTrade", "E": ms, "s": "BTCUSDT", "a": i,
+                                                           "p": f"{price:.2f}", "q": f"{qty:.6f}", "f": i, "l": i,
+                                                           "T": ms - 5, "m": True}}
+            source = 'binance'
+        elif i % 4 == 1:
+            msg = {"stream": "btcusdt@bookTicker", "data": {"u": i, "s": "BTCUSDT", "b": f"{price - 0.01:.2f}",
+                                                             "B": "1.0", "a": f"{price + 0.01:.2f}", "A": "1.0"}}
+            source = 'binance'
+        elif i % 4 == 2:
+            msg = {"table": "trade", "action": "insert", "data": [
+                {"timestamp": bitmex_time(ms - 5), "symbol": "XBTUSD", "side": "Buy", "size": int(qty * 1000) + 100,
+                 "price": round(price * 2) / 2}]}
+            source = 'bitmex'
+        else:
+            msg = {"table": "quote", "action": "insert", "data": [
+                {"timestamp": bitmex_time(ms), "symbol": "XBTUSD", "bidSize": 1000, "bidPrice": round(price * 2) / 2,
+                 "askPrice": round(price * 2) / 2 + 0.5, "askSize": 1000}]}
+            source = 'bitmex'
+
+        recorder.record(source, json.dumps(msg, separators=(',', ':')), ms * 1000000)
+
+    recorder.close()
+
+
+def synthetic_history(db: CandlesDatabase, seed: int = 1):
+    rng = random.Random(seed)
+    price = 30000.0
+    rows = []
+
+    for i in range(1000, 0, -1):
+        ts = START_TIME - START_TIME % 60000 - i * 60000
+        close = price * (1 + rng.gauss(0, 0.002))
+        rows.append((ts, price, max(price, close) * 1.001, min(price, close) * 0.999, close, rng.random() * 100))
+        price = close
+
+    db.save_candles("binance_spot", "BTCUSDT", "1m", Candle.from_rows(rows))
+    db.save_candles("bitmex", "XBTUSD", "1m", Candle.from_rows(rows))
+
+
+def replay(paths, history: CandlesDatabase, strategy_workers: int = None):
+    binance = ReplayBinanceClient({"BTCUSDT": BINANCE_CONTRACT},
+                                  {"USDT": Balance({'free': '100000', 'locked': '0'}, "binance_spot")}, history,
+                                  futures=False, strategy_workers=strategy_workers)
+    bitmex = ReplayBitmexClient({"XBTUSD": BITMEX_CONTRACT},
+                                {"XBt": Balance({'initMargin': 0, 'maintMargin': 0, 'marginBalance': 100000000,
+                                                 'walletBalance': 100000000, 'unrealisedPnl': 0}, "bitmex")},
+                                history, strategy_workers=strategy_workers)
+
+    engine = ReplayEngine([binance, bitmex], paths)
+
+    technical = {'ema_fast': 12, 'ema_slow': 26, 'ema_signal': 9, 'rsi_length': 14}
+
+    for index, (client, contract) in enumerate(((binance, BINANCE_CONTRACT), (bitmex, BITMEX_CONTRACT))):
+        client.add_strategy(2 * index, TechnicalStrategy(client, contract, client.platform, "1m", 5, 0.5, 0.5,
+                                                         technical))
+        client.add_strategy(2 * index + 1, BreakoutStrategy(client, contract, client.platform, "1m", 5, 0.5, 0.5,
+                                                            {'min_volume': 10}))
+
+    stats = engine.run()
+    orders = binance.paper_orders + bitmex.paper_orders
+
+    binance.close()
+    bitmex.close()
+
+    return stats, orders
+
+
+def main():
+    work_dir = tempfile.mkdtemp()
+
+    try:
+        history = CandlesDatabase(os.path.join(work_dir, "history.db"))
+
+        if len(sys.argv) > 1:
+            paths = segment_paths(sys.argv[1])
+        else:
+            synthetic_recording(os.path.join(work_dir, "ticks"))
+            synthetic_history(history)
+            paths = segment_paths(os.path.join(work_dir, "ticks"))
+
+        print(f"{len(paths)} segments, {sum(os.path.getsize(p) for p in paths) / 1e6:.1f} MB compressed")
+
+        first, first_orders = replay(paths, history)
+        second, second_orders = replay(paths, history)
+        assert first_orders == second_orders, "the replays placed different orders"
+
+        for name, stats in (("first replay", first), ("second replay", second)):
+            print(f"{name:<14} {stats['messages']} messages of {stats['recorded_duration'] / 3600:.1f} hours in "
+                  f"{stats['duration']:.2f} s: {stats['messages_per_second']:9.0f} msgs/s, "
+                  f"{stats['orders']} orders, {stats['closed_trades']} closed trades")
+
+        history.close()
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+# Bitmex timestamp parsing: Trading.utils.iso_to_ms against dateutil isoparse, in timestamps per second.
+# The results of both are compared first over the edge cases of tests/test_utils.py and a day of trade timestamps.
+# Run from the repository root: python -m benchmarks.timestamp_benchmark
+import datetime
+import time
+
+import dateutil.parser
+
+from tests.test_utils import EDGE_CASES, reference_ms
+from Trading.utils import iso_to_ms
+
+
+def trade_timestamps(n: int, trades_per_second: int = 20):
+    start = datetime.datetime(2021, 5, 19, 13, 0, tzinfo=datetime.timezone.utc)
+    step = datetime.timedelta(milliseconds=1000 // trades_per_second + 3)
+
+    return [(start + i * step).strftime('%Y-%m-%dT%H:%M:%S.%f')[:23] + 'Z' for i in range(n)]
+
+
+def check():
+    timestamps = EDGE_CASES + trade_timestamps(100000)
+
+    for ts in timestamps:
+        assert iso_to_ms(ts) == reference_ms(ts), ts
+
+    print(f"{len(timestamps)} timestamps checked")
+
+
+def rate(parse, timestamps) -> float:
+    start = time.perf_counter()
+    for ts in timestamps:
+        parse(ts)
+    return len(timestamps) / (time.perf_counter() - start)
+
+
+def main():
+    check()
+
+    timestamps = trade_timestamps(200000)
+
+    isoparse_rate = rate(lambda ts: int(dateutil.parser.isoparse(ts).timestamp() * 1000), timestamps)
+    fast_rate = rate(iso_to_ms, timestamps)
+
+    print(f"dateutil isoparse: {isoparse_rate:12.0f} timestamps/s")
+    print(f"iso_to_ms:         {fast_rate:12.0f} timestamps/s (x{fast_rate / isoparse_rate:.1f})")
+
+
+if __name__ == '__main__':
+    main()
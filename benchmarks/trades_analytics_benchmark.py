@@ -0,0 +1,77 @@
+# Trade journal summaries computed by SQLite (database/trades_database.py) on a large synthetic journal, against
+# loading the whole table and computing them in Python.
+# Run from the repository root: python -m benchmarks.trades_analytics_benchmark [number of trades]
+import os
+import random
+import sys
+import tempfile
+import time
+
+from database.trades_database import TradesDatabase
+
+STRATEGIES = ("Technical", "Breakout")
+SYMBOLS = ("BTCUSDT", "ETHUSDT", "BNBUSDT", "XBTUSD")
+
+
+def fill(db: TradesDatabase, n: int, seed: int = 0):
+    rng = random.Random(seed)
+    batch = []
+
+    for i in range(n):
+        t = 1500000000000 + i * 60000
+        batch.append((t, "binance_futures", rng.choice(SYMBOLS), rng.choice(STRATEGIES), "long", 100.0, 101.0,
+                      t + 30000, "closed", rng.gauss(0.1, 1), 1.0, str(i)))
+
+        if len(batch) == 100000:
+            db.add_new_rows(batch)
+            batch = []
+
+    if batch:
+        db.add_new_rows(batch)
+
+
+def timed(name: str, f):
+    start = time.perf_counter()
+    result = f()
+    print(f"{name:<56}{(time.perf_counter() - start) * 1000:9.1f} ms")
+    return result
+
+
+def python_summary(db: TradesDatabase):
+    # What reporting took before: the whole table loaded and aggregated in Python
+    summary = dict()
+    for row in db.get_trades():
+        s = summary.setdefault(row['strategy'], [0, 0.0, 0])
+        s[0] += 1
+        s[1] += row['pnl']
+        s[2] += row['pnl'] > 0
+    return summary
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = TradesDatabase(os.path.join(tmp, 'trades.db'))
+        timed(f"insert {n} trades", lambda: fill(db, n))
+
+        python = timed("summary per strategy, in Python", lambda: python_summary(db))
+        summary = timed("pnl_summary() per strategy", lambda: db.pnl_summary())
+
+        for s in summary:
+            assert s['trades'] == python[s['strategy']][0] and s['wins'] == python[s['strategy']][2]
+
+        timed("pnl_summary() per symbol", lambda: db.pnl_summary("symbol"))
+        timed("pnl_summary() of one strategy, last 10% of the time",
+              lambda: db.pnl_summary(strategy="Technical", start_time=1500000000000 + int(n * 0.9) * 60000))
+        curve = timed("equity_curve() of one strategy, every trade", lambda: db.equity_curve(strategy="Breakout"))
+        daily = timed("equity_curve() of one strategy, daily points",
+                      lambda: db.equity_curve(strategy="Breakout", resolution=86400000))
+
+        assert abs(curve[-1][1] - daily[-1][1]) < 1e-6
+
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
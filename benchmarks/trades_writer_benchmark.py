@@ -0,0 +1,99 @@
+# Sustained closed-trade inserts per second in trades.db: one thread and one connection per trade (the strategies
+# before) against the shared TradesWriter, with several strategies closing trades at the same time.
+# Run from the repository root: python -m benchmarks.trades_writer_benchmark
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from database.trades_database import TradesDatabase, TradesWriter
+from Trading.models import Trade
+
+
+class _Contract:
+    symbol = "BTCUSDT"
+    exchange = "binance_futures"
+
+
+def make_trades(n: int):
+    return [Trade({'time': 1600000000000 + i, 'contract': _Contract(), 'strategy': "Technical", 'side': "long",
+                   'entry_price': 30000.0, 'status': "closed", 'pnl': 1.5, 'quantity': 0.01, 'entry_id': i,
+                   'exit_price': 30050.0, 'exit_time': 1600000060000 + i})
+            for i in range(n)]
+
+
+def thread_per_trade(path: str, trades, producers: int) -> float:
+    def save(trade):
+        # The locking errors were lost in the threads before, they are retried here to count every trade
+        while True:
+            try:
+                db = TradesDatabase(path)
+                db.add_new_trade(trade)
+                db.close()
+                return
+            except sqlite3.OperationalError:
+                time.sleep(0.001)
+
+    def produce(chunk):
+        threads = [threading.Thread(target=save, args=(t,)) for t in chunk]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    return run_producers(produce, trades, producers)
+
+
+def shared_writer(path: str, trades, producers: int) -> float:
+    writer = TradesWriter(path)
+
+    def produce(chunk):
+        for t in chunk:
+            writer.add_trade(t)
+
+    elapsed = run_producers(produce, trades, producers, writer.flush)
+    writer.close()
+
+    return elapsed
+
+
+def run_producers(produce, trades, producers: int, wait=None) -> float:
+    chunks = [trades[i::producers] for i in range(producers)]
+    threads = [threading.Thread(target=produce, args=(c,)) for c in chunks]
+
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if wait is not None:
+        wait()
+
+    return time.perf_counter() - start
+
+
+def count_rows(path: str) -> int:
+    conn = sqlite3.connect(path)
+    n = conn.execute("SELECT COUNT(*) FROM trades").fetchone()[0]
+    conn.close()
+    return n
+
+
+def main():
+    n_trades = 2000
+    producers = 8
+    trades = make_trades(n_trades)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, method in (("thread + connection per trade", thread_per_trade), ("TradesWriter", shared_writer)):
+            path = os.path.join(tmp, name.replace(' ', '_') + '.db')
+
+            elapsed = method(path, trades, producers)
+            assert count_rows(path) == n_trades
+
+            print(f"{name:<32}{n_trades / elapsed:10.0f} trades/s")
+
+
+if __name__ == '__main__':
+    main()
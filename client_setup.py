@@ -9,3 +9,6 @@ bitmex_api_secret = ''
 testnet = True
 
 binance_futures = True
+
+# Save the websocket market data to ticks/ for the offline replays (connectors/replay.py)
+record_ticks = False
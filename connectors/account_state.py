@@ -0,0 +1,113 @@
+import threading
+import time
+import typing
+
+from Trading.models import Balance, OrderStatus
+
+# Without the user data stream, balances read through REST are reused for this many seconds
+BALANCES_TTL = 10
+
+# While the user data stream is connected, the cache is still compared with REST at this interval (seconds)
+RECONCILE_INTERVAL = 300
+
+# The exchange will not update these orders anymore
+FINAL_ORDER_STATUSES = {"filled", "canceled", "cancelled", "rejected", "expired"}
+
+
+class AccountState:
+    '''
+    Balances and orders of the account, kept up to date by the user data stream of the exchange so the strategies
+    read local state instead of making REST calls. REST responses are written to the same cache, they seed it and
+    correct it when the stream is disconnected.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+        self._balances: typing.Dict[str, Balance] = dict()
+        self._balances_time = None  # time.monotonic() of the last REST snapshot
+
+        self._orders: typing.Dict[typing.Union[int, str], OrderStatus] = dict()
+
+        self.stream_connected = False
+
+    def set_balances(self, balances: typing.Dict[str, Balance]):
+        '''
+        Replace the balances with a complete snapshot (REST)
+        :param balances:
+        :return:
+        '''
+
+        with self._lock:
+            self._balances = dict(balances)
+            self._balances_time = time.monotonic()
+
+    def update_balances(self, balances: typing.Dict[str, Balance]):
+        '''
+        Update the assets present in a stream event, the others are left unchanged
+        :param balances:
+        :return:
+        '''
+
+        with self._lock:
+            new_balances = dict(self._balances)
+            new_balances.update(balances)
+            self._balances = new_balances  # Replaced, not modified, the readers may be iterating over the old dict
+
+    def invalidate_balances(self):
+        with self._lock:
+            self._balances_time = None
+
+    def get_balance(self, asset: str) -> typing.Union[Balance, None]:
+        return self._balances.get(asset)
+
+    def balances(self) -> typing.Union[typing.Dict[str, Balance], None]:
+        '''
+        :return: The cached balances, None when they must be read again through REST
+        '''
+
+        with self._lock:
+            if self._balances_time is None:
+                return None
+
+            age = time.monotonic() - self._balances_time
+
+            if self.stream_connected and age < RECONCILE_INTERVAL:
+                return self._balances
+
+            if age < BALANCES_TTL:
+                return self._balances
+
+            return None
+
+    def set_order(self, order_status: OrderStatus):
+        with self._lock:
+            previous = self._orders.get(order_status.order_id)
+
+            # A REST response can arrive after the stream event that already reported the end of the order
+            if previous is not None and previous.status in FINAL_ORDER_STATUSES and \
+                    order_status.status not in FINAL_ORDER_STATUSES:
+                return
+
+            self._orders[order_status.order_id] = order_status
+
+    def order(self, order_id: typing.Union[int, str]) -> typing.Union[OrderStatus, None]:
+        '''
+        :param order_id:
+        :return: The cached status if it can be trusted without a REST call, None otherwise
+        '''
+
+        with self._lock:
+            order_status = self._orders.get(order_id)
+
+            if order_status is None:
+                return None
+
+            if self.stream_connected or order_status.status in FINAL_ORDER_STATUSES:
+                return order_status
+
+            return None
+
+    def discard_order(self, order_id: typing.Union[int, str]):
+        with self._lock:
+            self._orders.pop(order_id, None)
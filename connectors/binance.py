@@ -1,5 +1,4 @@
 import logging
-import requests
 import time
 import typing
 import hmac
@@ -7,11 +6,22 @@ import numpy as np
 import hashlib
 import websocket
 import threading
-import json
+import copy
 
 from urllib.parse import urlencode
 
+from connectors.account_state import AccountState, RECONCILE_INTERVAL
+from connectors.binance_streams import BinanceStreamManager
+from connectors.decoding import loads, decode_binance_book_ticker, decode_binance_agg_trade
+from connectors.http_session import PooledSession, DEFAULT_POOL_SIZE, DEFAULT_TIMEOUT
+from connectors.order_tracker import OrderTracker
+from connectors.rate_limiter import BACKGROUND_BUDGET_SHARE, binance_rate_limiter
+from database.candle_archive import CandleArchive
+from database.candles_database import CandlesDatabase
+from Trading.execution import SymbolExecutor
+from Trading.market_data import MarketDataHub
 from Trading.models import *
+from Trading.order_book import OrderBook
 from Trading.strategies import TechnicalStrategy, BreakoutStrategy
 from Trading.utils import *
 
@@ -21,7 +31,9 @@ logger = logging.getLogger()
 # HANDLER FOR BINANCE CLIENTS
 class BinanceClient:
     # constructor
-    def __init__(self, public_key: str, secret_key: str, testnet: bool, futures: bool):
+    def __init__(self, public_key: str, secret_key: str, testnet: bool, futures: bool,
+                 pool_size: int = DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT, strategy_workers: int = 4,
+                 candles_store: CandlesDatabase = None, candle_archive: CandleArchive = None):
         self.futures = futures
         self.testnet = testnet
         if self.futures:
@@ -51,11 +63,23 @@ class BinanceClient:
 
         self._headers = {'X-MBX-APIKEY': self._public_key}
 
+        # single keep-alive session shared by the signed and the public endpoints
+        self._session = PooledSession(self._base_url, self._headers, pool_size, timeout)
+
+        # every REST call waits for its weight to fit in the budget reported by the X-MBX-USED-WEIGHT headers
+        self._rate_limiter = binance_rate_limiter(futures)
+
         # obtain all contracts, BTCUSDT, ETHUSDT, ADAUSDT, etc
         self.contracts = self.get_contracts()
 
-        # obtain balances of all assets
-        self.balances = self.get_balances()
+        # balances and orders updated by the user data stream, read by the strategies instead of REST calls
+        self.account = AccountState()
+
+        # order id -> average fill price of the filled Spot orders resolved through myTrades
+        self._execution_prices: typing.Dict[int, float] = dict()
+
+        # obtain balances of all assets, they seed the cache until the user data stream is connected
+        self.get_balances()
 
         # nested dictionary that will keep track of bid and ask prices of a symbol
         # it will be updated when a func is called and new symbols are to be added when requested
@@ -63,18 +87,46 @@ class BinanceClient:
 
         self.strategies: typing.Dict[int, typing.Union[TechnicalStrategy, BreakoutStrategy]] = dict()
 
+        # symbol -> strategies running on it, rebuilt (copy-on-write) by add_strategy() and remove_strategy()
+        # so the websocket thread can iterate over it while the interface starts or stops a strategy
+        self._strategies_by_symbol: typing.Dict[str, typing.Tuple[typing.Union[TechnicalStrategy, BreakoutStrategy], ...]] = dict()
+
+        # the strategies run on these workers, the websocket thread only decodes the messages and queues them
+        self._executor = SymbolExecutor(strategy_workers, 'binance_strategies')
+
+        # candles built once per symbol from the aggTrade stream and shared by the strategies
+        # candles of the strategies, saved to the default candles database and archive unless others are given
+        self.market_data = MarketDataHub(self, candles_store, candle_archive)
+
+        # follows the orders placed by the strategies until they are filled, callbacks run on the executor
+        self.order_tracker = OrderTracker(self, self._executor)
+
         # list of logs
         self.logs = []
 
         # websocket
-        self.ws = None
-        self._ws_id = 1
         self.reconnect = True
-        self.ws_connected = False
-        self.ws_subscriptions = {'bookTicker': [], 'aggTrade': []}
+        self.ws_subscriptions = {'bookTicker': [], 'aggTrade': [], 'depth@100ms': []}
+
+        # local order books built from the depth diff stream, see subscribe_order_book()
+        self.order_books: typing.Dict[str, OrderBook] = dict()
+        self._depth_buffers: typing.Dict[str, typing.List[typing.Dict]] = dict()
+        self._resyncing: typing.Set[str] = set()  # symbols with a snapshot thread running, see _resync_order_book()
+
+        # market data streams, spread over as many combined-stream connections as needed
+        self.streams = BinanceStreamManager(self._wss_url[:-len('/ws')], self._on_stream_event, self._on_streams_open,
+                                            raw_handlers={'bookTicker': self._on_book_ticker_message,
+                                                          'aggTrade': self._on_agg_trade_message})
+
+        if 'BTCUSDT' in self.contracts:
+            self.subscribe_channel([self.contracts['BTCUSDT']], 'bookTicker')
+
+        # user data stream, on its own websocket since it needs a listenKey in the url
+        self._listen_key = None
+        self._user_ws = None
+        self._user_stream_stopped = threading.Event()
 
-        # start threading for ws manager
-        t = threading.Thread(target=self.start_ws)
+        t = threading.Thread(target=self._start_user_stream)
         t.start()
 
     def _hashing(self, query_string: str):
@@ -103,16 +155,12 @@ class BinanceClient:
         :return:
         '''
 
-        session = requests.Session()
-        session.headers.update(
-            {"Content-Type": "application/json;charset=utf-8", "X-MBX-APIKEY": self._public_key}
-        )
         return {
-            "GET": session.get,
-            "DELETE": session.delete,
-            "PUT": session.put,
-            "POST": session.post,
-        }.get(http_method, "GET")
+            "GET": self._session.get,
+            "DELETE": self._session.delete,
+            "PUT": self._session.put,
+            "POST": self._session.post,
+        }.get(http_method, self._session.get)
 
     ''' Private endpoints '''
     def _send_signed_request(self, http_method: str, url_path: str, payload={}) -> typing.Dict:
@@ -124,20 +172,25 @@ class BinanceClient:
         :return:
         '''
 
-        query_string = urlencode(payload, True)
-        if query_string:
-            query_string = "{}&timestamp={}".format(query_string, self._get_current_timestamp())
-        else:
-            query_string = "timestamp={}".format(self._get_current_timestamp())
+        def send():
+            # signed again on every attempt, the rate limiter can delay the request past the recvWindow
+            query_string = urlencode(payload, True)
+            if query_string:
+                query_string = "{}&timestamp={}".format(query_string, self._get_current_timestamp())
+            else:
+                query_string = "timestamp={}".format(self._get_current_timestamp())
 
-        url = (
-            self._base_url + url_path + "?" + query_string + "&signature=" + self._hashing(query_string)
-        )
+            url = (
+                self._base_url + url_path + "?" + query_string + "&signature=" + self._hashing(query_string)
+            )
 
-        # print("{} {}".format(http_method, url))
-        params = {"url": url, "params": {}}
-        response = self._dispatch_request(http_method)(**params)
-        return response.json()
+            # print("{} {}".format(http_method, url))
+            params = {"url": url, "headers": {"Content-Type": "application/json;charset=utf-8"}}
+            return self._dispatch_request(http_method)(**params)
+
+        response = self._rate_limiter.execute(http_method, url_path, send,
+                                              coalesce_key=(url_path, urlencode(payload, True)), params=payload)
+        return loads(response.content)
 
     ''' Public endpoints '''
     def _send_public_request(self, url_path: str, payload={}) -> typing.Dict:
@@ -153,8 +206,9 @@ class BinanceClient:
         if query_string:
             url = url + '?' + query_string
         # print('{}'.format(url))
-        response = self._dispatch_request('GET')(url=url)
-        return response.json()
+        response = self._rate_limiter.execute('GET', url_path, lambda: self._dispatch_request('GET')(url=url),
+                                              coalesce_key=(url_path, query_string), params=payload)
+        return loads(response.content)
 
     def _generate_signature(self, data: typing.Dict) -> str:
         '''
@@ -185,39 +239,52 @@ class BinanceClient:
         :return:
         '''
 
-        if method == 'GET':
-            try:
-                response = requests.get(self._base_url + endpoint, params=data, headers=self._headers)
-            except Exception as e:
-                logger.error('Connection error while making %s request to %s: %s', method, endpoint, e)
-                return None
-
-        elif method == 'POST':
-            try:
-                response = requests.post(self._base_url + endpoint, params=data, headers=self._headers)
-            except Exception as e:
-                logger.error('Connection error while making %s request to %s: %s', method, endpoint, e)
-                return None
-
-        elif method == 'DELETE':
-            try:
-                response = requests.delete(self._base_url + endpoint, params=data, headers=self._headers)
-            except Exception as e:
-                logger.error('Connection error while making %s request to %s: %s', method, endpoint, e)
-                return None
-
-        else:
+        if method not in ('GET', 'POST', 'PUT', 'DELETE'):
             raise ValueError
 
+        try:
+            response = self._rate_limiter.execute(method, endpoint,
+                                                  lambda: self._session.request(method, endpoint, params=data),
+                                                  coalesce_key=(endpoint, urlencode(data, True)), params=data)
+        except Exception as e:
+            logger.error('Connection error while making %s request to %s: %s', method, endpoint, e)
+            return None
+
         # check if the response is valid, 200 means that
         if response.status_code == 200:
-            return response.json()
+            return loads(response.content)
 
         else:
             logger.error("Error while making %s request to %s: %s (error code %s)",
                          method, endpoint, response.json(), response.status_code)
             return None
 
+    def connection_stats(self) -> typing.Dict[str, int]:
+        '''
+        Reused versus new HTTP connections since the client was created
+        :return:
+        '''
+
+        return self._session.connection_stats()
+
+    def rate_limit_metrics(self) -> typing.Dict:
+        '''
+        Request weight and order count used in the current windows, calls waiting for the budget
+        :return:
+        '''
+
+        return self._rate_limiter.metrics()
+
+    def background_requests(self, budget_share: float = BACKGROUND_BUDGET_SHARE):
+        '''
+        Context of the bulk downloads (history backfill): the requests of the current thread wait behind the other
+        ones and use at most budget_share of the rate limits, see RateLimiter.background()
+        :param budget_share:
+        :return:
+        '''
+
+        return self._rate_limiter.background(budget_share)
+
     # public endpoints
     # get the possible contracts like BTC/USDT or ETH/USDT for example
     # returns a dictionary of contracts
@@ -230,6 +297,11 @@ class BinanceClient:
 
         contracts = dict()
         if exchange_info is not None:
+            # the limits of the account can differ from the default ones
+            for limit in exchange_info.get('rateLimits', []):
+                self._rate_limiter.set_limit(f"{limit['rateLimitType']}_{limit['intervalNum']}{limit['interval'][0]}",
+                                             limit['limit'])
+
             # loop through the symbols and add them to the contracts dict
             for contract_data in exchange_info['symbols']:
                 contracts[contract_data['symbol']] = Contract(contract_data, self.platform)
@@ -241,25 +313,29 @@ class BinanceClient:
 
     # manages to get the historical candlestick, up to 1000
     # receives the contract and the time interval, 1m, 5m, 15m and so on
+    # start_time (open time in milliseconds) returns the candles from that time instead of the most recent ones
     # returns a list of Candle
-    def get_historical_candles(self, contract: Contract, interval: str) -> typing.List[Candle]:
+    def get_historical_candles(self, contract: Contract, interval: str, start_time: int = None,
+                               end_time: int = None) -> typing.List[Candle]:
         data = dict()
         data['symbol'] = contract.symbol
         data['interval'] = interval
         data['limit'] = 1000
 
+        if start_time is not None:
+            data['startTime'] = start_time
+        if end_time is not None:
+            data['endTime'] = end_time
+
         if self.futures:
             raw_candles = self._make_request('GET', '/fapi/v1/klines', data)
         else:
             raw_candles = self._make_request('GET', '/api/v3/klines', data)
 
-        candles = []
+        if raw_candles is None:
+            return []
 
-        if raw_candles is not None:
-            for c in raw_candles:
-                candles.append(Candle(c, interval, self.platform))
-
-        return candles
+        return Candle.from_klines(raw_candles)
 
     # returns a nested dict with most recent bid and ask price
     # if the symbol passed was not in dict created before, it will be added now, otherwise the prices will be updated
@@ -308,8 +384,21 @@ class BinanceClient:
                 for a in account_data['balances']:
                     balances[a['asset']] = Balance(a, self.platform)
 
+            self.account.set_balances(balances)
+
+        return balances
+
+    # balances from the user data stream cache, through REST only when the cache can't be trusted
+    def cached_balances(self) -> typing.Dict[str, Balance]:
+        balances = self.account.balances()
+        if balances is None:
+            balances = self.get_balances()
         return balances
 
+    @property
+    def balances(self) -> typing.Dict[str, Balance]:
+        return self.cached_balances()
+
     # place orders to buy or sell depending on the signal
     # gets the contract, the type: MARKET, the quantity, and the side: buy or sell
     # return the status of the order
@@ -333,26 +422,29 @@ class BinanceClient:
             # data['timestamp'] = int(time.time() * 1000)
             # data['signature'] = self._generate_signature(data)
             order_status = self._send_signed_request('POST', '/fapi/v1/order', data)
-            print(order_status)
         else:
             data['quantity'] = self._check_for_filters(contract, data['quantity'], float(self.prices[contract.symbol]['ask']))
             if data['quantity'] is None:
                 return None
 
+            # the FULL response lists the fills, the average price is computed without another request
+            data['newOrderRespType'] = 'FULL'
+
             order_status = self._send_signed_request('POST', '/api/v3/order', data)
-            print(order_status)
+
+        logger.debug('Binance order response for %s: %s', contract.symbol, order_status)
 
         if order_status is not None:
             if not self.futures:
-                if order_status['status'] == 'FILLED':
-                    order_status['avgPrice'] = self._get_execution_price(contract, order_status['orderId'])
-                else:
-                    order_status['avgPrice'] = 0
+                order_status['avgPrice'] = self._spot_average_price(contract, order_status)
 
             order_status = OrderStatus(order_status, self.platform)
+            self.account.set_order(order_status)
+
+            # the user data stream updates the balances after the fill, without it they are read again
+            if not self.account.stream_connected:
+                self.account.invalidate_balances()
 
-            self.balances = self.get_balances()
-        
         return order_status
 
     # cancel order when required
@@ -370,16 +462,21 @@ class BinanceClient:
 
         if order_status is not None:
             if not self.futures:
-                # get average execution price based on the recent trades
-                order_status['avgPrice'] = self._get_execution_price(contract, order_id)
+                order_status['avgPrice'] = self._spot_average_price(contract, order_status)
             order_status = OrderStatus(order_status, self.platform)
+            self.account.set_order(order_status)
 
         return order_status
 
     # check the status of an order
     # gets the contract and the order id
     # returns an OrderStatus
+    # the cached status from the user data stream is returned when it is available
     def get_order_status(self, contract: Contract, order_id: int) -> OrderStatus:
+        cached_status = self.account.order(order_id)
+        if cached_status is not None:
+            return cached_status
+
         data = dict()
         data['symbol'] = contract.symbol
         data['orderId'] = order_id
@@ -391,84 +488,127 @@ class BinanceClient:
 
         if order_status is not None:
             if not self.futures:
-                if order_status['status'] == 'FILLED':
-                    order_status['avgPrice'] = self._get_execution_price(contract, order_id)
-                else:
-                    order_status['avgPrice'] = 0
+                order_status['avgPrice'] = self._spot_average_price(contract, order_status)
             order_status = OrderStatus(order_status, self.platform)
+            self.account.set_order(order_status)
 
         return order_status
 
-    def _get_execution_price(self, contract: Contract, order_id: int) -> float:
+    # statuses of several orders for the OrderTracker, with one openOrders request per symbol
+    # the orders missing from openOrders are closed, their final status is requested individually once
+    def get_orders_status(self, orders: typing.Dict[int, Contract]) -> typing.Dict[int, OrderStatus]:
+        statuses = dict()
+
+        symbols = {contract.symbol: contract for contract in orders.values()}
+
+        for symbol, contract in symbols.items():
+            if self.futures:
+                open_orders = self._send_signed_request('GET', '/fapi/v1/openOrders', {'symbol': symbol})
+            else:
+                open_orders = self._send_signed_request('GET', '/api/v3/openOrders', {'symbol': symbol})
+
+            if not isinstance(open_orders, list):  # error message from the exchange
+                continue
+
+            open_ids = set()
+
+            for o in open_orders:
+                open_ids.add(o['orderId'])
+                if o['orderId'] not in orders:
+                    continue
+
+                if not self.futures:
+                    o['avgPrice'] = self._spot_average_price(contract, o)
+
+                statuses[o['orderId']] = OrderStatus(o, self.platform)
+
+            for order_id, order_contract in orders.items():
+                if order_contract.symbol == symbol and order_id not in open_ids:
+                    order_status = self.get_order_status(contract, order_id)
+                    if order_status is not None:
+                        statuses[order_id] = order_status
+
+        return statuses
+
+    def _spot_average_price(self, contract: Contract, order: typing.Dict) -> float:
         """
                 For Binance Spot only, find the equivalent of the 'avgPrice' key on the futures side.
-                The average price is the weighted sum of each trade price related to the order_id
+                From the fills of a FULL order response, otherwise from the cumulative quote quantity of the order,
+                the trades of the order are only requested when neither is available.
                 :param contract:
-                :param order_id:
+                :param order: Order returned by the exchange
                 :return:
         """
-        data = dict()
-        data['symbol'] = contract.symbol
 
-        trades = self._send_signed_request('GET', '/api/v3/myTrades', data)
+        executed_qty = float(order.get('executedQty', 0))
+        if executed_qty == 0:
+            return 0
 
-        avg_price = 0
+        fills = order.get('fills')
+
+        if fills:
+            fills_qty = sum(float(f['qty']) for f in fills)
+            avg_price = sum(float(f['price']) * float(f['qty']) for f in fills) / fills_qty
 
-        if trades is not None:
-            executed_qty = 0
-            for t in trades:
-                if t['orderId'] == order_id:
-                    executed_qty += float(t['qty'])
+        elif float(order.get('cummulativeQuoteQty', -1)) >= 0:  # negative for some orders older than 2018
+            avg_price = float(order['cummulativeQuoteQty']) / executed_qty
 
-            for t in trades:
-                if t['orderId'] == order_id:
-                    fill_pct = float(t['qty']) / executed_qty
-                    avg_price += (float(t['price']) * fill_pct)
+        else:
+            return self._get_execution_price(contract, order['orderId'], order.get('status') == 'FILLED')
 
         return round(round(avg_price / contract.tick_size) * contract.tick_size, 8)
 
-    # Websocket manager
-    def start_ws(self):
+    def _get_execution_price(self, contract: Contract, order_id: int, filled: bool = False) -> float:
+        """
+                For Binance Spot only, the average price is the weighted sum of each trade price related to the
+                order_id. Only the trades of the order are requested, and the price of a filled order is cached.
+                :param contract:
+                :param order_id:
+                :param filled: The order won't have new trades, its price can be cached
+                :return:
+        """
 
-        self.ws = websocket.WebSocketApp(self._wss_url, on_open=self._on_open, on_close=self._on_close,
-                                         on_error=self._on_error, on_message=self._on_message)
+        if order_id in self._execution_prices:
+            return self._execution_prices[order_id]
 
-        while True:
-            try:
-                if self.reconnect:
-                    self.ws.run_forever()
-                else:
-                    break
-            except Exception as e:
-                logger.error('Binance error in run_forever method: %s', e)
-            time.sleep(2)
+        data = dict()
+        data['symbol'] = contract.symbol
+        data['orderId'] = order_id
+
+        trades = self._send_signed_request('GET', '/api/v3/myTrades', data)
 
-    # these function will be called by the Websocket manager
-    # the argument 'ws' is not used but it must be there to avoid rising an error
-    def _on_open(self, ws):
-        logger.info('Binance connection opened')
+        avg_price = 0
 
-        self.ws_connected = True
+        if isinstance(trades, list) and len(trades) > 0:
+            executed_qty = sum(float(t['qty']) for t in trades)
+            avg_price = sum(float(t['price']) * float(t['qty']) for t in trades) / executed_qty
 
-        for channel in ['bookTicker', 'aggTrade']:
-            for symbol in self.ws_subscriptions[channel]:
-                self.subscribe_channel([self.contracts[symbol]], channel, reconnection=True)
+        avg_price = round(round(avg_price / contract.tick_size) * contract.tick_size, 8)
 
-        if 'BTCUSDT' not in self.ws_subscriptions['bookTicker']:
-            self.subscribe_channel([self.contracts['BTCUSDT']], 'bookTicker')
+        if filled:
+            self._execution_prices[order_id] = avg_price
 
-    def _on_close(self, ws, *args, **kwargs):
-        logger.warning('Websocket connection closed')
-        self.ws_connected = False
+        return avg_price
+
+    # these function will be called by the stream manager
+    def _on_streams_open(self, streams: typing.List[str]):
+        '''
+        A stream connection (re)connected, the depth diffs received during the disconnection are lost so the books
+        on it are synced again from a snapshot
+        :param streams:
+        :return:
+        '''
+
+        for stream in streams:
+            if stream.endswith('@depth@100ms'):
+                self._resync_order_book(stream.split('@')[0].upper())
 
     def _on_error(self, ws, msg: str):
         logger.error('Binance connection error: %s', msg)
 
     # this is the most important function for the ws manager because it will interpret what the ws is sending
     # read binance documentation to see what the letters mean
-    def _on_message(self, ws, msg: str):
-
-        data = json.loads(msg)
+    def _on_stream_event(self, data: typing.Dict):
 
         if 'u' in data and 'A' in data:
             data['e'] = 'bookTicker'  # For Binance Spot, to make the data structure uniform with Binance Futures
@@ -478,78 +618,416 @@ class BinanceClient:
         if 'e' in data:
             # if bookTicker, the data received is bid and ask price
             if data['e'] == 'bookTicker':
+                self._on_book_ticker(data['s'], float(data['b']), float(data['a']))
 
-                symbol = data['s']
+            if data['e'] == 'depthUpdate':
+                self._on_depth_update(data)
 
-                if symbol not in self.prices:
-                    self.prices[symbol] = {'bid': float(data['b']), 'ask': float(data['a'])}
-                else:
-                    self.prices[symbol]['bid'] = float(data['b'])
-                    self.prices[symbol]['ask'] = float(data['a'])
+            # if aggTrade, data received is a new candle to append
+            if data['e'] == 'aggTrade':
+                self._on_agg_trade(data['s'], float(data['p']), float(data['q']), data['T'])
+
+    # the bookTicker and aggTrade messages are the most frequent ones, the stream manager passes them undecoded
+    def _on_book_ticker_message(self, msg: str):
+        self._on_book_ticker(*decode_binance_book_ticker(msg))
 
-                # PNL calculation
-                # it is done here because everytime the bid and ask are updated, the PNL are calculated to know
-                # when to sell when on a position, and check for all ongoing trades as well
+    def _on_agg_trade_message(self, msg: str):
+        self._on_agg_trade(*decode_binance_agg_trade(msg))
+
+    def _on_book_ticker(self, symbol: str, bid: float, ask: float):
+
+        if symbol not in self.prices:
+            self.prices[symbol] = {'bid': bid, 'ask': ask}
+        else:
+            self.prices[symbol]['bid'] = bid
+            self.prices[symbol]['ask'] = ask
+
+        # PNL calculation
+        # it is done everytime the bid and ask are updated, the PNL are calculated to know
+        # when to sell when on a position, and check for all ongoing trades as well
+        if symbol in self._strategies_by_symbol:
+            self._executor.submit(symbol, self._update_pnl, symbol)
+
+    def _on_agg_trade(self, symbol: str, price: float, quantity: float, trade_time: int):
+        if symbol in self._strategies_by_symbol:
+            self._executor.submit(symbol, self._process_trade, symbol, price, quantity, trade_time)
+
+    def _update_pnl(self, symbol: str):
+        '''
+        Update the PNL of the open trades on a symbol, runs on the strategy executor
+        :param symbol:
+        :return:
+        '''
+
+        for strat in self._strategies_by_symbol.get(symbol, ()):
+            for trade in strat.trades:
+                if trade.status == 'open' and trade.entry_price is not None:
+                    if trade.side == 'long':
+                        trade.pnl = (self.prices[symbol]['bid'] - trade.entry_price) * trade.quantity
+                    elif trade.side == 'short':
+                        trade.pnl = (self.prices[symbol]['ask'] - trade.entry_price) * trade.quantity
+
+    def _process_trade(self, symbol: str, price: float, size: float, timestamp: int):
+        '''
+        Feed a new trade to the candles shared by the strategies of its symbol, runs on the strategy executor
+        :param symbol:
+        :param price:
+        :param size:
+        :param timestamp:
+        :return:
+        '''
+
+        self.market_data.on_trade(symbol, price, size, timestamp)
+
+    def executor_metrics(self) -> typing.Dict:
+        return self._executor.metrics()
+
+    def stream_metrics(self) -> typing.Dict:
+        return self.streams.metrics()
+
+    def stop_strategies(self):
+        self.order_tracker.stop()
+        self._executor.shutdown()
+
+    def add_strategy(self, b_index: int, strategy: typing.Union[TechnicalStrategy, BreakoutStrategy]) -> bool:
+        '''
+        Register a running strategy, subscribe it to the candles of its symbol and timeframe and index it by symbol
+        for the websocket dispatch
+        :param b_index: row of the strategy in the StrategyEditor
+        :param strategy:
+        :return: False if no historical candles could be obtained for the strategy
+        '''
+
+        if not self.market_data.subscribe(strategy):
+            return False
+
+        self.strategies[b_index] = strategy
+        self.subscribe_order_book(strategy.contract)
+
+        symbol = strategy.contract.symbol
+        self._strategies_by_symbol[symbol] = self._strategies_by_symbol.get(symbol, ()) + (strategy,)
+
+        return True
+
+    def remove_strategy(self, b_index: int):
+        '''
+        Unregister a strategy, the websocket stops dispatching data to it
+        :param b_index: row of the strategy in the StrategyEditor
+        :return:
+        '''
+
+        strategy = self.strategies.pop(b_index, None)
+        if strategy is None:
+            return
+
+        self.market_data.unsubscribe(strategy)
+
+        symbol = strategy.contract.symbol
+        remaining = tuple(s for s in self._strategies_by_symbol.get(symbol, ()) if s is not strategy)
+
+        if remaining:
+            self._strategies_by_symbol[symbol] = remaining
+        else:
+            self._strategies_by_symbol.pop(symbol, None)
+
+            # no strategy left on the symbol, its trades and depth streams free their connection slots
+            self.unsubscribe_channel([strategy.contract], 'aggTrade')
+            self.unsubscribe_channel([strategy.contract], 'depth@100ms')
+            self.order_books.pop(symbol, None)
+            self._depth_buffers.pop(symbol, None)
+
+    # User data stream
+    def _listen_key_endpoint(self) -> str:
+        return '/fapi/v1/listenKey' if self.futures else '/api/v3/userDataStream'
+
+    def _start_user_stream(self):
+        '''
+        Connects the user data stream and keeps its listenKey alive, reconnects with a new listenKey when needed
+        :return:
+        '''
+
+        keepalive = threading.Thread(target=self._keepalive_user_stream)
+        keepalive.start()
+
+        while self.reconnect and not self._user_stream_stopped.is_set():
+            response = self._make_request('POST', self._listen_key_endpoint(), dict())
+
+            if response is not None:
+                self._listen_key = response['listenKey']
+
+                self._user_ws = websocket.WebSocketApp(self._wss_url + '/' + self._listen_key,
+                                                       on_open=self._on_user_stream_open,
+                                                       on_close=self._on_user_stream_close,
+                                                       on_error=self._on_error, on_message=self._on_user_message)
                 try:
-                    for b_index, strat in self.strategies.items():
-                        if strat.contract.symbol == symbol:
-                            for trade in strat.trades:
-                                if trade.status == 'open' and trade.entry_price is not None:
-                                    if trade.side == 'long':
-                                        trade.pnl = (self.prices[symbol]['bid'] - trade.entry_price) * trade.quantity
-                                    elif trade.side == 'short':
-                                        trade.pnl = (self.prices[symbol]['ask'] - trade.entry_price) * trade.quantity
-                except RuntimeError as e:
-                    logger.error('Error while looping through the binance strategies %s:', e)
+                    self._user_ws.run_forever()
+                except Exception as e:
+                    logger.error('Binance error in the user data stream run_forever method: %s', e)
 
-            # if aggTrade, data received is a new candle to append
-            if data['e'] == 'aggTrade':
-                symbol = data['s']
+            self.account.stream_connected = False
+            self._user_stream_stopped.wait(2)
 
-                for key, strat in self.strategies.items():
-                    if strat.contract.symbol == symbol:
-                        res = strat.parse_trades(float(data['p']), float(data['q']), data['T'])
-                        strat.check_trade(res)
+    def _keepalive_user_stream(self):
+        '''
+        The listenKey expires after 60 minutes without keepalive. The balances are also reconciled with REST
+        at the same time, in case an event was missed.
+        :return:
+        '''
 
-    # subscribe channels to receive data from ws
-    def subscribe_channel(self, contracts: typing.List[Contract], channel: str, reconnection=False):
+        last_keepalive = time.monotonic()
+
+        while not self._user_stream_stopped.wait(RECONCILE_INTERVAL):
+            if not self.reconnect:
+                break
+
+            if self._listen_key is not None and time.monotonic() - last_keepalive >= 30 * 60:
+                self._make_request('PUT', self._listen_key_endpoint(), {'listenKey': self._listen_key})
+                last_keepalive = time.monotonic()
+
+            self.get_balances()
+
+    def stop_user_stream(self):
+        self._user_stream_stopped.set()
+        if self._user_ws is not None:
+            self._user_ws.close()
+
+    def _on_user_stream_open(self, ws):
+        logger.info('Binance user data stream opened')
+
+        # the events missed while disconnected are caught up with a REST snapshot
+        self.get_balances()
+        self.account.stream_connected = True
+
+    def _on_user_stream_close(self, ws, *args, **kwargs):
+        logger.warning('Binance user data stream closed')
+        self.account.stream_connected = False
+
+    def _on_user_message(self, ws, msg: str):
+
+        data = loads(msg)
+        event = data.get('e')
+
+        # Spot: the balances of the assets that changed
+        if event == 'outboundAccountPosition':
+            self.account.update_balances({b['a']: Balance({'free': b['f'], 'locked': b['l']}, self.platform)
+                                          for b in data['B']})
+
+        # Futures: only the wallet balance is sent, the margins are corrected by the periodic REST reconciliation
+        elif event == 'ACCOUNT_UPDATE':
+            balances = dict()
+            for b in data['a']['B']:
+                balance = self.account.get_balance(b['a'])
+                if balance is None:
+                    continue
+                balance = copy.copy(balance)
+                balance.wallet_balance = float(b['wb'])
+                balances[b['a']] = balance
+            self.account.update_balances(balances)
+
+        elif event == 'executionReport':
+            executed_qty = float(data['z'])
+            avg_price = float(data['Z']) / executed_qty if executed_qty > 0 else 0
+            self.account.set_order(OrderStatus({'orderId': data['i'], 'status': data['X'], 'avgPrice': avg_price,
+                                                'executedQty': executed_qty}, self.platform))
+
+        elif event == 'ORDER_TRADE_UPDATE':
+            o = data['o']
+            self.account.set_order(OrderStatus({'orderId': o['i'], 'status': o['X'], 'avgPrice': o['ap'],
+                                                'executedQty': o['z']}, self.platform))
+
+        elif event == 'listenKeyExpired':
+            logger.warning('Binance listenKey expired, reconnecting the user data stream')
+            ws.close()
+
+    # Local order books
+    def subscribe_order_book(self, contract: Contract):
+        '''
+        Start maintaining the local order book of a contract from the @depth@100ms diff stream.
+        The diffs are buffered until the REST snapshot is applied, then applied in sequence.
+        :param contract:
+        :return:
+        '''
 
-        if len(contracts) > 200:
-            logger.warning("Subscribing to more than 200 symbols will most likely fail. "
-                           "Consider subscribing only when adding a symbol to your Watchlist or when starting a "
-                           "strategy for a symbol.")
+        if contract.symbol in self.order_books:
+            return
 
-        data = dict()
-        data['method'] = 'SUBSCRIBE'
-        data['params'] = []
+        self.order_books[contract.symbol] = OrderBook(contract.symbol)
+        self._depth_buffers[contract.symbol] = []
+
+        self.subscribe_channel([contract], 'depth@100ms')
+        self._resync_order_book(contract.symbol)
+
+    def _resync_order_book(self, symbol: str):
+        book = self.order_books.get(symbol)
+        if book is None:
+            return
+
+        with book.lock:
+            book.synced = False
+
+            # the snapshot thread running syncs the book, a gap in its buffered diffs makes it take a new snapshot
+            if symbol in self._resyncing:
+                return
+
+            self._resyncing.add(symbol)
+            self._depth_buffers[symbol] = []
+
+        threading.Thread(target=self._load_order_book_snapshot, args=(symbol,)).start()
+
+    def _load_order_book_snapshot(self, symbol: str):
+        '''
+        Download the snapshot and apply the buffered diffs that follow it, with a new snapshot while the buffered
+        diffs have a gap
+        :param symbol:
+        :return:
+        '''
+
+        endpoint = '/fapi/v1/depth' if self.futures else '/api/v3/depth'
+        synced = False
+
+        try:
+            while not synced:
+                snapshot = self._make_request('GET', endpoint, {'symbol': symbol, 'limit': 1000})
+
+                book = self.order_books.get(symbol)
+
+                if snapshot is None or book is None:
+                    logger.error('Binance: order book snapshot of %s could not be obtained', symbol)
+                    return
+
+                book.apply_snapshot(snapshot['bids'], snapshot['asks'], snapshot['lastUpdateId'], synced=False)
+
+                synced = self._apply_buffered_depth(book)
+
+            logger.info('Binance: %s order book synced (last update id %s)', symbol, book.last_update_id)
+
+        finally:
+            # once synced the flag is cleared with the synced state, a gap right after starts a new snapshot thread
+            if not synced:
+                self._resyncing.discard(symbol)
+
+    def _apply_buffered_depth(self, book: OrderBook) -> bool:
+        '''
+        Apply the diffs buffered since the resync
+        :param book:
+        :return: False if a gap was detected
+        '''
+
+        # the websocket keeps buffering while the buffer is drained, the book is marked synced once it is empty
+        while True:
+            with book.lock:
+                buffered = self._depth_buffers.get(book.symbol, [])
+                self._depth_buffers[book.symbol] = []
+                if len(buffered) == 0:
+                    book.synced = True
+                    self._resyncing.discard(book.symbol)
+                    return True
+
+            for i, event in enumerate(buffered):
+                if not self._apply_depth_update(book, event):
+                    # kept for the next snapshot, the diffs older than it are skipped
+                    with book.lock:
+                        self._depth_buffers[book.symbol] = buffered[i:] + self._depth_buffers.get(book.symbol, [])
+                    return False
+
+    def _on_depth_update(self, data: typing.Dict):
+        symbol = data['s']
+
+        book = self.order_books.get(symbol)
+        if book is None:
+            return
+
+        if not book.synced:
+            with book.lock:
+                if not book.synced:
+                    self._depth_buffers[symbol].append(data)
+                    return
+
+        self._apply_depth_update(book, data)
+
+    def _apply_depth_update(self, book: OrderBook, data: typing.Dict) -> bool:
+        '''
+        Apply a diff if it follows the last update of the book, resync the book when an update is missing
+        :param book:
+        :param data: depthUpdate event, U / u are the first and last update ids, pu the previous u (futures)
+        :return: False if a gap was detected
+        '''
+
+        # older than the snapshot
+        if data['u'] <= book.last_update_id:
+            return True
+
+        if self.futures:
+            in_sequence = data['pu'] == book.last_update_id or data['U'] <= book.last_update_id + 1
+        else:
+            in_sequence = data['U'] <= book.last_update_id + 1
+
+        if not in_sequence:
+            logger.warning('Binance: gap in the %s depth updates (%s after %s), syncing the order book again',
+                           book.symbol, data['U'], book.last_update_id)
+            self._resync_order_book(book.symbol)
+            return False
+
+        book.update(data['b'], data['a'], data['u'])
+
+        return True
+
+    def estimate_slippage(self, contract: Contract, side: str, quantity: float) -> \
+            typing.Union[typing.Tuple[float, float], None]:
+        '''
+        Average fill price and slippage of a market order from the local order book, without REST calls
+        :param contract:
+        :param side: buy or sell
+        :param quantity:
+        :return: (average price, slippage in percent), None if the book is not synced or not deep enough
+        '''
+
+        book = self.order_books.get(contract.symbol)
+        if book is None or not book.synced:
+            return None
+
+        return book.estimate_fill(side, quantity)
+
+    # subscribe channels to receive data from ws
+    # the streams are batched and spread over the stream connections by the BinanceStreamManager
+    def subscribe_channel(self, contracts: typing.List[Contract], channel: str):
+
+        streams = []
 
         if len(contracts) == 0:
-            data['params'].append(channel)
+            streams.append(channel)
         else:
             for contract in contracts:
-                if contract.symbol not in self.ws_subscriptions[channel] or reconnection:
-                    data['params'].append(contract.symbol.lower() + '@' + channel)
-                    if contract.symbol not in self.ws_subscriptions[channel]:
-                        self.ws_subscriptions[channel].append(contract.symbol)
+                if contract.symbol not in self.ws_subscriptions[channel]:
+                    self.ws_subscriptions[channel].append(contract.symbol)
+                    streams.append(contract.symbol.lower() + '@' + channel)
 
-            if len(data['params']) == 0:
-                return
+        if len(streams) == 0:
+            return
 
-        data['id'] = self._ws_id
+        self.streams.subscribe(streams)
+        logger.info("Binance: subscribing to %s %s streams", len(streams), channel)
 
-        try:
-            self.ws.send(json.dumps(data))
-            logger.info("Binance: subscribing to: %s", ','.join(data['params']))
-        except Exception as e:
-            logger.error("Websocket error while subscribing to @bookTicker and @aggTrade: %s", e)
+    def unsubscribe_channel(self, contracts: typing.List[Contract], channel: str):
+
+        streams = []
+
+        for contract in contracts:
+            if contract.symbol in self.ws_subscriptions[channel]:
+                self.ws_subscriptions[channel].remove(contract.symbol)
+                streams.append(contract.symbol.lower() + '@' + channel)
+
+        if len(streams) == 0:
+            return
 
-        self._ws_id += 1
+        self.streams.unsubscribe(streams)
+        logger.info("Binance: unsubscribing from %s %s streams", len(streams), channel)
 
     # calculate the size of the trade and return it
     def get_trade_size(self, contract: Contract, price: float, balance_pct: float):
 
         logger.info('Getting Binance trade size...')
-        balance = self.get_balances()
+        balance = self.cached_balances()
         if balance is not None:
             if contract.quote_asset in balance:
                 if self.futures:
@@ -633,7 +1111,7 @@ class BinanceClient:
         '''
 
         if self.futures:
-            return [(k, v.initial_margin) for k, v in self.get_balances().items()]
+            return [(k, v.initial_margin) for k, v in self.cached_balances().items()]
         else:
-            return [(k, v.free) for k, v in self.get_balances().items() if v.free > 0]
+            return [(k, v.free) for k, v in self.cached_balances().items() if v.free > 0]
 
@@ -0,0 +1,286 @@
+import json
+import logging
+import threading
+import time
+import typing
+
+import websocket
+
+from connectors.decoding import loads, binance_stream_channel
+
+logger = logging.getLogger()
+
+# Streams per connection: the limit is 1024 on Spot and 200 on Futures, 200 also keeps the combined url short
+MAX_STREAMS_PER_CONNECTION = 200
+
+# Binance disconnects a client sending more than 5 (Spot) or 10 (Futures) messages per second on a connection
+CONTROL_MESSAGE_INTERVAL = 0.25
+
+
+class StreamConnection:
+    '''
+    One combined-stream websocket (/stream?streams=a/b/c). The url contains the streams assigned when it connects,
+    so a reconnection restores all of them. Streams added or removed while it is open are sent as batched
+    SUBSCRIBE / UNSUBSCRIBE messages by the manager.
+    '''
+
+    def __init__(self, manager: "BinanceStreamManager", index: int):
+        self.index = index
+        self.streams: typing.Set[str] = set()
+        self.messages = 0
+
+        self._manager = manager
+        self._ws = None
+        self._connected = False
+        self._closed = False
+
+        # Changes not sent yet, only while connected: a reconnection sends everything through the url
+        self._url_streams: typing.Set[str] = set()
+        self._pending_subscribe: typing.Set[str] = set()
+        self._pending_unsubscribe: typing.Set[str] = set()
+
+        self._thread = threading.Thread(target=self._run, name=f'binance_streams_{index}', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def _run(self):
+        while not self._closed:
+            with self._manager.lock:
+                streams = sorted(self.streams)
+                self._url_streams = set(streams)
+
+            if len(streams) > 0:
+                self._ws = websocket.WebSocketApp(self._manager.url + '/stream?streams=' + '/'.join(streams),
+                                                  on_open=self._on_open, on_close=self._on_close,
+                                                  on_error=self._on_error, on_message=self._on_message)
+                try:
+                    self._ws.run_forever()
+                except Exception as e:
+                    logger.error('Binance error in run_forever method of stream connection %s: %s', self.index, e)
+
+            if not self._closed:
+                time.sleep(2)
+
+    def _on_open(self, ws):
+        logger.info('Binance stream connection %s opened with %s streams', self.index, len(self._url_streams))
+
+        # The streams changed between the creation of the url and the opening are sent as messages
+        with self._manager.lock:
+            self._pending_subscribe = self.streams - self._url_streams
+            self._pending_unsubscribe = self._url_streams - self.streams
+            self._connected = True
+
+        self._manager.on_connection_open(self)
+
+    def _on_close(self, ws, *args, **kwargs):
+        logger.warning('Binance stream connection %s closed', self.index)
+        self._connected = False
+
+    def _on_error(self, ws, msg: str):
+        logger.error('Binance stream connection %s error: %s', self.index, msg)
+
+    def _on_message(self, ws, msg: str):
+        self.messages += 1
+
+        recorder = self._manager.recorder
+        if recorder is not None:
+            recorder.record('binance', msg)
+
+        self._manager.dispatch(msg)
+
+    def add(self, stream: str):
+        self.streams.add(stream)
+        if self._connected:
+            self._pending_unsubscribe.discard(stream)
+            self._pending_subscribe.add(stream)
+
+    def remove(self, stream: str):
+        self.streams.discard(stream)
+        if self._connected:
+            self._pending_subscribe.discard(stream)
+            self._pending_unsubscribe.add(stream)
+
+    def flush(self, request_id: int) -> int:
+        '''
+        Send at most one control message, subscriptions first. Called by the manager under its lock.
+        :param request_id:
+        :return: Number of messages sent
+        '''
+
+        if not self._connected or self._ws is None:
+            return 0
+
+        for method, pending in (('SUBSCRIBE', self._pending_subscribe), ('UNSUBSCRIBE', self._pending_unsubscribe)):
+            if len(pending) == 0:
+                continue
+
+            params = sorted(pending)[:MAX_STREAMS_PER_CONNECTION]
+
+            try:
+                self._ws.send(json.dumps({'method': method, 'params': params, 'id': request_id}))
+            except Exception as e:
+                logger.error('Binance stream connection %s error while sending %s: %s', self.index, method, e)
+                return 0
+
+            pending.difference_update(params)
+            logger.info('Binance stream connection %s: %s %s streams', self.index, method.lower(), len(params))
+            return 1
+
+        return 0
+
+    def close(self):
+        self._closed = True
+        if self._ws is not None:
+            self._ws.close()
+
+
+class BinanceStreamManager:
+    '''
+    Spreads the market data streams of a client over as many combined-stream connections as needed.
+    New streams go to the least loaded connection with free capacity, a new connection is opened when all are full.
+    The subscription changes are batched and sent at a rate Binance accepts. When streams are removed, the emptiest
+    connection is merged into the others as soon as the remaining streams fit in one connection less.
+    '''
+
+    def __init__(self, url: str, on_event: typing.Callable[[typing.Dict], None],
+                 on_open: typing.Callable[[typing.List[str]], None] = None,
+                 max_streams: int = MAX_STREAMS_PER_CONNECTION,
+                 raw_handlers: typing.Dict[str, typing.Callable[[str], None]] = None):
+        '''
+        :param url: Websocket root, like wss://stream.binance.com:9443
+        :param on_event: Called with each event, unwrapped from the combined stream message
+        :param on_open: Called with the streams of a connection when it (re)connects
+        :param max_streams: Streams per connection
+        :param raw_handlers: channel (bookTicker...) -> called with the raw message instead of on_event
+        '''
+
+        self.url = url
+        self.max_streams = max_streams
+        self.raw_handlers = raw_handlers or dict()
+
+        # TickRecorder saving the raw messages of all the connections, see connectors/tick_recorder.py
+        self.recorder = None
+        self.lock = threading.Lock()
+
+        self._on_event = on_event
+        self._on_open = on_open
+
+        self._connections: typing.List[StreamConnection] = []
+        self._connection_of: typing.Dict[str, StreamConnection] = dict()
+        self._next_index = 0
+        self._request_id = 1
+
+        self._stopped = threading.Event()
+        self._sender = threading.Thread(target=self._send_pending, name='binance_streams_sender', daemon=True)
+        self._sender.start()
+
+    def dispatch(self, msg: str):
+        '''
+        Handle a raw combined stream message, also called by the replay of recorded messages
+        :param msg:
+        :return:
+        '''
+
+        # The frequent channels have their own decoder, reading the channel from the raw message
+        handler = self.raw_handlers.get(binance_stream_channel(msg))
+        if handler is not None:
+            handler(msg)
+            return
+
+        data = loads(msg)
+
+        # Combined streams wrap the events: {"stream": "btcusdt@bookTicker", "data": {...}}
+        if 'data' in data:
+            self._on_event(data['data'])
+
+    def on_connection_open(self, connection: StreamConnection):
+        if self._on_open is not None:
+            self._on_open(sorted(connection.streams))
+
+    def subscribe(self, streams: typing.Iterable[str]):
+        '''
+        :param streams: Stream names like btcusdt@bookTicker, the ones already subscribed are ignored
+        :return:
+        '''
+
+        new_connections = []
+
+        with self.lock:
+            for stream in streams:
+                if stream in self._connection_of:
+                    continue
+
+                available = [c for c in self._connections if len(c.streams) < self.max_streams]
+
+                if len(available) > 0:
+                    connection = min(available, key=lambda c: len(c.streams))
+                else:
+                    connection = StreamConnection(self, self._next_index)
+                    self._next_index += 1
+                    self._connections.append(connection)
+                    new_connections.append(connection)
+
+                connection.add(stream)
+                self._connection_of[stream] = connection
+
+        # Started once all their streams are assigned, so they connect with a single url
+        for connection in new_connections:
+            connection.start()
+
+    def unsubscribe(self, streams: typing.Iterable[str]):
+        with self.lock:
+            for stream in streams:
+                connection = self._connection_of.pop(stream, None)
+                if connection is not None:
+                    connection.remove(stream)
+
+            self._rebalance()
+
+    def _rebalance(self):
+        '''
+        Close the emptiest connection when the streams fit in fewer connections, its streams move to the others.
+        Called under the lock.
+        :return:
+        '''
+
+        while len(self._connections) > 0:
+            total = len(self._connection_of)
+            needed = -(-total // self.max_streams)
+
+            if len(self._connections) <= needed:
+                return
+
+            emptiest = min(self._connections, key=lambda c: len(c.streams))
+            self._connections.remove(emptiest)
+
+            for stream in sorted(emptiest.streams):
+                connection = min(self._connections, key=lambda c: len(c.streams))
+                connection.add(stream)
+                self._connection_of[stream] = connection
+
+            emptiest.close()
+
+            logger.info('Binance streams rebalanced: %s streams on %s connections', total, len(self._connections))
+
+    def _send_pending(self):
+        while not self._stopped.wait(CONTROL_MESSAGE_INTERVAL):
+            with self.lock:
+                for connection in self._connections:
+                    self._request_id += connection.flush(self._request_id)
+
+    def streams(self) -> typing.Set[str]:
+        with self.lock:
+            return set(self._connection_of.keys())
+
+    def metrics(self) -> typing.Dict:
+        with self.lock:
+            return {'connections': len(self._connections), 'streams': len(self._connection_of),
+                    'streams_per_connection': [len(c.streams) for c in self._connections],
+                    'messages_per_connection': [c.messages for c in self._connections]}
+
+    def close(self):
+        self._stopped.set()
+        with self.lock:
+            for connection in self._connections:
+                connection.close()
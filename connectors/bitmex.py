@@ -1,5 +1,4 @@
 import logging
-import requests
 import time
 import typing
 import collections
@@ -12,26 +11,47 @@ import hashlib
 import websocket
 import json
 
-import dateutil.parser
+import datetime
 
 import threading
 
+from connectors.account_state import AccountState
+from connectors.decoding import loads, bitmex_table, decode_bitmex_quotes, decode_bitmex_trades
+from connectors.http_session import PooledSession, DEFAULT_POOL_SIZE, DEFAULT_TIMEOUT
+from connectors.order_tracker import OrderTracker
+from connectors.rate_limiter import BACKGROUND_BUDGET_SHARE, bitmex_rate_limiter
+from database.candle_archive import CandleArchive
+from database.candles_database import CandlesDatabase
+from Trading.execution import SymbolExecutor
+from Trading.market_data import MarketDataHub
 from Trading.models import *
+from Trading.order_book import OrderBook
+from Trading.utils import iso_to_ms
 
 from Trading.strategies import TechnicalStrategy, BreakoutStrategy
 
 
 logger = logging.getLogger()
 
+# Tables of the authenticated connection
+PRIVATE_TABLES = ("margin", "order", "execution")
+
 
 class BitmexClient:
-    def __init__(self, public_key: str, secret_key: str, testnet: bool):
+    def __init__(self, public_key: str, secret_key: str, testnet: bool, pool_size: int = DEFAULT_POOL_SIZE,
+                 timeout=DEFAULT_TIMEOUT, strategy_workers: int = 4, candles_store: CandlesDatabase = None,
+                 candle_archive: CandleArchive = None):
 
         """
         See comments in the Binance connector.
         :param public_key:
         :param secret_key:
         :param testnet:
+        :param pool_size: Number of keep-alive connections kept by the HTTP session
+        :param timeout: (connect, read) timeout in seconds applied to every REST call
+        :param strategy_workers: Size of the thread pool running the strategies
+        :param candles_store: Candles database of the histories, the default one (candles.db) if None
+        :param candle_archive: Archive of the closed candles, the default one (candle_archive/) if None
         """
 
         self.futures = True
@@ -48,14 +68,43 @@ class BitmexClient:
         self._public_key = public_key
         self._secret_key = secret_key
 
+        self._session = PooledSession(self._base_url, pool_size=pool_size, timeout=timeout)
+        self._rate_limiter = bitmex_rate_limiter()
+
         self.ws: websocket.WebSocketApp
         self.reconnect = True
+        self.ws_connected = False
+
+        # Symbol-scoped topics (trade:XBTUSD...), subscribed again when the websocket reconnects
+        self.ws_subscriptions = {'instrument': [], 'quote': [], 'trade': []}
+
+        # Rows received per table, and rows actually used by the watchlist, the strategies or the account
+        self._stream_stats = {'messages': 0, 'bytes': 0, 'received': collections.Counter(),
+                              'used': collections.Counter()}
+
+        # TickRecorder saving the raw market data messages, see connectors/tick_recorder.py
+        self.recorder = None
 
         self.contracts = self.get_contracts()
-        self.balances = self.get_balances()
+
+        # Balances and orders updated by the authenticated margin / order / execution tables
+        self.account = AccountState()
+        self._margin_rows: typing.Dict[str, typing.Dict] = dict()
+        self._order_rows: typing.Dict[str, typing.Dict] = dict()
+
+        self.get_balances()
 
         self.prices = dict()
+
+        # Local order books built from the orderBookL2 deltas, the updates identify the levels by id only
+        self.order_books: typing.Dict[str, OrderBook] = dict()
+        self._book_levels: typing.Dict[str, typing.Dict[int, typing.Tuple[str, float]]] = dict()
+
         self.strategies: typing.Dict[int, typing.Union[TechnicalStrategy, BreakoutStrategy]] = dict()
+        self._strategies_by_symbol: typing.Dict[str, typing.Tuple[typing.Union[TechnicalStrategy, BreakoutStrategy], ...]] = dict()
+        self._executor = SymbolExecutor(strategy_workers, 'bitmex_strategies')
+        self.market_data = MarketDataHub(self, candles_store, candle_archive)
+        self.order_tracker = OrderTracker(self, self._executor)
 
         self.logs = []
 
@@ -75,42 +124,49 @@ class BitmexClient:
 
     def _make_request(self, method: str, endpoint: str, data: typing.Dict):
 
-        headers = dict()
-        expires = str(int(time.time()) + 5)
-        headers['api-expires'] = expires
-        headers['api-key'] = self._public_key
-        headers['api-signature'] = self._generate_signature(method, endpoint, expires, data)
+        if method not in ("GET", "POST", "DELETE"):
+            raise ValueError()
 
-        if method == "GET":
-            try:
-                response = requests.get(self._base_url + endpoint, params=data, headers=headers)
-            except Exception as e:
-                logger.error("Connection error while making %s request to %s: %s", method, endpoint, e)
-                return None
+        def send():
+            # Signed again on every attempt, the rate limiter can delay the request past api-expires
+            headers = dict()
+            expires = str(int(time.time()) + 5)
+            headers['api-expires'] = expires
+            headers['api-key'] = self._public_key
+            headers['api-signature'] = self._generate_signature(method, endpoint, expires, data)
 
-        elif method == "POST":
-            try:
-                response = requests.post(self._base_url + endpoint, params=data, headers=headers)
-            except Exception as e:
-                logger.error("Connection error while making %s request to %s: %s", method, endpoint, e)
-                return None
+            return self._session.request(method, endpoint, params=data, headers=headers)
 
-        elif method == "DELETE":
-            try:
-                response = requests.delete(self._base_url + endpoint, params=data, headers=headers)
-            except Exception as e:
-                logger.error("Connection error while making %s request to %s: %s", method, endpoint, e)
-                return None
-        else:
-            raise ValueError()
+        try:
+            response = self._rate_limiter.execute(method, endpoint, send, coalesce_key=(endpoint, urlencode(data)),
+                                                  params=data)
+        except Exception as e:
+            logger.error("Connection error while making %s request to %s: %s", method, endpoint, e)
+            return None
 
         if response.status_code == 200:
-            return response.json()
+            return loads(response.content)
         else:
             logger.error("Error while making %s request to %s: %s (error code %s)",
                          method, endpoint, response.json(), response.status_code)
             return None
 
+    def connection_stats(self) -> typing.Dict[str, int]:
+        return self._session.connection_stats()
+
+    def rate_limit_metrics(self) -> typing.Dict:
+        return self._rate_limiter.metrics()
+
+    def background_requests(self, budget_share: float = BACKGROUND_BUDGET_SHARE):
+        '''
+        Context of the bulk downloads (history backfill): the requests of the current thread wait behind the other
+        ones and use at most budget_share of the rate limits, see RateLimiter.background()
+        :param budget_share:
+        :return:
+        '''
+
+        return self._rate_limiter.background(budget_share)
+
     def get_contracts(self) -> typing.Dict[str, Contract]:
 
         instruments = self._make_request("GET", "/api/v1/instrument/active", dict())
@@ -135,9 +191,38 @@ class BitmexClient:
             for a in margin_data:
                 balances[a['currency']] = Balance(a, "bitmex")
 
+            self.account.set_balances(balances)
+
         return balances
 
-    def get_historical_candles(self, contract: Contract, timeframe: str) -> typing.List[Candle]:
+    def cached_balances(self) -> typing.Dict[str, Balance]:
+
+        """
+        Balances from the websocket margin table, read through REST only when the cache can't be trusted.
+        :return:
+        """
+
+        balances = self.account.balances()
+        if balances is None:
+            balances = self.get_balances()
+        return balances
+
+    @property
+    def balances(self) -> typing.Dict[str, Balance]:
+        return self.cached_balances()
+
+    def get_historical_candles(self, contract: Contract, timeframe: str, start_time: int = None,
+                               end_time: int = None) -> typing.List[Candle]:
+
+        """
+        Get the most recent candles, or the candles from start_time if it is given.
+        :param contract:
+        :param timeframe:
+        :param start_time: Open time of the first candle, in milliseconds
+        :param end_time: Open time of the last candle, in milliseconds
+        :return:
+        """
+
         data = dict()
 
         data['symbol'] = contract.symbol
@@ -146,17 +231,22 @@ class BitmexClient:
         data['count'] = 500
         data['reverse'] = True
 
-        raw_candles = self._make_request("GET", "/api/v1/trade/bucketed", data)
+        if start_time is not None:
+            # Bitmex buckets are timestamped with their close time
+            close_time = start_time + BITMEX_TF_MINUTES[timeframe] * 60 * 1000
+            data['startTime'] = datetime.datetime.fromtimestamp(close_time / 1000, datetime.timezone.utc).isoformat()
+            data['reverse'] = False
 
-        candles = []
+        if end_time is not None:
+            close_time = end_time + BITMEX_TF_MINUTES[timeframe] * 60 * 1000
+            data['endTime'] = datetime.datetime.fromtimestamp(close_time / 1000, datetime.timezone.utc).isoformat()
 
-        if raw_candles is not None:
-            for c in reversed(raw_candles):
-                if c['open'] is None or c['close'] is None:  # Some candles returned by Bitmex miss data
-                    continue
-                candles.append(Candle(c, timeframe, "bitmex"))
+        raw_candles = self._make_request("GET", "/api/v1/trade/bucketed", data)
+
+        if raw_candles is None:
+            return []
 
-        return candles
+        return Candle.from_buckets(reversed(raw_candles) if data['reverse'] else raw_candles, timeframe)
 
     def place_order(self, contract: Contract, order_type: str, quantity: int, side: str, price=None, tif=None) -> OrderStatus:
         data = dict()
@@ -176,6 +266,10 @@ class BitmexClient:
 
         if order_status is not None:
             order_status = OrderStatus(order_status, "bitmex")
+            self.account.set_order(order_status)
+
+            if not self.account.stream_connected:
+                self.account.invalidate_balances()
 
         return order_status
 
@@ -187,11 +281,16 @@ class BitmexClient:
 
         if order_status is not None:
             order_status = OrderStatus(order_status[0], "bitmex")
+            self.account.set_order(order_status)
 
         return order_status
 
     def get_order_status(self, contract: Contract, order_id: str) -> OrderStatus:
 
+        cached_status = self.account.order(order_id)
+        if cached_status is not None:
+            return cached_status
+
         data = dict()
         data['symbol'] = contract.symbol
         data['reverse'] = True
@@ -201,7 +300,33 @@ class BitmexClient:
         if order_status is not None:
             for order in order_status:
                 if order['orderID'] == order_id:
-                    return OrderStatus(order, "bitmex")
+                    order_status = OrderStatus(order, "bitmex")
+                    self.account.set_order(order_status)
+                    return order_status
+
+    def get_orders_status(self, orders: typing.Dict[str, Contract]) -> typing.Dict[str, OrderStatus]:
+
+        """
+        Statuses of several orders for the OrderTracker, with a single request filtered by order ID.
+        :param orders: order ID -> Contract
+        :return:
+        """
+
+        data = dict()
+        data['filter'] = json.dumps({"orderID": list(orders.keys())})
+        data['count'] = len(orders)
+
+        order_statuses = self._make_request("GET", "/api/v1/order", data)
+
+        statuses = dict()
+
+        if order_statuses is not None:
+            for order in order_statuses:
+                order_status = OrderStatus(order, "bitmex")
+                self.account.set_order(order_status)
+                statuses[order_status.order_id] = order_status
+
+        return statuses
 
     def _start_ws(self):
         self.ws = websocket.WebSocketApp(self._wss_url, on_open=self._on_open, on_close=self._on_close,
@@ -220,84 +345,361 @@ class BitmexClient:
     def _on_open(self, ws):
         logger.info("Bitmex connection opened")
 
-        self.subscribe_channel("instrument")
-        self.subscribe_channel("trade")
+        self.ws_connected = True
+
+        topics = [f"{channel}:{symbol}" for channel, symbols in self.ws_subscriptions.items() for symbol in symbols]
+        topics += [f"orderBookL2:{symbol}" for symbol in self.order_books]
+
+        self._send_topics("subscribe", topics)
+
+        if self._public_key:
+            self._authenticate()
+            self._send_topics("subscribe", list(PRIVATE_TABLES))
+
+    def _authenticate(self):
+
+        """
+        The private tables (margin, order, execution) need an authenticated connection.
+        """
+
+        expires = str(int(time.time()) + 5)
+        signature = self._generate_signature("GET", "/realtime", expires, dict())
+
+        try:
+            self.ws.send(json.dumps({"op": "authKeyExpires", "args": [self._public_key, int(expires), signature]}))
+        except Exception as e:
+            logger.error("Websocket error while authenticating on Bitmex: %s", e)
 
     def _on_close(self, ws):
         logger.warning("Bitmex Websocket connection closed")
+        self.ws_connected = False
+        self.account.stream_connected = False
+
+        for book in self.order_books.values():
+            book.synced = False
 
     def _on_error(self, ws, msg: str):
         logger.error("Bitmex connection error: %s", msg)
 
     def _on_message(self, ws, msg: str):
 
-        data = json.loads(msg)
+        self._stream_stats['messages'] += 1
+        self._stream_stats['bytes'] += len(msg)
+
+        table = bitmex_table(msg)
+
+        # The account tables are not recorded, only the market data is replayed
+        if self.recorder is not None and table not in PRIVATE_TABLES:
+            self.recorder.record('bitmex', msg)
+
+        # instrument (watchlist) and quote (strategies) both carry the best bid and ask
+        if table in ("instrument", "quote"):
+            self._on_quotes(table, decode_bitmex_quotes(msg))
+            return
+
+        if table == "trade":
+            self._on_trades(decode_bitmex_trades(msg))
+            return
+
+        data = loads(msg)
 
         if "table" in data:
-            if data['table'] == "instrument":
+            table = data['table']
+            self._stream_stats['received'][table] += len(data['data'])
 
-                for d in data['data']:
+            # the order books and the private tables only receive the data of the subscribed symbols / account
+            self._stream_stats['used'][table] += len(data['data'])
 
-                    symbol = d['symbol']
+            if data['table'] == "orderBookL2":
+                self._on_order_book_l2(data)
 
-                    if symbol not in self.prices:
-                        self.prices[symbol] = {'bid': None, 'ask': None}
+            if data['table'] == "margin":
+                self._on_margin(data)
 
-                    if 'bidPrice' in d:
-                        self.prices[symbol]['bid'] = d['bidPrice']
-                    if 'askPrice' in d:
-                        self.prices[symbol]['ask'] = d['askPrice']
+            if data['table'] in ("order", "execution"):
+                self._on_order(data)
 
-                    # PNL Calculation
+    def _on_quotes(self, table: str,
+                   quotes: typing.List[typing.Tuple[str, typing.Optional[float], typing.Optional[float]]]):
+        self._stream_stats['received'][table] += len(quotes)
 
-                    try:
-                        for b_index, strat in self.strategies.items():
-                            if strat.contract.symbol == symbol:
-                                for trade in strat.trades:
-                                    if trade.status == "open" and trade.entry_price is not None:
+        for symbol, bid, ask in quotes:
 
-                                        if trade.side == "long":
-                                            price = self.prices[symbol]['bid']
-                                        else:
-                                            price = self.prices[symbol]['ask']
-                                        multiplier = trade.contract.multiplier
+            if symbol not in self.ws_subscriptions[table]:
+                continue
 
-                                        if trade.contract.inverse:
-                                            if trade.side == "long":
-                                                trade.pnl = (1 / trade.entry_price - 1 / price) * multiplier * trade.quantity
-                                            elif trade.side == "short":
-                                                trade.pnl = (1 / price - 1 / trade.entry_price) * multiplier * trade.quantity
-                                        else:
-                                            if trade.side == "long":
-                                                trade.pnl = (price - trade.entry_price) * multiplier * trade.quantity
-                                            elif trade.side == "short":
-                                                trade.pnl = (trade.entry_price - price) * multiplier * trade.quantity
-                    except RuntimeError as e:
-                        logger.error("Error while looping through the Bitmex strategies: %s", e)
+            self._stream_stats['used'][table] += 1
 
-            if data['table'] == "trade":
+            if symbol not in self.prices:
+                self.prices[symbol] = {'bid': None, 'ask': None}
 
-                for d in data['data']:
+            if bid is not None:
+                self.prices[symbol]['bid'] = bid
+            if ask is not None:
+                self.prices[symbol]['ask'] = ask
 
-                    symbol = d['symbol']
+            # PNL Calculation
 
-                    ts = int(dateutil.parser.isoparse(d['timestamp']).timestamp() * 1000)
+            if symbol in self._strategies_by_symbol:
+                self._executor.submit(symbol, self._update_pnl, symbol)
 
-                    for key, strat in self.strategies.items():
-                        if strat.contract.symbol == symbol:
-                            res = strat.parse_trades(float(d['price']), float(d['size']), ts)
-                            strat.check_trade(res)
+    def _on_trades(self, trades: typing.List[typing.Tuple[str, float, float, str]]):
+        self._stream_stats['received']['trade'] += len(trades)
 
-    def subscribe_channel(self, topic: str):
-        data = dict()
-        data['op'] = "subscribe"
-        data['args'] = []
-        data['args'].append(topic)
+        for symbol, price, size, timestamp in trades:
+
+            if symbol not in self._strategies_by_symbol:
+                continue
+
+            self._stream_stats['used']['trade'] += 1
+
+            self._executor.submit(symbol, self._process_trade, symbol, price, size, iso_to_ms(timestamp))
+
+    def subscribe_order_book(self, contract: Contract):
+
+        """
+        Start maintaining the local order book of a contract, the partial message sent after the subscription
+        is the snapshot the deltas apply to.
+        """
+
+        if contract.symbol in self.order_books:
+            return
+
+        self.order_books[contract.symbol] = OrderBook(contract.symbol)
+        self._book_levels[contract.symbol] = dict()
+
+        self._send_topics("subscribe", [f"orderBookL2:{contract.symbol}"])
+
+    def _on_order_book_l2(self, data: typing.Dict):
+
+        """
+        Apply the partial / insert / update / delete actions to the books. Only the partial and insert rows always
+        have the price, it is remembered by level id for the updates and deletes.
+        """
+
+        action = data['action']
+
+        rows_by_symbol = collections.defaultdict(list)
+        for d in data['data']:
+            rows_by_symbol[d['symbol']].append(d)
+
+        for symbol, rows in rows_by_symbol.items():
+            book = self.order_books.get(symbol)
+            if book is None:
+                continue
+
+            levels = self._book_levels[symbol]
+            bids = []
+            asks = []
+
+            if action == "partial":
+                levels.clear()
+
+            for d in rows:
+                if action == "delete":
+                    side, price = levels.pop(d['id'], (d['side'], d.get('price')))
+                    size = 0
+                else:
+                    side, price = levels.get(d['id'], (d['side'], d.get('price')))
+                    price = d.get('price', price)
+                    levels[d['id']] = (side, price)
+                    size = d['size']
+
+                if price is None:
+                    continue
+
+                (bids if side == "Buy" else asks).append((price, size))
+
+            if action == "partial":
+                book.apply_snapshot(bids, asks)
+            elif book.synced:
+                book.update(bids, asks)
+
+    def estimate_slippage(self, contract: Contract, side: str, quantity: float) -> \
+            typing.Union[typing.Tuple[float, float], None]:
+
+        """
+        Average fill price and slippage of a market order from the local order book, without REST calls.
+        :return: (average price, slippage in percent), None if the book is not synced or not deep enough
+        """
+
+        book = self.order_books.get(contract.symbol)
+        if book is None or not book.synced:
+            return None
+
+        return book.estimate_fill(side, quantity)
+
+    def _on_margin(self, data: typing.Dict):
+
+        """
+        The updates only contain the fields that changed, they are merged into the last row of the currency.
+        The partial message is the complete snapshot sent after the subscription.
+        """
+
+        if data['action'] == "partial":
+            self._margin_rows = dict()
+
+        balances = dict()
+
+        for d in data['data']:
+            row = self._margin_rows.setdefault(d['currency'], dict())
+            row.update(d)
+
+            try:
+                balances[d['currency']] = Balance(row, "bitmex")
+            except (KeyError, TypeError):  # Not all the fields received yet
+                continue
+
+        if data['action'] == "partial":
+            self.account.set_balances(balances)
+            self.account.stream_connected = True
+        else:
+            self.account.update_balances(balances)
+
+    def _on_order(self, data: typing.Dict):
+
+        """
+        The order table reports the status changes, the execution table the fills with the average price.
+        """
+
+        for d in data['data']:
+            if 'orderID' not in d:
+                continue
+
+            row = self._order_rows.setdefault(d['orderID'], dict())
+            row.update({k: v for k, v in d.items() if v is not None})
+
+            if 'ordStatus' in row and 'cumQty' in row:
+                row.setdefault('avgPx', None)
+                self.account.set_order(OrderStatus(row, "bitmex"))
+
+                if row['ordStatus'].lower() in ("filled", "canceled", "rejected"):
+                    self._order_rows.pop(d['orderID'], None)
+
+    def _update_pnl(self, symbol: str):
+        for strat in self._strategies_by_symbol.get(symbol, ()):
+            for trade in strat.trades:
+                if trade.status == "open" and trade.entry_price is not None:
+
+                    if trade.side == "long":
+                        price = self.prices[symbol]['bid']
+                    else:
+                        price = self.prices[symbol]['ask']
+                    multiplier = trade.contract.multiplier
+
+                    if trade.contract.inverse:
+                        if trade.side == "long":
+                            trade.pnl = (1 / trade.entry_price - 1 / price) * multiplier * trade.quantity
+                        elif trade.side == "short":
+                            trade.pnl = (1 / price - 1 / trade.entry_price) * multiplier * trade.quantity
+                    else:
+                        if trade.side == "long":
+                            trade.pnl = (price - trade.entry_price) * multiplier * trade.quantity
+                        elif trade.side == "short":
+                            trade.pnl = (trade.entry_price - price) * multiplier * trade.quantity
+
+    def _process_trade(self, symbol: str, price: float, size: float, timestamp: int):
+        self.market_data.on_trade(symbol, price, size, timestamp)
+
+    def executor_metrics(self) -> typing.Dict:
+        return self._executor.metrics()
+
+    def stop_strategies(self):
+        self.order_tracker.stop()
+        self._executor.shutdown()
+
+    def add_strategy(self, b_index: int, strategy: typing.Union[TechnicalStrategy, BreakoutStrategy]) -> bool:
+        if not self.market_data.subscribe(strategy):
+            return False
+
+        self.strategies[b_index] = strategy
+        self.subscribe_order_book(strategy.contract)
+        self.subscribe_channel([strategy.contract], "trade")
+        self.subscribe_channel([strategy.contract], "quote")
+
+        symbol = strategy.contract.symbol
+        self._strategies_by_symbol[symbol] = self._strategies_by_symbol.get(symbol, ()) + (strategy,)
+
+        return True
+
+    def remove_strategy(self, b_index: int):
+        strategy = self.strategies.pop(b_index, None)
+        if strategy is None:
+            return
+
+        self.market_data.unsubscribe(strategy)
+
+        symbol = strategy.contract.symbol
+        remaining = tuple(s for s in self._strategies_by_symbol.get(symbol, ()) if s is not strategy)
+
+        if remaining:
+            self._strategies_by_symbol[symbol] = remaining
+        else:
+            self._strategies_by_symbol.pop(symbol, None)
+
+            self.unsubscribe_channel([strategy.contract], "trade")
+            self.unsubscribe_channel([strategy.contract], "quote")
+
+            if self.order_books.pop(symbol, None) is not None:
+                self._book_levels.pop(symbol, None)
+                self._send_topics("unsubscribe", [f"orderBookL2:{symbol}"])
+
+    def subscribe_channel(self, contracts: typing.List[Contract], channel: str):
+
+        """
+        Subscribe to the symbol-scoped topics of a channel (instrument, quote or trade), e.g. trade:XBTUSD,
+        in a single message.
+        """
+
+        topics = []
+
+        for contract in contracts:
+            if contract.symbol not in self.ws_subscriptions[channel]:
+                self.ws_subscriptions[channel].append(contract.symbol)
+                topics.append(f"{channel}:{contract.symbol}")
+
+        self._send_topics("subscribe", topics)
+
+    def unsubscribe_channel(self, contracts: typing.List[Contract], channel: str):
+        topics = []
+
+        for contract in contracts:
+            if contract.symbol in self.ws_subscriptions[channel]:
+                self.ws_subscriptions[channel].remove(contract.symbol)
+                topics.append(f"{channel}:{contract.symbol}")
+
+        self._send_topics("unsubscribe", topics)
+
+    def _send_topics(self, op: str, topics: typing.List[str]):
+
+        """
+        Send a subscribe / unsubscribe message. While disconnected nothing is sent, _on_open subscribes to all the
+        topics again.
+        """
+
+        if len(topics) == 0 or not self.ws_connected:
+            return
 
         try:
-            self.ws.send(json.dumps(data))
+            self.ws.send(json.dumps({"op": op, "args": topics}))
         except Exception as e:
-            logger.error("Websocket error while subscribing to %s: %s", topic, e)
+            logger.error("Websocket error while sending %s to %s: %s", op, topics, e)
+
+    def stream_metrics(self) -> typing.Dict:
+
+        """
+        Websocket traffic since the start: messages, bytes, and rows received versus used per table.
+        """
+
+        received = dict(self._stream_stats['received'])
+        used = dict(self._stream_stats['used'])
+
+        total_received = sum(received.values())
+        total_used = sum(used.values())
+
+        return {'messages': self._stream_stats['messages'], 'bytes': self._stream_stats['bytes'],
+                'received': received, 'used': used,
+                'used_pct': round(total_used / total_received * 100, 2) if total_received > 0 else None}
 
     def get_trade_size(self, contract: Contract, price: float, balance_pct: float):
 
@@ -310,7 +712,7 @@ class BitmexClient:
         :return:
         """
 
-        balance = self.get_balances()
+        balance = self.cached_balances()
         if balance is not None:
             if 'XBt' in balance:
                 balance = balance['XBt'].wallet_balance
@@ -0,0 +1,153 @@
+import json
+import typing
+
+# Optional faster decoders, the standard json module is used when none is installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+if orjson is not None:
+    BACKEND = 'orjson'
+    loads = orjson.loads
+elif msgspec is not None:
+    BACKEND = 'msgspec'
+    loads = msgspec.json.decode
+else:
+    BACKEND = 'json'
+    loads = json.loads
+
+
+# Typed decoders of the most frequent websocket messages. With msgspec the messages are decoded straight into
+# structs containing only the fields used, without building the dicts. Without msgspec they go through loads().
+
+if msgspec is not None:
+
+    class _BinanceBookTicker(msgspec.Struct):
+        s: str
+        b: str
+        a: str
+
+    class _BinanceAggTrade(msgspec.Struct):
+        s: str
+        p: str
+        q: str
+        T: int
+
+    class _BitmexTrade(msgspec.Struct):
+        symbol: str
+        price: float
+        size: float
+        timestamp: str
+
+    class _BitmexQuote(msgspec.Struct):
+        symbol: str
+        bidPrice: typing.Optional[float] = None
+        askPrice: typing.Optional[float] = None
+
+    class _BinanceBookTickerMessage(msgspec.Struct):
+        data: _BinanceBookTicker
+
+    class _BinanceAggTradeMessage(msgspec.Struct):
+        data: _BinanceAggTrade
+
+    class _BitmexTradeMessage(msgspec.Struct):
+        data: typing.List[_BitmexTrade]
+
+    class _BitmexQuoteMessage(msgspec.Struct):
+        data: typing.List[_BitmexQuote]
+
+    _book_ticker_decoder = msgspec.json.Decoder(_BinanceBookTickerMessage)
+    _agg_trade_decoder = msgspec.json.Decoder(_BinanceAggTradeMessage)
+    _bitmex_trade_decoder = msgspec.json.Decoder(_BitmexTradeMessage)
+    _bitmex_quote_decoder = msgspec.json.Decoder(_BitmexQuoteMessage)
+
+
+def binance_stream_channel(msg: str) -> typing.Union[str, None]:
+    '''
+    Channel of a combined stream message without decoding it: {"stream":"btcusdt@bookTicker","data":{...}}
+    :param msg:
+    :return: bookTicker, aggTrade, depth@100ms... None for the other messages (subscription results)
+    '''
+
+    if not msg.startswith('{"stream":"'):
+        return None
+
+    end = msg.find('"', 11)
+    at = msg.find('@', 11, end)
+
+    if at == -1:
+        return None
+
+    return msg[at + 1:end]
+
+
+def bitmex_table(msg: str) -> typing.Union[str, None]:
+    '''
+    Table of a Bitmex data message without decoding it: {"table":"trade","action":"insert","data":[...]}
+    :param msg:
+    :return:
+    '''
+
+    if not msg.startswith('{"table":"'):
+        return None
+
+    return msg[10:msg.find('"', 10)]
+
+
+def decode_binance_book_ticker(msg: str) -> typing.Tuple[str, float, float]:
+    '''
+    :param msg: Combined stream bookTicker message
+    :return: symbol, best bid, best ask
+    '''
+
+    if msgspec is not None:
+        d = _book_ticker_decoder.decode(msg).data
+        return d.s, float(d.b), float(d.a)
+
+    d = loads(msg)['data']
+    return d['s'], float(d['b']), float(d['a'])
+
+
+def decode_binance_agg_trade(msg: str) -> typing.Tuple[str, float, float, int]:
+    '''
+    :param msg: Combined stream aggTrade message
+    :return: symbol, price, quantity, trade time
+    '''
+
+    if msgspec is not None:
+        d = _agg_trade_decoder.decode(msg).data
+        return d.s, float(d.p), float(d.q), d.T
+
+    d = loads(msg)['data']
+    return d['s'], float(d['p']), float(d['q']), d['T']
+
+
+def decode_bitmex_trades(msg: str) -> typing.List[typing.Tuple[str, float, float, str]]:
+    '''
+    :param msg: trade table message
+    :return: symbol, price, size, ISO timestamp of each trade
+    '''
+
+    if msgspec is not None:
+        return [(d.symbol, d.price, d.size, d.timestamp) for d in _bitmex_trade_decoder.decode(msg).data]
+
+    return [(d['symbol'], float(d['price']), float(d['size']), d['timestamp']) for d in loads(msg)['data']]
+
+
+def decode_bitmex_quotes(msg: str) -> typing.List[typing.Tuple[str, typing.Optional[float], typing.Optional[float]]]:
+    '''
+    :param msg: quote or instrument table message
+    :return: symbol, bid, ask of each row, None for the prices not updated by the row
+    '''
+
+    if msgspec is not None:
+        return [(d.symbol, d.bidPrice, d.askPrice) for d in _bitmex_quote_decoder.decode(msg).data]
+
+    return [(d['symbol'], d.get('bidPrice'), d.get('askPrice')) for d in loads(msg)['data']]
@@ -0,0 +1,85 @@
+import typing
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# (connect, read) timeouts in seconds used for every REST call unless the client overrides them
+DEFAULT_TIMEOUT = (3.05, 10)
+DEFAULT_POOL_SIZE = 10
+
+
+class PooledSession:
+    '''
+    One long-lived requests.Session per client, shared by the signed and the public endpoints.
+    The underlying urllib3 pool keeps the connections alive, so only the first request (or a request made
+    while all pooled connections are busy) pays for the TCP and TLS handshakes.
+    '''
+
+    def __init__(self, base_url: str, headers: typing.Dict = None, pool_size: int = DEFAULT_POOL_SIZE,
+                 timeout: typing.Union[float, typing.Tuple[float, float]] = DEFAULT_TIMEOUT):
+        self._base_url = base_url
+        self.timeout = timeout
+
+        self._session = requests.Session()
+        self._session.headers.update({'Connection': 'keep-alive'})
+
+        if headers is not None:
+            self._session.headers.update(headers)
+
+        # pool_connections is the number of hosts cached, pool_maxsize the number of connections kept per host
+        self._adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size)
+        self._session.mount('https://', self._adapter)
+        self._session.mount('http://', self._adapter)
+
+    def request(self, method: str, url: str, params: typing.Dict = None, headers: typing.Dict = None,
+                timeout=None) -> requests.Response:
+        '''
+        Send a request through the pooled session
+        :param method: GET, POST, PUT or DELETE
+        :param url: full url, or an endpoint relative to the base url
+        :param params:
+        :param headers: headers added to the session ones for this request only
+        :param timeout: overrides the session timeout for this request only
+        :return:
+        '''
+
+        if not url.startswith('http'):
+            url = self._base_url + url
+
+        return self._session.request(method, url, params=params, headers=headers,
+                                     timeout=self.timeout if timeout is None else timeout)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url: str, **kwargs) -> requests.Response:
+        return self.request('PUT', url, **kwargs)
+
+    def delete(self, url: str, **kwargs) -> requests.Response:
+        return self.request('DELETE', url, **kwargs)
+
+    def connection_stats(self) -> typing.Dict[str, int]:
+        '''
+        Count the connections opened by the pool against the requests sent through it.
+        Every request that did not need a new connection reused a kept-alive one.
+        :return: {'requests': ..., 'new_connections': ..., 'reused_connections': ...}
+        '''
+
+        new_connections = 0
+        total_requests = 0
+
+        for key in self._adapter.poolmanager.pools.keys():
+            pool = self._adapter.poolmanager.pools.get(key)
+            if pool is None:
+                continue
+            new_connections += pool.num_connections
+            total_requests += pool.num_requests
+
+        return {'requests': total_requests, 'new_connections': new_connections,
+                'reused_connections': max(total_requests - new_connections, 0)}
+
+    def close(self):
+        self._session.close()
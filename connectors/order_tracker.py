@@ -0,0 +1,167 @@
+import logging
+import threading
+import time
+import typing
+
+from connectors.account_state import FINAL_ORDER_STATUSES
+from Trading.execution import SymbolExecutor
+from Trading.models import Contract, OrderStatus
+
+logger = logging.getLogger()
+
+# Poll interval in seconds right after an order is tracked, doubled after every poll without change
+MIN_POLL_INTERVAL = 0.5
+MAX_POLL_INTERVAL = 8.0
+
+# When the user data stream is connected the cache is checked at MIN_POLL_INTERVAL and REST only at this interval
+STREAM_POLL_INTERVAL = 30.0
+
+
+class _TrackedOrder:
+    def __init__(self, contract: Contract, order_id, callback: typing.Callable[[OrderStatus], None]):
+        self.contract = contract
+        self.order_id = order_id
+        self.callback = callback
+        self.status = None
+
+
+class OrderTracker:
+    '''
+    One thread per client following all the pending orders, instead of one Timer per order.
+    Every poll reads the statuses of all the orders at once (client.get_orders_status()), the callbacks are called
+    on each status change until the order is filled, canceled, rejected or expired. The interval grows while nothing
+    changes and is reset when a new order is tracked.
+    '''
+
+    def __init__(self, client, executor: SymbolExecutor = None):
+        '''
+        :param client: BinanceClient or BitmexClient
+        :param executor: Runs the callbacks in order with the other tasks of the symbol, on the tracker thread if None
+        '''
+
+        self._client = client
+        self._executor = executor
+
+        self._orders: typing.Dict[typing.Union[int, str], _TrackedOrder] = dict()
+        self._condition = threading.Condition()
+
+        self._interval = MIN_POLL_INTERVAL
+        self._last_rest_poll = 0.0
+        self._thread = None
+        self._stopped = False
+
+        self.polls = 0
+
+    def track(self, contract: Contract, order_id, callback: typing.Callable[[OrderStatus], None]):
+        '''
+        Follow an order until it is closed
+        :param contract:
+        :param order_id:
+        :param callback: Called with the new OrderStatus every time the status of the order changes
+        :return:
+        '''
+
+        with self._condition:
+            if self._stopped:
+                return
+
+            self._orders[order_id] = _TrackedOrder(contract, order_id, callback)
+            self._interval = MIN_POLL_INTERVAL
+            self._last_rest_poll = 0.0
+
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='order_tracker', daemon=True)
+                self._thread.start()
+
+            self._condition.notify()
+
+    def untrack(self, order_id):
+        with self._condition:
+            self._orders.pop(order_id, None)
+
+    def pending_orders(self) -> int:
+        return len(self._orders)
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._orders.clear()
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while len(self._orders) == 0 and not self._stopped:
+                    self._condition.wait()
+
+                if self._stopped:
+                    return
+
+                self._condition.wait(self._interval)
+
+                if self._stopped:
+                    return
+
+                orders = dict(self._orders)
+
+            if len(orders) == 0:
+                continue
+
+            try:
+                changed = self._poll(orders)
+            except Exception as e:
+                logger.error("Error while checking the status of %s orders: %s", len(orders), e)
+                changed = False
+
+            with self._condition:
+                self._interval = MIN_POLL_INTERVAL if changed else min(self._interval * 2, MAX_POLL_INTERVAL)
+
+    def _poll(self, orders: typing.Dict[typing.Union[int, str], _TrackedOrder]) -> bool:
+        '''
+        Read the statuses from the account cache, and through a single batched REST call when needed
+        :param orders:
+        :return: True if a status changed
+        '''
+
+        statuses: typing.Dict[typing.Union[int, str], OrderStatus] = dict()
+
+        account = getattr(self._client, 'account', None)
+
+        if account is not None:
+            for order_id in orders:
+                cached_status = account.order(order_id)
+                if cached_status is not None:
+                    statuses[order_id] = cached_status
+
+        stream_connected = account is not None and account.stream_connected
+        rest_due = time.monotonic() - self._last_rest_poll >= (STREAM_POLL_INTERVAL if stream_connected else 0)
+
+        missing = {order_id: o.contract for order_id, o in orders.items()
+                   if order_id not in statuses or (rest_due and statuses[order_id].status not in FINAL_ORDER_STATUSES)}
+
+        if len(missing) > 0 and rest_due:
+            statuses.update(self._client.get_orders_status(missing))
+            self._last_rest_poll = time.monotonic()
+            self.polls += 1
+
+        changed = False
+
+        for order_id, order_status in statuses.items():
+            # The batched call can return orders that are not tracked here (other ID type, order untracked meanwhile)
+            tracked = orders.get(order_id)
+
+            if tracked is None or order_status.status == tracked.status:
+                continue
+
+            changed = True
+            tracked.status = order_status.status
+
+            if order_status.status in FINAL_ORDER_STATUSES:
+                self.untrack(order_id)
+
+            if self._executor is not None:
+                self._executor.submit(tracked.contract.symbol, tracked.callback, order_status)
+            else:
+                tracked.callback(order_status)
+
+        return changed
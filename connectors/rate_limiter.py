@@ -0,0 +1,406 @@
+import contextlib
+import heapq
+import itertools
+import logging
+import threading
+import time
+import typing
+
+from concurrent.futures import Future
+
+import requests
+
+logger = logging.getLogger()
+
+# Lower values are sent first when the budget is short
+PRIORITY_ORDER = 0  # Placing and cancelling orders
+PRIORITY_ACCOUNT = 1  # Balances, order status and fills
+PRIORITY_MARKET_DATA = 2  # Contracts, candles, prices
+PRIORITY_BACKGROUND = 3  # Bulk downloads like the history backfill, see RateLimiter.background()
+
+# Share of each request budget that only the orders can use, so informational calls never starve them
+ORDER_RESERVE = 0.1
+
+# Share of each request budget the background requests can use, the rest is left to the trading requests
+BACKGROUND_BUDGET_SHARE = 0.5
+
+# Attempts for a request answered with 429 (too many requests), waiting for Retry-After between attempts
+MAX_THROTTLED_RETRIES = 2
+
+
+class RateWindow:
+    '''
+    Usage of one exchange limit over a fixed window, e.g. the request weight per minute or the orders per 10 seconds.
+    The local count is corrected with the usage reported in the response headers.
+    '''
+
+    def __init__(self, name: str, limit: float, seconds: int, header: str = None, header_kind: str = 'used',
+                 orders_only: bool = False):
+        '''
+        :param name:
+        :param limit: Maximum usage in the window
+        :param seconds: Length of the window
+        :param header: Response header reporting the usage of the window
+        :param header_kind: used (Binance) or remaining (Bitmex)
+        :param orders_only: Only the order requests count in this window
+        '''
+
+        self.name = name
+        self.limit = limit
+        self.seconds = seconds
+        self.header = header
+        self.header_kind = header_kind
+        self.orders_only = orders_only
+
+        self.used = 0.0
+        self._window_id = None
+
+    def roll(self, now: float):
+        window_id = int(now // self.seconds)
+        if window_id != self._window_id:
+            self._window_id = window_id
+            self.used = 0.0
+
+    def reset_in(self, now: float) -> float:
+        return self.seconds - now % self.seconds
+
+    def update_from_header(self, value: str):
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            return
+
+        reported = value if self.header_kind == 'used' else self.limit - value
+
+        # Responses arrive out of order, the highest usage reported is the safest one
+        self.used = max(self.used, reported)
+
+
+class RateLimiter:
+    '''
+    Central limiter shared by all the REST calls of a client.
+    Every call waits for its weight to fit in all the windows of the exchange, the waiting calls are served by
+    priority then in arrival order. Identical GET calls in flight at the same time are sent only once.
+    A 429 or 418 response blocks every call until the Retry-After delay has passed.
+    '''
+
+    def __init__(self, windows: typing.List[RateWindow],
+                 endpoint_weights: typing.Dict[typing.Tuple[str, str], typing.Union[float, typing.Callable]],
+                 order_endpoints: typing.Set[str], account_endpoints: typing.Set[str], default_weight: float = 1):
+        '''
+        :param windows:
+        :param endpoint_weights: (method, endpoint) -> weight, or function of the request parameters returning the
+        weight for the endpoints whose weight depends on them
+        :param order_endpoints: Endpoints placing or cancelling orders (with POST, PUT or DELETE)
+        :param account_endpoints: Endpoints returning the account data
+        :param default_weight: Weight of the endpoints missing from endpoint_weights
+        '''
+
+        self._windows = {w.name: w for w in windows}
+        self._endpoint_weights = endpoint_weights
+        self._order_endpoints = order_endpoints
+        self._account_endpoints = account_endpoints
+        self._default_weight = default_weight
+
+        self._condition = threading.Condition()
+        self._waiting = []  # heap of (priority, arrival number)
+        self._arrivals = itertools.count()
+        self._blocked_until = 0.0
+
+        self._in_flight: typing.Dict[typing.Hashable, Future] = dict()
+        self._in_flight_lock = threading.Lock()
+
+        self._stats = {'requests': 0, 'delayed': 0, 'wait_time': 0.0, 'coalesced': 0, 'throttled': 0}
+
+        # Budget share of the background requests sent by the current thread, None for the other requests
+        self._local = threading.local()
+
+    def set_limit(self, name: str, limit: float):
+        with self._condition:
+            if name in self._windows:
+                self._windows[name].limit = limit
+
+    def weight(self, method: str, endpoint: str, params: typing.Dict = None) -> float:
+        weight = self._endpoint_weights.get((method, endpoint), self._default_weight)
+
+        if callable(weight):
+            return weight(params or dict())
+        return weight
+
+    def priority(self, method: str, endpoint: str) -> int:
+        if endpoint in self._order_endpoints and method != 'GET':
+            return PRIORITY_ORDER
+        if endpoint in self._account_endpoints:
+            return PRIORITY_ACCOUNT
+        return PRIORITY_MARKET_DATA
+
+    @contextlib.contextmanager
+    def background(self, budget_share: float = BACKGROUND_BUDGET_SHARE):
+        '''
+        The requests sent by the current thread inside the with block have the lowest priority and can only use
+        a share of each window, e.g. the pages of a history backfill
+        :param budget_share:
+        :return:
+        '''
+
+        previous = getattr(self._local, 'budget_share', None)
+        self._local.budget_share = budget_share
+
+        try:
+            yield
+        finally:
+            self._local.budget_share = previous
+
+    def _fits(self, weight: float, is_order: bool, now: float, budget_share: float = None) -> bool:
+        if now < self._blocked_until:
+            return False
+
+        for window in self._windows.values():
+            if window.orders_only and not is_order:
+                continue
+
+            usage = 1 if window.orders_only else weight
+            limit = window.limit if is_order else window.limit * (1 - ORDER_RESERVE)
+
+            if budget_share is not None:
+                limit = min(limit, window.limit * budget_share)
+
+            # A request heavier than the whole budget is still sent once the window is empty
+            if window.used + usage > limit and window.used > 0:
+                return False
+
+        return True
+
+    def _next_check(self, now: float) -> float:
+        if now < self._blocked_until:
+            return self._blocked_until - now
+        return min([w.reset_in(now) for w in self._windows.values()] + [1.0])
+
+    def acquire(self, weight: float, priority: int, is_order: bool, budget_share: float = None):
+        '''
+        Wait until the request can be sent, then count it in the windows
+        :param weight:
+        :param priority:
+        :param is_order: Counts in the order windows
+        :param budget_share: Share of each window the request can use, the whole budget if None
+        :return:
+        '''
+
+        entry = (priority, next(self._arrivals))
+        started_at = time.monotonic()
+
+        with self._condition:
+            heapq.heappush(self._waiting, entry)
+
+            while True:
+                now = time.time()
+
+                for window in self._windows.values():
+                    window.roll(now)
+
+                if self._waiting[0] == entry and self._fits(weight, is_order, now, budget_share):
+                    break
+
+                self._condition.wait(self._next_check(now))
+
+            heapq.heappop(self._waiting)
+
+            for window in self._windows.values():
+                if window.orders_only:
+                    if is_order:
+                        window.used += 1
+                else:
+                    window.used += weight
+
+            waited = time.monotonic() - started_at
+
+            self._stats['requests'] += 1
+            if waited > 0.001:
+                self._stats['delayed'] += 1
+                self._stats['wait_time'] += waited
+
+            self._condition.notify_all()
+
+    def update(self, response: requests.Response):
+        '''
+        Correct the usage with the response headers, and stop sending requests after a 429 / 418
+        :param response:
+        :return:
+        '''
+
+        with self._condition:
+            now = time.time()
+
+            for window in self._windows.values():
+                window.roll(now)
+                if window.header is not None and window.header in response.headers:
+                    window.update_from_header(response.headers[window.header])
+
+            if response.status_code in (418, 429):
+                try:
+                    retry_after = float(response.headers.get('Retry-After', 1))
+                except ValueError:
+                    retry_after = 1.0
+
+                self._blocked_until = max(self._blocked_until, now + retry_after)
+                self._stats['throttled'] += 1
+
+                logger.warning("Rate limit reached (error code %s), requests paused for %s seconds",
+                               response.status_code, retry_after)
+
+            self._condition.notify_all()
+
+    def execute(self, method: str, endpoint: str, send: typing.Callable[[], requests.Response],
+                coalesce_key: typing.Hashable = None, params: typing.Dict = None) -> requests.Response:
+        '''
+        Send a request within the limits
+        :param method:
+        :param endpoint: Path of the endpoint, used to find its weight and priority
+        :param send: Builds and sends the request, called again if the request is retried (signatures expire)
+        :param coalesce_key: GET requests with the same key already in flight share their response
+        :param params: Parameters of the request, some endpoint weights depend on them (e.g. the depth limit)
+        :return:
+        '''
+
+        if coalesce_key is not None and method == 'GET':
+            with self._in_flight_lock:
+                future = self._in_flight.get(coalesce_key)
+                owner = future is None
+                if owner:
+                    future = self._in_flight[coalesce_key] = Future()
+
+            if not owner:
+                with self._condition:
+                    self._stats['coalesced'] += 1
+                return future.result()
+
+            try:
+                response = self._send(method, endpoint, send, params)
+                future.set_result(response)
+                return response
+            except Exception as e:
+                future.set_exception(e)
+                raise
+            finally:
+                with self._in_flight_lock:
+                    self._in_flight.pop(coalesce_key, None)
+
+        return self._send(method, endpoint, send, params)
+
+    def _send(self, method: str, endpoint: str, send: typing.Callable[[], requests.Response],
+              params: typing.Dict = None) -> requests.Response:
+        priority = self.priority(method, endpoint)
+        weight = self.weight(method, endpoint, params)
+
+        budget_share = getattr(self._local, 'budget_share', None)
+        if budget_share is not None and priority != PRIORITY_ORDER:
+            priority = PRIORITY_BACKGROUND
+        else:
+            budget_share = None
+
+        for attempt in range(MAX_THROTTLED_RETRIES + 1):
+            self.acquire(weight, priority, priority == PRIORITY_ORDER, budget_share)
+
+            response = send()
+            self.update(response)
+
+            # 418 is an IP ban, possibly for hours: the error is returned instead of waiting
+            if response.status_code != 429:
+                break
+
+        return response
+
+    def metrics(self) -> typing.Dict:
+        '''
+        Budget usage of each window, number of calls waiting per priority and counters since the creation
+        :return:
+        '''
+
+        with self._condition:
+            now = time.time()
+
+            windows = dict()
+            for window in self._windows.values():
+                window.roll(now)
+                windows[window.name] = {'used': window.used, 'limit': window.limit,
+                                        'usage_pct': round(window.used / window.limit * 100, 2)}
+
+            waiting = dict()
+            for priority, _ in self._waiting:
+                waiting[priority] = waiting.get(priority, 0) + 1
+
+            return {'windows': windows, 'waiting': waiting, 'blocked_for': max(self._blocked_until - now, 0.0),
+                    **self._stats}
+
+
+def _binance_spot_depth_weight(params: typing.Dict) -> float:
+    limit = int(params.get('limit', 100))
+
+    if limit <= 100:
+        return 5
+    if limit <= 500:
+        return 25
+    if limit <= 1000:
+        return 50
+    return 250
+
+
+def _binance_futures_depth_weight(params: typing.Dict) -> float:
+    limit = int(params.get('limit', 500))
+
+    if limit <= 50:
+        return 2
+    if limit <= 100:
+        return 5
+    if limit <= 500:
+        return 10
+    return 20
+
+
+def binance_rate_limiter(futures: bool) -> RateLimiter:
+    '''
+    Limits and weights of the Binance endpoints used by the connector, the limits are then updated with the
+    rateLimits returned by exchangeInfo
+    :param futures:
+    :return:
+    '''
+
+    if futures:
+        windows = [RateWindow('REQUEST_WEIGHT_1M', 2400, 60, 'X-MBX-USED-WEIGHT-1M'),
+                   RateWindow('ORDERS_10S', 300, 10, 'X-MBX-ORDER-COUNT-10S', orders_only=True),
+                   RateWindow('ORDERS_1M', 1200, 60, 'X-MBX-ORDER-COUNT-1M', orders_only=True)]
+
+        weights = {('GET', '/fapi/v1/exchangeInfo'): 1, ('GET', '/fapi/v1/klines'): 5,
+                   ('GET', '/fapi/v1/ticker/bookTicker'): 2, ('GET', '/fapi/v1/account'): 5,
+                   ('GET', '/fapi/v1/order'): 1, ('GET', '/fapi/v1/openOrders'): 1,
+                   ('GET', '/fapi/v1/userTrades'): 5, ('GET', '/fapi/v1/depth'): _binance_futures_depth_weight}
+
+        return RateLimiter(windows, weights, {'/fapi/v1/order'},
+                           {'/fapi/v1/account', '/fapi/v1/order', '/fapi/v1/openOrders', '/fapi/v1/userTrades',
+                            '/fapi/v1/listenKey'})
+
+    windows = [RateWindow('REQUEST_WEIGHT_1M', 6000, 60, 'X-MBX-USED-WEIGHT-1M'),
+               RateWindow('ORDERS_10S', 100, 10, 'X-MBX-ORDER-COUNT-10S', orders_only=True),
+               RateWindow('ORDERS_1D', 200000, 86400, 'X-MBX-ORDER-COUNT-1D', orders_only=True)]
+
+    weights = {('GET', '/api/v3/exchangeInfo'): 20, ('GET', '/api/v3/klines'): 2,
+               ('GET', '/api/v3/ticker/bookTicker'): 2, ('GET', '/api/v3/account'): 20,
+               ('GET', '/api/v3/order'): 4, ('GET', '/api/v3/openOrders'): 6, ('GET', '/api/v3/myTrades'): 20,
+               ('GET', '/api/v3/depth'): _binance_spot_depth_weight}
+
+    return RateLimiter(windows, weights, {'/api/v3/order'},
+                       {'/api/v3/account', '/api/v3/order', '/api/v3/openOrders', '/api/v3/myTrades',
+                        '/api/v3/userDataStream'})
+
+
+def bitmex_rate_limiter() -> RateLimiter:
+    '''
+    Bitmex counts requests instead of weights: 120 per minute, and 10 per second for the order endpoints
+    :return:
+    '''
+
+    windows = [RateWindow('REQUESTS_1M', 120, 60, 'x-ratelimit-remaining', 'remaining'),
+               RateWindow('ORDERS_1S', 10, 1, 'x-ratelimit-remaining-1s', 'remaining', orders_only=True)]
+
+    return RateLimiter(windows, dict(), {'/api/v1/order'},
+                       {'/api/v1/user/margin', '/api/v1/order', '/api/v1/execution', '/api/v1/execution/tradeHistory'})
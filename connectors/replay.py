@@ -0,0 +1,297 @@
+import abc
+import itertools
+import logging
+import shutil
+import tempfile
+import time
+import typing
+
+from connectors.binance import BinanceClient
+from connectors.bitmex import BitmexClient
+from connectors.tick_recorder import read_frames
+from database.candle_archive import CandleArchive
+from database.candles_database import CandlesDatabase, DEFAULT_HISTORY_LENGTH, exchange_key
+from database.trades_database import TradesWriter, set_trades_writer
+from Trading.models import Balance, Candle, Contract, OrderStatus
+
+logger = logging.getLogger()
+
+
+class InlineExecutor:
+    '''
+    Runs the strategy tasks immediately on the replay thread: the messages are processed one after the other,
+    so a replay always gives the same orders. Same interface as the SymbolExecutor.
+    '''
+
+    def __init__(self):
+        self._processed = 0
+
+    def submit(self, symbol: str, func: typing.Callable, *args):
+        try:
+            func(*args)
+        except Exception as e:
+            logger.error("Error while running strategy task for %s: %s", symbol, e)
+
+        self._processed += 1
+
+    def wait_idle(self, timeout: float = None) -> bool:
+        return True
+
+    def metrics(self) -> typing.Dict:
+        return {'queue_depth': dict(), 'total_depth': 0, 'oldest_task_age': dict(), 'last_lag': dict(),
+                'max_lag': 0.0, 'processed': self._processed}
+
+    def shutdown(self, wait: bool = False):
+        pass
+
+
+class _ReplayClient(abc.ABC):
+    '''
+    The connector methods using the network are replaced: contracts and balances are given, the historical candles
+    are read from a candles database, the orders are filled at the current bid / ask without being sent.
+    The websocket handlers, the candles and the strategies are the ones of the connector.
+    '''
+
+    replay_source = None
+
+    def _init_replay(self, contracts: typing.Dict[str, Contract], balances: typing.Dict[str, Balance],
+                     history: CandlesDatabase):
+        self._replay_contracts = contracts
+        self._replay_balances = balances
+        self._history = history
+
+        self._order_ids = itertools.count(1)
+
+        # The candles downloaded and closed during the replay don't go to the local databases
+        self._archive_root = tempfile.mkdtemp(prefix='replay_archive_')
+
+        # Orders placed by the strategies during the replay: time, symbol, side, quantity, price
+        self.paper_orders: typing.List[typing.Dict] = []
+
+    def _start_replay(self, strategy_workers: typing.Union[int, None]):
+        if strategy_workers is None:
+            self._executor.shutdown()
+            self._executor = InlineExecutor()
+
+    def get_contracts(self) -> typing.Dict[str, Contract]:
+        return self._replay_contracts
+
+    def get_balances(self) -> typing.Dict[str, Balance]:
+        self.account.set_balances(self._replay_balances)
+        return self._replay_balances
+
+    def get_historical_candles(self, contract: Contract, timeframe: str, start_time: int = None,
+                               end_time: int = None) -> typing.List[Candle]:
+        '''
+        The stored candles opened before the replay time
+        '''
+
+        now = int(self.market_data.clock() * 1000)
+        end_time = now if end_time is None else min(end_time, now)
+
+        return self._history.get_candles(exchange_key(self), contract.symbol, timeframe,
+                                         limit=DEFAULT_HISTORY_LENGTH, start_time=start_time, end_time=end_time)
+
+    def place_order(self, contract: Contract, order_type: str, quantity: float, side: str, price=None,
+                    tif=None) -> typing.Union[OrderStatus, None]:
+        '''
+        Paper order, filled at once at the best price
+        '''
+
+        prices = self.prices.get(contract.symbol, dict())
+        fill_price = prices.get('ask') if side.lower() == 'buy' else prices.get('bid')
+
+        if fill_price is None or quantity <= 0:
+            return None
+
+        order_id = next(self._order_ids)
+
+        self.paper_orders.append({'time': int(self.market_data.clock() * 1000), 'symbol': contract.symbol,
+                                  'side': side.lower(), 'quantity': quantity, 'price': fill_price})
+
+        return self._filled_order(order_id, fill_price, quantity)
+
+    @abc.abstractmethod
+    def _filled_order(self, order_id: int, price: float, quantity: float) -> OrderStatus:
+        '''
+        :return: Status of a filled order, in the format of the exchange
+        '''
+
+    @abc.abstractmethod
+    def replay_message(self, msg: str):
+        '''
+        Pass a recorded message to the websocket handler of the connector
+        '''
+
+    def wait_idle(self):
+        self._executor.wait_idle()
+
+    def close(self):
+        self.reconnect = False
+        self.stop_strategies()
+        shutil.rmtree(self._archive_root, ignore_errors=True)
+
+
+class ReplayBinanceClient(_ReplayClient, BinanceClient):
+    replay_source = 'binance'
+
+    def __init__(self, contracts: typing.Dict[str, Contract], balances: typing.Dict[str, Balance],
+                 history: CandlesDatabase, futures: bool, testnet: bool = False, strategy_workers: int = None):
+        '''
+        :param contracts: Contracts of the recording
+        :param balances: Balances used for the trade sizes, not changed by the fills
+        :param history: Candles database containing the candles before the recording
+        :param futures:
+        :param testnet: Selects the candles of the history, see exchange_key()
+        :param strategy_workers: Strategies run on the replay thread if None, the replay is then deterministic.
+        On a SymbolExecutor otherwise, like live: the replay does not wait for them, use a real-time speed.
+        '''
+
+        self._init_replay(contracts, balances, history)
+        super().__init__('', '', testnet, futures, strategy_workers=strategy_workers or 1,
+                         candles_store=CandlesDatabase(':memory:'), candle_archive=CandleArchive(self._archive_root))
+        self._start_replay(strategy_workers)
+
+    def _start_user_stream(self):
+        pass
+
+    def subscribe_channel(self, contracts: typing.List[Contract], channel: str):
+        for contract in contracts:
+            if contract.symbol not in self.ws_subscriptions[channel]:
+                self.ws_subscriptions[channel].append(contract.symbol)
+
+    def unsubscribe_channel(self, contracts: typing.List[Contract], channel: str):
+        for contract in contracts:
+            if contract.symbol in self.ws_subscriptions[channel]:
+                self.ws_subscriptions[channel].remove(contract.symbol)
+
+    def subscribe_order_book(self, contract: Contract):
+        # The books need a REST snapshot, the replays run without them: the slippage is not estimated
+        pass
+
+    def _filled_order(self, order_id: int, price: float, quantity: float) -> OrderStatus:
+        return OrderStatus({'orderId': order_id, 'status': 'FILLED', 'avgPrice': price, 'executedQty': quantity},
+                           self.platform)
+
+    def replay_message(self, msg: str):
+        self.streams.dispatch(msg)
+
+    def close(self):
+        super().close()
+        self.streams.close()
+
+
+class ReplayBitmexClient(_ReplayClient, BitmexClient):
+    replay_source = 'bitmex'
+
+    def __init__(self, contracts: typing.Dict[str, Contract], balances: typing.Dict[str, Balance],
+                 history: CandlesDatabase, testnet: bool = False, strategy_workers: int = None):
+        '''
+        See ReplayBinanceClient
+        '''
+
+        self._init_replay(contracts, balances, history)
+        super().__init__('', '', testnet, strategy_workers=strategy_workers or 1,
+                         candles_store=CandlesDatabase(':memory:'), candle_archive=CandleArchive(self._archive_root))
+        self._start_replay(strategy_workers)
+
+    def _start_ws(self):
+        pass
+
+    def _filled_order(self, order_id: int, price: float, quantity: float) -> OrderStatus:
+        return OrderStatus({'orderID': str(order_id), 'ordStatus': 'Filled', 'avgPx': price, 'cumQty': quantity},
+                           self.platform)
+
+    def replay_message(self, msg: str):
+        self._on_message(None, msg)
+
+
+class ReplayEngine:
+    '''
+    Feeds recorded websocket messages (see connectors/tick_recorder.py) to the handlers of replay clients, without
+    network. The candles and the trade delays are computed with the receive time of the messages.
+    '''
+
+    def __init__(self, clients: typing.List[_ReplayClient], paths: typing.List[str], speed: float = None):
+        '''
+        :param clients: ReplayBinanceClient / ReplayBitmexClient, the strategies are added after the engine creation
+        :param paths: Segment files, see tick_recorder.segment_paths()
+        :param speed: 1 for real time, 10 for ten times faster... As fast as possible if None
+        '''
+
+        self.speed = speed
+
+        self._clients = clients
+        self._paths = paths
+        self._handlers = {c.replay_source: c.replay_message for c in clients}
+
+        # The history loaded when the strategies are added ends at the first message
+        self._receive_time = next((f[0] for f in read_frames(paths)), None)
+
+        for client in clients:
+            client.market_data.clock = self.time
+
+    def time(self) -> float:
+        '''
+        :return: Receive time of the message replayed, in seconds
+        '''
+
+        if self._receive_time is None:
+            return time.time()
+        return self._receive_time / 1e9
+
+    def run(self, trades_db: str = ':memory:') -> typing.Dict:
+        '''
+        Replay the segments and wait for the strategies to process the last messages
+        :param trades_db: Journal of the trades closed by the strategies during the replay
+        :return: Number of messages, duration and throughput
+        '''
+
+        writer = TradesWriter(trades_db)
+        previous_writer = set_trades_writer(writer)
+
+        messages = 0
+        skipped = 0
+        first_receive_time = None
+
+        start = time.perf_counter()
+
+        try:
+            for receive_time, source, msg in read_frames(self._paths):
+                handler = self._handlers.get(source)
+                if handler is None:
+                    skipped += 1
+                    continue
+
+                if first_receive_time is None:
+                    first_receive_time = receive_time
+
+                # Wait until the time of the message at the replay speed
+                if self.speed is not None:
+                    delay = (receive_time - first_receive_time) / 1e9 / self.speed - (time.perf_counter() - start)
+                    if delay > 0:
+                        time.sleep(delay)
+
+                self._receive_time = receive_time
+
+                try:
+                    handler(msg)
+                except Exception as e:
+                    logger.error("Error while replaying a %s message: %s", source, e)
+
+                messages += 1
+
+            for client in self._clients:
+                client.wait_idle()
+
+        finally:
+            set_trades_writer(previous_writer)
+            writer.close()
+
+        duration = time.perf_counter() - start
+        recorded = 0 if first_receive_time is None else (self._receive_time - first_receive_time) / 1e9
+
+        return {'messages': messages, 'skipped': skipped, 'duration': duration, 'recorded_duration': recorded,
+                'messages_per_second': messages / duration if duration > 0 else 0.0,
+                'closed_trades': writer.written,
+                'orders': sum(len(c.paper_orders) for c in self._clients)}
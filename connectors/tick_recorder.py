@@ -0,0 +1,123 @@
+import glob
+import gzip
+import logging
+import os
+import queue
+import threading
+import time
+import typing
+
+logger = logging.getLogger()
+
+# A new segment file is started every SEGMENT_DURATION seconds
+SEGMENT_DURATION = 15 * 60
+SEGMENT_COMPRESSION = 6
+
+
+class TickRecorder:
+    '''
+    Saves the raw websocket messages of the connectors with their receive time, for the replays.
+    The websocket threads only queue the messages, one thread compresses them into gzip segment files.
+    A segment has one message per line: receive time in nanoseconds, source (binance, bitmex) and the raw JSON,
+    separated by tabs. The JSON messages never contain a raw tab or newline.
+    '''
+
+    def __init__(self, root: str = 'ticks', segment_duration: float = SEGMENT_DURATION):
+        self._root = root
+        self._segment_duration = segment_duration
+
+        self._queue = queue.SimpleQueue()
+        self._closed = False
+
+        self.recorded = 0
+        self.segments: typing.List[str] = []
+
+        os.makedirs(root, exist_ok=True)
+
+        self._thread = threading.Thread(target=self._run, name='tick_recorder', daemon=True)
+        self._thread.start()
+
+    def record(self, source: str, msg: str, receive_time: int = None):
+        '''
+        Called from the websocket threads
+        :param source: binance or bitmex, selects the handler of the replay
+        :param msg: Raw message
+        :param receive_time: In nanoseconds, now if None
+        :return:
+        '''
+
+        if not self._closed:
+            self._queue.put((time.time_ns() if receive_time is None else receive_time, source, msg))
+
+    def close(self):
+        '''
+        Write the queued messages and close the current segment
+        :return:
+        '''
+
+        if self._closed:
+            return
+
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+    def _open_segment(self, receive_time: int):
+        path = os.path.join(self._root, f"ticks-{receive_time}.log.gz")
+        self.segments.append(path)
+        logger.info("Recording the websocket messages to %s", path)
+        return gzip.open(path, 'wt', encoding='utf-8', compresslevel=SEGMENT_COMPRESSION)
+
+    def _run(self):
+        segment = None
+        segment_end = 0
+
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+
+            receive_time, source, msg = item
+
+            if receive_time >= segment_end:
+                if segment is not None:
+                    segment.close()
+                segment = self._open_segment(receive_time)
+                segment_end = receive_time + int(self._segment_duration * 1e9)
+
+            try:
+                segment.write(f"{receive_time}\t{source}\t{msg}\n")
+                self.recorded += 1
+            except OSError as e:
+                logger.error("Error while recording a %s message: %s", source, e)
+
+        if segment is not None:
+            segment.close()
+
+
+def segment_paths(root: str = 'ticks') -> typing.List[str]:
+    '''
+    :return: Segment files of a recording directory, in chronological order
+    '''
+
+    # The names contain the receive time of their first message, all with the same number of digits
+    return sorted(glob.glob(os.path.join(root, "ticks-*.log.gz")))
+
+
+def read_frames(paths: typing.Iterable[str]) -> typing.Iterator[typing.Tuple[int, str, str]]:
+    '''
+    Read the recorded messages
+    :param paths: Segment files, see segment_paths()
+    :return: receive time in nanoseconds, source, raw message
+    '''
+
+    for path in paths:
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    receive_time, source, msg = line.rstrip('\n').split('\t', 2)
+                    yield int(receive_time), source, msg
+
+        # The last segment of a recording that was not closed is truncated
+        except EOFError:
+            logger.warning("%s is truncated, the end of the segment is skipped", path)
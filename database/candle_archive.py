@@ -0,0 +1,111 @@
+import os
+import threading
+import typing
+
+import numpy as np
+
+from Trading.models import Candle
+
+# One fixed size record per closed candle, little-endian so the files can be copied between machines
+RECORD = np.dtype([("timestamp", "<i8"), ("open", "<f8"), ("high", "<f8"), ("low", "<f8"), ("close", "<f8"),
+                   ("volume", "<f8")])
+
+
+def candle_records(candles: typing.Iterable[Candle]) -> np.ndarray:
+    return np.array([(c.timestamp, c.open, c.high, c.low, c.close, c.volume) for c in candles], dtype=RECORD)
+
+
+class CandleArchive:
+    '''
+    Append-only binary files of closed candles, one per (exchange, symbol, timeframe), without header:
+    the file is an array of RECORD in chronological order. The most recent candles are read by mapping only the end
+    of the file, so reading them does not depend on the size of the archive.
+    '''
+
+    def __init__(self, root: str = 'candle_archive'):
+        self._root = root
+        self._lock = threading.Lock()
+
+        self._last_timestamps: typing.Dict[str, typing.Union[int, None]] = dict()
+
+    def path(self, exchange: str, symbol: str, timeframe: str) -> str:
+        return os.path.join(self._root, exchange, f"{symbol}_{timeframe}.ohlcv")
+
+    @staticmethod
+    def _count(path: str) -> int:
+        # A record partially written by a crash is ignored, and overwritten by the next append
+        try:
+            return os.path.getsize(path) // RECORD.itemsize
+        except FileNotFoundError:
+            return 0
+
+    def _last_timestamp(self, path: str) -> typing.Union[int, None]:
+        if path not in self._last_timestamps:
+            count = self._count(path)
+
+            if count == 0:
+                self._last_timestamps[path] = None
+            else:
+                with open(path, 'rb') as f:
+                    f.seek((count - 1) * RECORD.itemsize)
+                    self._last_timestamps[path] = int(np.frombuffer(f.read(8), dtype="<i8")[0])
+
+        return self._last_timestamps[path]
+
+    def last_timestamp(self, exchange: str, symbol: str, timeframe: str) -> typing.Union[int, None]:
+        '''
+        :return: Open time of the last candle archived, None if the archive is empty
+        '''
+
+        with self._lock:
+            return self._last_timestamp(self.path(exchange, symbol, timeframe))
+
+    def count(self, exchange: str, symbol: str, timeframe: str) -> int:
+        return self._count(self.path(exchange, symbol, timeframe))
+
+    def append(self, exchange: str, symbol: str, timeframe: str, records: np.ndarray) -> int:
+        '''
+        Add closed candles at the end of the archive, the ones not more recent than the last candle archived are
+        skipped: a candle is written once, when it is closed
+        :param records: RECORD array in chronological order, see candle_records()
+        :return: Number of candles written
+        '''
+
+        path = self.path(exchange, symbol, timeframe)
+
+        with self._lock:
+            last_timestamp = self._last_timestamp(path)
+
+            if last_timestamp is not None:
+                records = records[records["timestamp"] > last_timestamp]
+
+            if len(records) == 0:
+                return 0
+
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+            with open(path, 'ab') as f:
+                f.truncate(self._count(path) * RECORD.itemsize)
+                f.write(records.astype(RECORD, copy=False).tobytes())
+
+            self._last_timestamps[path] = int(records["timestamp"][-1])
+
+        return len(records)
+
+    def tail(self, exchange: str, symbol: str, timeframe: str, n: int) -> np.ndarray:
+        '''
+        Map the last n candles of the archive, read-only
+        :param n:
+        :return: RECORD array of at most n candles, backed by the file
+        '''
+
+        path = self.path(exchange, symbol, timeframe)
+
+        with self._lock:
+            count = self._count(path)
+            n = min(n, count)
+
+            if n == 0:
+                return np.empty(0, dtype=RECORD)
+
+            return np.memmap(path, dtype=RECORD, mode='r', offset=(count - n) * RECORD.itemsize, shape=(n,))
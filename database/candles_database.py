@@ -0,0 +1,195 @@
+import sqlite3
+import threading
+import time
+import typing
+
+from Trading.models import Candle
+from Trading.strategies import TF_EQUIV
+
+if typing.TYPE_CHECKING:
+    from connectors.bitmex import BitmexClient
+    from connectors.binance import BinanceClient
+
+# Number of candles returned to warm up a strategy, about what one history request returns
+DEFAULT_HISTORY_LENGTH = 1000
+
+
+class CandlesDatabase:
+    def __init__(self, path: str = 'candles.db'):
+        # The same connection is used by the interface thread and the backfill threads
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+
+        self._conn.execute("CREATE TABLE IF NOT EXISTS candles (exchange TEXT NOT NULL, symbol TEXT NOT NULL, "
+                           "timeframe TEXT NOT NULL, timestamp INTEGER NOT NULL, open REAL, high REAL, low REAL, "
+                           "close REAL, volume REAL, PRIMARY KEY(exchange, symbol, timeframe, timestamp)) "
+                           "WITHOUT ROWID")
+
+        # Time ranges completely downloaded by a backfill, skipped when an interrupted backfill is resumed
+        self._conn.execute("CREATE TABLE IF NOT EXISTS backfilled_ranges (exchange TEXT NOT NULL, "
+                           "symbol TEXT NOT NULL, timeframe TEXT NOT NULL, start_time INTEGER NOT NULL, "
+                           "end_time INTEGER NOT NULL, PRIMARY KEY(exchange, symbol, timeframe, start_time)) "
+                           "WITHOUT ROWID")
+        self._conn.commit()
+
+    def save_candles(self, exchange: str, symbol: str, timeframe: str, candles: typing.List[Candle]):
+        '''
+        Insert the candles, the ones already stored are replaced (the last candle of a download is often partial)
+        :param exchange:
+        :param symbol:
+        :param timeframe:
+        :param candles:
+        :return:
+        '''
+
+        rows = [(exchange, symbol, timeframe, c.timestamp, c.open, c.high, c.low, c.close, c.volume) for c in candles]
+
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO candles VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self._conn.commit()
+
+    def get_candles(self, exchange: str, symbol: str, timeframe: str, limit: int = None,
+                    start_time: int = None, end_time: int = None) -> typing.List[Candle]:
+        '''
+        Read the stored candles in chronological order
+        :param limit: Return only the most recent candles
+        :param start_time: First open time included, in milliseconds
+        :param end_time: Last open time included, in milliseconds
+        :return:
+        '''
+
+        query = "SELECT timestamp, open, high, low, close, volume FROM candles " \
+                "WHERE exchange = ? AND symbol = ? AND timeframe = ?"
+        params = [exchange, symbol, timeframe]
+
+        if start_time is not None:
+            query += " AND timestamp >= ?"
+            params.append(start_time)
+        if end_time is not None:
+            query += " AND timestamp <= ?"
+            params.append(end_time)
+
+        query += " ORDER BY timestamp DESC"
+
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+
+        return Candle.from_rows(reversed(rows))
+
+    def iter_rows(self, exchange: str = None, symbol: str = None, timeframe: str = None,
+                  batch_size: int = 100000) -> typing.Iterator[typing.List[typing.Tuple]]:
+        '''
+        Read the stored candles by batches, for the bulk exports
+        :return: Lists of (exchange, symbol, timeframe, timestamp, open, high, low, close, volume)
+        '''
+
+        conditions = []
+        params = []
+
+        for column, value in (("exchange", exchange), ("symbol", symbol), ("timeframe", timeframe)):
+            if value is not None:
+                conditions.append(column + " = ?")
+                params.append(value)
+
+        query = "SELECT * FROM candles"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+
+        with self._lock:
+            cursor = self._conn.execute(query + " ORDER BY exchange, symbol, timeframe, timestamp", params)
+
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(batch_size)
+            if len(rows) == 0:
+                return
+            yield rows
+
+    def save_rows(self, rows: typing.List[typing.Tuple]):
+        '''
+        Bulk insert of (exchange, symbol, timeframe, timestamp, open, high, low, close, volume) rows
+        :param rows:
+        :return:
+        '''
+
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO candles VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self._conn.commit()
+
+    def get_last_timestamp(self, exchange: str, symbol: str, timeframe: str) -> typing.Union[int, None]:
+        with self._lock:
+            row = self._conn.execute("SELECT MAX(timestamp) FROM candles WHERE exchange = ? AND symbol = ? "
+                                     "AND timeframe = ?", (exchange, symbol, timeframe)).fetchone()
+        return row[0]
+
+    def add_backfilled_range(self, exchange: str, symbol: str, timeframe: str, start_time: int, end_time: int):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO backfilled_ranges VALUES (?, ?, ?, ?, ?)",
+                               (exchange, symbol, timeframe, start_time, end_time))
+            self._conn.commit()
+
+    def get_backfilled_ranges(self, exchange: str, symbol: str,
+                              timeframe: str) -> typing.Set[typing.Tuple[int, int]]:
+        with self._lock:
+            rows = self._conn.execute("SELECT start_time, end_time FROM backfilled_ranges WHERE exchange = ? "
+                                      "AND symbol = ? AND timeframe = ?", (exchange, symbol, timeframe)).fetchall()
+        return set(rows)
+
+    def refresh(self, client: typing.Union["BinanceClient", "BitmexClient"], exchange: str, contract, timeframe: str,
+                limit: int = DEFAULT_HISTORY_LENGTH) -> typing.List[Candle]:
+        '''
+        Download only the candles more recent than the last one stored, then read the history from the database.
+        If the stored candles are older than the history needed, the most recent candles are downloaded instead.
+        :param client: Connector used for the downloads
+        :param exchange: Key of the data in the database, see exchange_key()
+        :param contract:
+        :param timeframe:
+        :param limit: Number of candles returned
+        :return:
+        '''
+
+        tf_ms = TF_EQUIV[timeframe] * 1000
+        now = int(time.time() * 1000)
+
+        last_timestamp = self.get_last_timestamp(exchange, contract.symbol, timeframe)
+        start_time = None
+
+        if last_timestamp is None or (now - last_timestamp) / tf_ms > limit:
+            candles = client.get_historical_candles(contract, timeframe)
+            self.save_candles(exchange, contract.symbol, timeframe, candles)
+
+            # The stored candles are too old to be contiguous with the ones just downloaded
+            if len(candles) > 0:
+                start_time = candles[0].timestamp
+
+        else:
+            # The last stored candle is downloaded again, it was probably still in progress when it was saved
+            while last_timestamp + tf_ms <= now:
+                candles = client.get_historical_candles(contract, timeframe, start_time=last_timestamp)
+                if len(candles) == 0:
+                    break
+
+                self.save_candles(exchange, contract.symbol, timeframe, candles)
+
+                if candles[-1].timestamp <= last_timestamp:
+                    break
+                last_timestamp = candles[-1].timestamp
+
+        return self.get_candles(exchange, contract.symbol, timeframe, limit=limit, start_time=start_time)
+
+    def close(self):
+        self._conn.close()
+
+
+def exchange_key(client: typing.Union["BinanceClient", "BitmexClient"]) -> str:
+    '''
+    Testnet and live candles are stored separately
+    :param client:
+    :return: binance_spot, binance_futures_testnet, bitmex, ...
+    '''
+
+    return client.platform + ('_testnet' if client.testnet else '')
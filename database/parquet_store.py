@@ -0,0 +1,297 @@
+import argparse
+import os
+import typing
+
+import numpy as np
+
+from database.candles_database import CandlesDatabase
+from database.trades_database import TradesDatabase, TRADE_COLUMNS
+
+# pyarrow is optional, only the Parquet exports and imports need it
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+except ImportError:
+    pa = None
+    ds = None
+
+CANDLE_PARTITIONS = ("exchange", "symbol", "timeframe", "day")
+TRADE_PARTITIONS = ("exchange", "symbol", "day")
+
+if pa is not None:
+    CANDLE_SCHEMA = pa.schema([("exchange", pa.string()), ("symbol", pa.string()), ("timeframe", pa.string()),
+                               ("day", pa.string()), ("timestamp", pa.int64()), ("open", pa.float64()),
+                               ("high", pa.float64()), ("low", pa.float64()), ("close", pa.float64()),
+                               ("volume", pa.float64())])
+
+    TRADE_SCHEMA = pa.schema([("exchange", pa.string()), ("symbol", pa.string()), ("day", pa.string()),
+                              ("time", pa.int64()), ("strategy", pa.string()), ("side", pa.string()),
+                              ("entry_price", pa.float64()), ("exit_price", pa.float64()),
+                              ("exit_time", pa.int64()), ("status", pa.string()), ("pnl", pa.float64()),
+                              ("quantity", pa.float64()), ("entry_id", pa.string())])
+
+
+class CandleColumns:
+    '''
+    Candles read from Parquet as one NumPy array per column, the arrays are views of the Arrow buffers.
+    Accepted by the backtest functions like a CandleBuffer.
+    '''
+
+    def __init__(self, table):
+        self.timestamps = _column_array(table, "timestamp")
+        self.opens = _column_array(table, "open")
+        self.highs = _column_array(table, "high")
+        self.lows = _column_array(table, "low")
+        self.closes = _column_array(table, "close")
+        self.volumes = _column_array(table, "volume")
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+
+def _column_array(table, name: str) -> np.ndarray:
+    column = table.column(name)
+
+    if column.num_chunks == 1 and column.null_count == 0:
+        return column.chunk(0).to_numpy(zero_copy_only=True)
+
+    return column.to_numpy()
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("The Parquet exports need pyarrow: pip install pyarrow")
+
+
+def _days(timestamps: np.ndarray) -> np.ndarray:
+    return timestamps.astype("datetime64[ms]").astype("datetime64[D]").astype(str)
+
+
+def _day(timestamp: int) -> str:
+    return str(np.datetime64(timestamp, "ms").astype("datetime64[D]"))
+
+
+def _partitioning(schema, names: typing.Tuple[str, ...]):
+    # Partition values are read as strings, so the day ranges are compared as 'YYYY-MM-DD'
+    return ds.partitioning(pa.schema([schema.field(n) for n in names]), flavor="hive")
+
+
+def _write(batches, root: str, schema, partitions: typing.Tuple[str, ...]):
+    # The partitions written again (same exchange / symbol / day...) replace the previous files
+    ds.write_dataset(batches, root, schema=schema, format="parquet",
+                     partitioning=_partitioning(schema, partitions), existing_data_behavior="delete_matching",
+                     basename_template="part-{i}.parquet")
+
+
+def _filter(exchange: str = None, symbol: str = None, timeframe: str = None, time_column: str = None,
+            start_time: int = None, end_time: int = None):
+    expression = None
+
+    conditions = [ds.field(c) == v for c, v in (("exchange", exchange), ("symbol", symbol), ("timeframe", timeframe))
+                  if v is not None]
+
+    # The day condition skips the files outside of the range without opening them
+    if start_time is not None:
+        conditions += [ds.field("day") >= _day(start_time), ds.field(time_column) >= start_time]
+    if end_time is not None:
+        conditions += [ds.field("day") <= _day(end_time), ds.field(time_column) <= end_time]
+
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+
+    return expression
+
+
+def export_candles(store: CandlesDatabase, root: str, exchange: str = None, symbol: str = None,
+                   timeframe: str = None) -> int:
+    '''
+    Write the stored candles to Parquet files partitioned by exchange / symbol / timeframe / day
+    :param store:
+    :param root: Directory of the dataset
+    :return: Number of candles written
+    '''
+
+    _require_pyarrow()
+
+    count = [0]
+
+    def batches():
+        for rows in store.iter_rows(exchange, symbol, timeframe):
+            columns = list(zip(*rows))
+            timestamps = np.array(columns[3], dtype=np.int64)
+            count[0] += len(rows)
+
+            yield pa.RecordBatch.from_arrays(
+                [pa.array(columns[0], pa.string()), pa.array(columns[1], pa.string()),
+                 pa.array(columns[2], pa.string()), pa.array(_days(timestamps)), pa.array(timestamps)] +
+                [pa.array(c, pa.float64()) for c in columns[4:]], schema=CANDLE_SCHEMA)
+
+    _write(batches(), root, CANDLE_SCHEMA, CANDLE_PARTITIONS)
+
+    return count[0]
+
+
+def load_candles(root: str, exchange: str, symbol: str, timeframe: str, start_time: int = None,
+                 end_time: int = None) -> CandleColumns:
+    '''
+    Read the candles of a symbol and timeframe straight into NumPy arrays, for the backtests
+    :param root: Directory of the dataset
+    :param exchange: Key of the data, see database.candles_database.exchange_key()
+    :param symbol:
+    :param timeframe:
+    :param start_time: First open time included, in milliseconds
+    :param end_time: Last open time included, in milliseconds
+    :return:
+    '''
+
+    _require_pyarrow()
+
+    dataset = ds.dataset(root, format="parquet", partitioning=_partitioning(CANDLE_SCHEMA, CANDLE_PARTITIONS))
+    table = dataset.to_table(columns=["timestamp", "open", "high", "low", "close", "volume"],
+                             filter=_filter(exchange, symbol, timeframe, "timestamp", start_time, end_time))
+
+    # One chunk per file: they are concatenated once, the NumPy arrays are then views without copy
+    table = table.combine_chunks()
+
+    timestamps = table.column("timestamp").to_numpy()
+    if len(timestamps) > 1 and (np.diff(timestamps) < 0).any():
+        table = table.sort_by("timestamp")
+
+    return CandleColumns(table)
+
+
+def import_candles(root: str, store: CandlesDatabase, exchange: str = None, symbol: str = None,
+                   timeframe: str = None) -> int:
+    '''
+    Load Parquet candles into the candle store, replacing the candles already stored at the same times
+    :return: Number of candles imported
+    '''
+
+    _require_pyarrow()
+
+    dataset = ds.dataset(root, format="parquet", partitioning=_partitioning(CANDLE_SCHEMA, CANDLE_PARTITIONS))
+    columns = ["exchange", "symbol", "timeframe", "timestamp", "open", "high", "low", "close", "volume"]
+
+    count = 0
+
+    for batch in dataset.to_batches(columns=columns, filter=_filter(exchange, symbol, timeframe)):
+        rows = list(zip(*[batch.column(c).to_pylist() for c in columns]))
+        store.save_rows(rows)
+        count += len(rows)
+
+    return count
+
+
+def export_trades(trades_db: TradesDatabase, root: str) -> int:
+    '''
+    Write the trade journal to Parquet files partitioned by exchange / symbol / day
+    :param trades_db:
+    :param root: Directory of the dataset
+    :return: Number of trades written
+    '''
+
+    _require_pyarrow()
+
+    count = [0]
+
+    def batches():
+        for rows in trades_db.iter_rows():
+            columns = dict(zip(TRADE_COLUMNS, zip(*rows)))
+            times = np.array(columns["time"], dtype=np.int64)
+            count[0] += len(rows)
+
+            arrays = [pa.array(_days(times)) if f.name == "day" else pa.array(columns[f.name], f.type)
+                      for f in TRADE_SCHEMA]
+
+            yield pa.RecordBatch.from_arrays(arrays, schema=TRADE_SCHEMA)
+
+    # The writer consumes the batches from its own threads, and the journal connection is bound to this thread:
+    # the trades are read first, the journal is much smaller than the candle store
+    _write(pa.Table.from_batches(list(batches()), schema=TRADE_SCHEMA), root, TRADE_SCHEMA, TRADE_PARTITIONS)
+
+    return count[0]
+
+
+def load_trades(root: str, exchange: str = None, symbol: str = None, start_time: int = None,
+                end_time: int = None):
+    '''
+    Read the exported trades, for the external analysis
+    :return: pandas DataFrame with the TRADE_COLUMNS
+    '''
+
+    _require_pyarrow()
+
+    dataset = ds.dataset(root, format="parquet", partitioning=_partitioning(TRADE_SCHEMA, TRADE_PARTITIONS))
+
+    return dataset.to_table(columns=list(TRADE_COLUMNS),
+                            filter=_filter(exchange, symbol, None, "time", start_time, end_time)).to_pandas()
+
+
+def import_trades(root: str, trades_db: TradesDatabase) -> int:
+    '''
+    Add the exported trades to the trade journal. The trades already recorded (same entry_id and time) are skipped,
+    so importing the same dataset twice does not duplicate them.
+    :return: Number of trades imported
+    '''
+
+    _require_pyarrow()
+
+    dataset = ds.dataset(root, format="parquet", partitioning=_partitioning(TRADE_SCHEMA, TRADE_PARTITIONS))
+
+    recorded = trades_db.trade_keys()
+    entry_id_index = TRADE_COLUMNS.index("entry_id")
+    time_index = TRADE_COLUMNS.index("time")
+
+    count = 0
+
+    for batch in dataset.to_batches(columns=list(TRADE_COLUMNS)):
+        rows = []
+        for row in zip(*[batch.column(c).to_pylist() for c in TRADE_COLUMNS]):
+            key = (row[entry_id_index], row[time_index])
+            if key not in recorded:
+                recorded.add(key)
+                rows.append(row)
+
+        if len(rows) == 0:
+            continue
+
+        trades_db.add_new_rows(rows)
+        count += len(rows)
+
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export / import the candles and the trades as Parquet datasets")
+    parser.add_argument("action", choices=["export", "import"],
+                        help="import replaces the candles of the dataset, and skips the trades already in the journal")
+    parser.add_argument("data", choices=["candles", "trades"])
+    parser.add_argument("root", nargs="?", help="Directory of the Parquet dataset, data/<candles|trades> by default")
+    parser.add_argument("--candles-db", default="candles.db")
+    parser.add_argument("--trades-db", default="trades.db")
+    parser.add_argument("--exchange")
+    parser.add_argument("--symbol")
+    parser.add_argument("--timeframe")
+    args = parser.parse_args()
+
+    if args.root is None:
+        args.root = os.path.join("data", args.data)
+
+    if args.data == "candles":
+        db = CandlesDatabase(args.candles_db)
+        if args.action == "export":
+            count = export_candles(db, args.root, args.exchange, args.symbol, args.timeframe)
+        else:
+            count = import_candles(args.root, db, args.exchange, args.symbol, args.timeframe)
+    else:
+        db = TradesDatabase(args.trades_db)
+        count = export_trades(db, args.root) if args.action == "export" else import_trades(args.root, db)
+
+    db.close()
+
+    print(f"{count} {args.data} {args.action}ed")
+
+
+# Run from the repository root: python -m database.parquet_store export candles [data/candles]
+if __name__ == '__main__':
+    main()
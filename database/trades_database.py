@@ -1,17 +1,101 @@
+import logging
+import queue
 import sqlite3
+import threading
+import time
 import typing
 from Trading.models import Trade
 
+logger = logging.getLogger()
+
+# The writer commits when this many trades are waiting, or when the oldest waited this long (seconds)
+WRITER_BATCH_SIZE = 100
+WRITER_FLUSH_INTERVAL = 1.0
+
+
+# Version of the trades table, stored in PRAGMA user_version. 0 is the first table, with only TEXT columns.
+SCHEMA_VERSION = 1
+
+# Columns the summaries can be grouped by
+SUMMARY_GROUPS = ("strategy", "symbol", "exchange")
+
+TRADE_COLUMNS = ("time", "exchange", "symbol", "strategy", "side", "entry_price", "exit_price", "exit_time",
+                 "status", "pnl", "quantity", "entry_id")
+
+
+def trade_row(trade: Trade) -> typing.Tuple:
+    return (trade.time, trade.contract.exchange, trade.contract.symbol, trade.strategy, trade.side,
+            trade.entry_price, trade.exit_price, trade.exit_time, trade.status, trade.pnl, trade.quantity,
+            str(trade.entry_id))
+
 
 class TradesDatabase:
-    def __init__(self):
-        self._conn = sqlite3.connect('trades.db')
+    def __init__(self, path: str = 'trades.db'):
+        self._conn = sqlite3.connect(path)
         self._conn.row_factory = sqlite3.Row  # Makes the data retrieved from the database accessible by their column name
         self._cursor = self._conn.cursor()
 
-        self._cursor.execute("CREATE TABLE IF NOT EXISTS trades (time TEXT, contract TEXT, strategy TEXT, side TEXT, "
-                             "entryPrice TEXT, status TEXT, pnl TEXT, quantity TEXT, entryId TEXT)")
-        self._conn.commit()  # Saves the changes
+        self._migrate()
+
+    def _migrate(self):
+        '''
+        Bring the trades table to SCHEMA_VERSION. The version is checked again inside the transaction, in case another
+        connection migrated the file in the meantime.
+        :return:
+        '''
+
+        if self._cursor.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+            return
+
+        self._cursor.execute("BEGIN IMMEDIATE")
+
+        try:
+            if self._cursor.execute("PRAGMA user_version").fetchone()[0] < 1:
+                self._migrate_to_v1()
+
+            self._cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            self._conn.commit()
+        except sqlite3.Error:
+            self._conn.rollback()
+            raise
+
+    def _migrate_to_v1(self):
+        '''
+        Typed columns (times in milliseconds, REAL prices), the exchange and the exit of the trades, and the indexes
+        of the summaries. The rows of the version 0 table are converted, the values saved as 'None' become NULL.
+        :return:
+        '''
+
+        legacy = self._cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'trades'")\
+            .fetchone() is not None
+
+        if legacy:
+            self._cursor.execute("ALTER TABLE trades RENAME TO trades_v0")
+
+        self._cursor.execute("CREATE TABLE trades (id INTEGER PRIMARY KEY, time INTEGER NOT NULL, exchange TEXT, "
+                             "symbol TEXT NOT NULL, strategy TEXT NOT NULL, side TEXT, entry_price REAL, "
+                             "exit_price REAL, exit_time INTEGER, status TEXT, pnl REAL, quantity REAL, entry_id TEXT)")
+
+        if legacy:
+            self._cursor.execute("INSERT INTO trades (time, symbol, strategy, side, entry_price, status, pnl, "
+                                 "quantity, entry_id) SELECT CAST(time AS INTEGER), contract, strategy, side, "
+                                 "CAST(NULLIF(entryPrice, 'None') AS REAL), status, CAST(NULLIF(pnl, 'None') AS REAL), "
+                                 "CAST(NULLIF(quantity, 'None') AS REAL), entryId FROM trades_v0")
+            self._cursor.execute("DROP TABLE trades_v0")
+
+        # pnl is included so the summaries are computed from the indexes only
+        self._cursor.execute("CREATE INDEX trades_strategy_time ON trades (strategy, time, pnl)")
+        self._cursor.execute("CREATE INDEX trades_symbol_time ON trades (symbol, time, pnl)")
+
+    def enable_wal(self):
+        '''
+        Write-ahead log: the readers are not blocked by the writer, and a commit only appends to the log.
+        synchronous=NORMAL is safe in WAL mode, a power loss can only lose the last commits.
+        :return:
+        '''
+
+        self._cursor.execute("PRAGMA journal_mode=WAL")
+        self._cursor.execute("PRAGMA synchronous=NORMAL")
 
     def add_new_trade(self, trade: Trade):
         '''
@@ -20,24 +104,265 @@ class TradesDatabase:
         :return:
         '''
 
-        self._cursor.execute(f'INSERT INTO trades VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', (str(trade.time),
-                             trade.contract.symbol, str(trade.strategy), trade.side, str(trade.entry_price), trade.status,
-                             str(trade.pnl), str(trade.quantity), str(trade.entry_id)))
+        self.add_new_rows([trade_row(trade)])
+
+    def add_new_rows(self, rows: typing.List[typing.Tuple]):
+        '''
+        Insert several trades (see trade_row()) in one transaction
+        :param rows:
+        :return:
+        '''
+
+        self._cursor.executemany(f"INSERT INTO trades ({', '.join(TRADE_COLUMNS)}) "
+                                 f"VALUES ({', '.join('?' * len(TRADE_COLUMNS))})", rows)
         self._conn.commit()
 
-    def get_trades(self):
+    def trade_keys(self) -> typing.Set[typing.Tuple[str, int]]:
+        '''
+        (entry_id, time) of the trades recorded, to skip the trades already in the journal when importing
+        :return:
+        '''
+
+        return {(r[0], r[1]) for r in self._conn.execute("SELECT entry_id, time FROM trades")}
+
+    @staticmethod
+    def _filters(strategy: str = None, symbol: str = None, start_time: int = None,
+                 end_time: int = None) -> typing.Tuple[str, typing.List]:
+        '''
+        WHERE clause of the closed trades matching the filters, times in milliseconds (opening time of the trades)
+        :return:
+        '''
+
+        conditions = ["status = 'closed'"]
+        params = []
+
+        for condition, value in (("strategy = ?", strategy), ("symbol = ?", symbol), ("time >= ?", start_time),
+                                 ("time <= ?", end_time)):
+            if value is not None:
+                conditions.append(condition)
+                params.append(value)
+
+        return " WHERE " + " AND ".join(conditions), params
+
+    def get_trades(self, strategy: str = None, symbol: str = None, start_time: int = None, end_time: int = None,
+                   limit: int = None):
         '''
-        Get all the rows recorded for the table.
+        Get the closed trades recorded, the most recent first
         :return:
         '''
 
-        self._cursor.execute(f"SELECT * FROM trades")
+        where, params = self._filters(strategy, symbol, start_time, end_time)
+        query = f"SELECT {', '.join(TRADE_COLUMNS)} FROM trades" + where + " ORDER BY time DESC"
+
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+
+        self._cursor.execute(query, params)
         data = self._cursor.fetchall()
         return data
 
+    def iter_rows(self, batch_size: int = 100000) -> typing.Iterator[typing.List[typing.Tuple]]:
+        '''
+        Read all the trades by batches, for the bulk exports
+        :return: Lists of rows with the TRADE_COLUMNS
+        '''
+
+        cursor = self._conn.execute(f"SELECT {', '.join(TRADE_COLUMNS)} FROM trades ORDER BY time")
+
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if len(rows) == 0:
+                return
+            yield [tuple(r) for r in rows]
+
+    def pnl_summary(self, group_by: str = "strategy", strategy: str = None, symbol: str = None,
+                    start_time: int = None, end_time: int = None) -> typing.List[typing.Dict]:
+        '''
+        Number of trades, total / average / best / worst PnL and win rate of the closed trades, computed by SQLite.
+        The PnL are in the currency of each contract (BTC on Bitmex), group by symbol to compare amounts.
+        :param group_by: strategy, symbol or exchange
+        :return: One dict per group, the best total PnL first
+        '''
+
+        if group_by not in SUMMARY_GROUPS:
+            raise ValueError(f"Trades can only be grouped by {', '.join(SUMMARY_GROUPS)}")
+
+        where, params = self._filters(strategy, symbol, start_time, end_time)
+
+        self._cursor.execute(f"SELECT {group_by} AS grp, COUNT(*) AS trades, TOTAL(pnl) AS total_pnl, "
+                             f"AVG(pnl) AS avg_pnl, MAX(pnl) AS best, MIN(pnl) AS worst, "
+                             f"TOTAL(pnl > 0) AS wins FROM trades" + where +
+                             f" GROUP BY {group_by} ORDER BY total_pnl DESC", params)
+
+        return [{group_by: r['grp'], 'trades': r['trades'], 'total_pnl': r['total_pnl'], 'avg_pnl': r['avg_pnl'],
+                 'best': r['best'], 'worst': r['worst'], 'wins': int(r['wins']),
+                 'win_rate': r['wins'] / r['trades'] * 100} for r in self._cursor.fetchall()]
+
+    def equity_curve(self, strategy: str = None, symbol: str = None, start_time: int = None, end_time: int = None,
+                     resolution: int = None) -> typing.List[typing.Tuple[int, float]]:
+        '''
+        Cumulative PnL of the closed trades, summed by SQLite with a window function
+        :param resolution: Bucket size in milliseconds, one point per bucket instead of one per trade
+        :return: (time, cumulative PnL)
+        '''
+
+        where, params = self._filters(strategy, symbol, start_time, end_time)
+
+        if resolution is None:
+            query = "SELECT time, TOTAL(pnl) OVER (ORDER BY time ROWS UNBOUNDED PRECEDING) FROM trades" + where + \
+                    " ORDER BY time"
+        else:
+            query = "SELECT bucket, TOTAL(bucket_pnl) OVER (ORDER BY bucket ROWS UNBOUNDED PRECEDING) FROM " \
+                    "(SELECT time / ? * ? AS bucket, TOTAL(pnl) AS bucket_pnl FROM trades" + where + \
+                    " GROUP BY bucket) ORDER BY bucket"
+            params = [resolution, resolution] + params
+
+        return [(r[0], r[1]) for r in self._cursor.execute(query, params)]
+
     def close(self):
         '''
         Close the database connection
         :return:
         '''
         self._conn.close()
+
+
+class TradesWriter:
+    '''
+    One thread and one connection writing all the closed trades, instead of a thread and a connection per trade.
+    The trades are queued and inserted in groups, one commit per group.
+    '''
+
+    def __init__(self, path: str = 'trades.db', batch_size: int = WRITER_BATCH_SIZE,
+                 flush_interval: float = WRITER_FLUSH_INTERVAL):
+        self._path = path
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+
+        self._queue = queue.Queue()
+        self._closed = False
+
+        self.written = 0
+        self.commits = 0
+
+        self._thread = threading.Thread(target=self._run, name='trades_writer', daemon=True)
+        self._thread.start()
+
+    def add_trade(self, trade: Trade):
+        '''
+        Queue a trade, its values are read now: the trade object can still change afterwards
+        :param trade:
+        :return:
+        '''
+
+        if self._closed:
+            logger.error("Trade %s not saved, the trades writer is closed", trade.entry_id)
+            return
+
+        self._queue.put(trade_row(trade))
+
+    def flush(self):
+        '''
+        Wait until all the queued trades are committed
+        :return:
+        '''
+
+        self._queue.join()
+
+    def close(self):
+        '''
+        Commit the queued trades and close the connection
+        :return:
+        '''
+
+        if self._closed:
+            return
+
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        db = TradesDatabase(self._path)
+        db.enable_wal()
+
+        stopping = False
+
+        while not stopping:
+            row = self._queue.get()
+            rows = [row]
+            deadline = time.monotonic() + self._flush_interval
+
+            # Group the trades arriving until the batch is full or the first one waited flush_interval
+            while row is not None and len(rows) < self._batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    row = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                rows.append(row)
+
+            if None in rows:
+                stopping = True
+
+            batch = [r for r in rows if r is not None]
+
+            if len(batch) > 0:
+                try:
+                    db.add_new_rows(batch)
+                    self.written += len(batch)
+                    self.commits += 1
+                except sqlite3.Error as e:
+                    logger.error("Error while saving %s trades: %s", len(batch), e)
+
+            for _ in rows:
+                self._queue.task_done()
+
+        db.close()
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def trades_writer() -> TradesWriter:
+    '''
+    The writer shared by all the strategies, started with the first closed trade
+    :return:
+    '''
+
+    global _writer
+
+    with _writer_lock:
+        if _writer is None:
+            _writer = TradesWriter()
+        return _writer
+
+
+def close_trades_writer():
+    '''
+    Commit the pending trades before the application exits
+    :return:
+    '''
+
+    with _writer_lock:
+        if _writer is not None:
+            _writer.close()
+
+
+def set_trades_writer(writer: TradesWriter) -> typing.Union[TradesWriter, None]:
+    '''
+    Replace the shared writer, the replay of recorded messages saves its trades in its own database
+    :param writer:
+    :return: The previous writer, not closed
+    '''
+
+    global _writer
+
+    with _writer_lock:
+        previous = _writer
+        _writer = writer
+        return previous
@@ -11,6 +11,8 @@ from interface.trades_component import TradesWatch
 from interface.strategy_components import StrategyEditor
 from connectors.binance import BinanceClient
 from connectors.bitmex import BitmexClient
+from connectors.tick_recorder import TickRecorder
+from database.trades_database import close_trades_writer
 import client_setup
 
 logger = logging.getLogger()
@@ -33,6 +35,16 @@ class Root(tk.Tk):
         except Exception as e:
             print('Bitmex client could not be created')
 
+        # Raw websocket messages saved for the offline replays, see connectors/replay.py.
+        # Only the clients created above record, the recorder is not started when none of them exists.
+        self._tick_recorder = None
+        if client_setup.record_ticks and (hasattr(self, '_binance') or hasattr(self, '_bitmex')):
+            self._tick_recorder = TickRecorder()
+            if hasattr(self, '_binance'):
+                self._binance.streams.recorder = self._tick_recorder
+            if hasattr(self, '_bitmex'):
+                self._bitmex.recorder = self._tick_recorder
+
         self.title('Trading Bot')
 
         self.protocol('WM_DELETE_WINDOW', self._ask_before_close)
@@ -86,14 +98,53 @@ class Root(tk.Tk):
 
         self._update_ui()
 
+    def _update_subscriptions(self):
+        '''
+        Subscribe the price streams of the watchlist (and of the Binance strategies) in one batch per exchange, and
+        unsubscribe the symbols that are not displayed or traded anymore.
+        Binance prices come from bookTicker, Bitmex watchlist prices from instrument:SYMBOL (the Bitmex strategies
+        subscribe to their own quote and trade topics).
+        :return:
+        '''
+
+        needed = {'Binance': {'BTCUSDT'}, 'Bitmex': set()}
+
+        for key in self._watchlist_frame.body_widgets['symbol']:
+            exchange = self._watchlist_frame.body_widgets['exchange'][key].cget("text")
+            if exchange in needed:
+                needed[exchange].add(self._watchlist_frame.body_widgets['symbol'][key].cget("text"))
+
+        for strategy in list(self._binance.strategies.values()):
+            needed['Binance'].add(strategy.contract.symbol)
+
+        for client, symbols, channel in ((self._binance, needed['Binance'], "bookTicker"),
+                                         (self._bitmex, needed['Bitmex'], "instrument")):
+
+            subscribed = set(client.ws_subscriptions[channel])
+
+            new_symbols = [client.contracts[s] for s in symbols - subscribed if s in client.contracts]
+            old_symbols = [client.contracts[s] for s in subscribed - symbols]
+
+            if len(new_symbols) > 0:
+                client.subscribe_channel(new_symbols, channel)
+
+            if len(old_symbols) > 0:
+                client.unsubscribe_channel(old_symbols, channel)
+
     def _ask_before_close(self):
         result = askquestion('Confirmation', 'Do you really want to exit the application?')
         if result == 'yes':
             variables.restart = False
             self._binance.reconnect = False
             self._bitmex.reconnect = False
-            self._binance.ws.close()
+            self._binance.streams.close()
+            self._binance.stop_user_stream()
             self._bitmex.ws.close()
+            if self._tick_recorder is not None:
+                self._tick_recorder.close()
+            self._binance.stop_strategies()
+            self._bitmex.stop_strategies()
+            close_trades_writer()
 
             self.destroy()
 
@@ -151,6 +202,8 @@ class Root(tk.Tk):
 
         # Watchlist prices
 
+        self._update_subscriptions()
+
         try:
             for key, value in self._watchlist_frame.body_widgets['symbol'].items():
 
@@ -161,9 +214,6 @@ class Root(tk.Tk):
                     if symbol not in self._binance.contracts:
                         continue
 
-                    if symbol not in self._binance.ws_subscriptions["bookTicker"] and self._binance.ws_connected:
-                        self._binance.subscribe_channel([self._binance.contracts[symbol]], "bookTicker")
-
                     if symbol not in self._binance.prices:
                         self._binance.get_bid_ask(self._binance.contracts[symbol])
                         continue
@@ -1,6 +1,7 @@
 import tkinter as tk
 import tkmacosx as tkmac
 import json
+import threading
 import typing
 from interface.styling import *
 from Trading.utils import *
@@ -11,6 +12,7 @@ from interface.scrollable_frame import ScrollableFrame
 from database.workspace_database import WorkspaceDatabase
 
 from Trading.strategies import TechnicalStrategy, BreakoutStrategy
+from Trading.optimizer import optimize
 
 if typing.TYPE_CHECKING:
     pass
@@ -223,6 +225,11 @@ class StrategyEditor(tk.Frame):
 
         validation_button.grid(row=row_nb, column=0, columnspan=2)
 
+        optimize_button = tkmac.Button(self._popup_window, text='Optimize', bg=BG_COLOR_2, fg=FG_COLOR,
+                                       command=lambda: self._optimize_parameters(b_index), borderless=True)
+
+        optimize_button.grid(row=row_nb + 1, column=0, columnspan=2)
+
     def _validate_parameters(self, b_index: int):
 
         strat_selected = self.body_widgets['strategy_type_var'][b_index].get()
@@ -238,6 +245,73 @@ class StrategyEditor(tk.Frame):
 
         self._popup_window.destroy()
 
+    def _optimize_parameters(self, b_index: int):
+
+        """
+        Search the best parameters (and TP / SL) of the row's strategy over the historical candles of its contract.
+        The search runs on a process pool from a background thread, the rows are filled once it is done.
+        :param b_index:
+        :return:
+        """
+
+        strat_selected = self.body_widgets['strategy_type_var'][b_index].get()
+        symbol, exchange = self.body_widgets['contract_var'][b_index].get().split('_')
+        timeframe = self.body_widgets['timeframe_var'][b_index].get()
+
+        client = self._exchanges[exchange]
+        allow_short = client.platform != 'binance_spot'
+
+        # The equity compounds with the trade size, the parameters are ranked for the size of the row
+        if self.body_widgets['balance_pct'][b_index].get() == '':
+            self.root.logging_frame.add_log('Missing balance_pct parameter')
+            return
+
+        balance_pct = float(self.body_widgets['balance_pct'][b_index].get())
+
+        result = dict()
+
+        # The candles can be read from the database and downloaded, out of the Tk main loop as well
+        def run():
+            candles = client.market_data.historical_candles(client.contracts[symbol], timeframe)
+
+            if len(candles) < 2:
+                result['error'] = f'No historical data retrieved for {symbol}'
+                return
+
+            rows = [[c.timestamp, c.open, c.high, c.low, c.close, c.volume] for c in candles]
+            result['ranking'] = optimize(strat_selected, rows, balance_pct=balance_pct, allow_short=allow_short)
+
+        thread = threading.Thread(target=run)
+        thread.start()
+
+        self.root.logging_frame.add_log(f'Optimizing {strat_selected} parameters on {symbol} / {timeframe}...')
+        self._wait_for_optimization(b_index, thread, result)
+
+    def _wait_for_optimization(self, b_index: int, thread: threading.Thread, result: typing.Dict):
+        if thread.is_alive():
+            self.after(500, lambda: self._wait_for_optimization(b_index, thread, result))
+            return
+
+        if 'error' in result:
+            self.root.logging_frame.add_log(result['error'])
+            return
+
+        if not result.get('ranking') or b_index not in self.body_widgets['take_profit']:
+            self.root.logging_frame.add_log('Optimization failed')
+            return
+
+        best = result['ranking'][0]
+
+        for code_name, value in best['params'].items():
+            if code_name in ['take_profit', 'stop_loss']:
+                self.body_widgets[code_name][b_index].delete(0, tk.END)
+                self.body_widgets[code_name][b_index].insert(tk.END, str(value))
+            else:
+                self.additional_parameters[b_index][code_name] = value
+
+        self.root.logging_frame.add_log(f"Best parameters: {best['params']} | PnL {best['pnl_pct']:.2f}% | "
+                                        f"Win rate {best['win_rate']:.1f}% | Max drawdown {best['max_drawdown_pct']:.2f}%")
+
     def _switch_strategy(self, b_index: int):
 
         for param in ['balance_pct', 'take_profit', 'stop_loss']:
@@ -277,19 +351,14 @@ class StrategyEditor(tk.Frame):
             else:
                 return
 
-            new_strategy.candles = self._exchanges[exchange].get_historical_candles(contract, timeframe)
-
-            if len(new_strategy.candles) == 0:
+            # the historical candles are downloaded only if no other strategy runs on the same symbol and timeframe
+            if not self._exchanges[exchange].add_strategy(b_index, new_strategy):
                 self.root.logging_frame.add_log(f'No historical data retrieved for {contract.symbol}')
                 return
 
             if exchange == 'Binance':
                 self._exchanges[exchange].subscribe_channel([contract], 'aggTrade')
 
-            new_strategy._check_signal()
-
-            self._exchanges[exchange].strategies[b_index] = new_strategy
-
             for param in self._base_params:
                 code_name = param['code_name']
 
@@ -302,7 +371,7 @@ class StrategyEditor(tk.Frame):
 
         else:
 
-            del self._exchanges[exchange].strategies[b_index]
+            self._exchanges[exchange].remove_strategy(b_index)
 
             for param in self._base_params:
                 code_name = param['code_name']
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from Trading.backtest import breakout_entries, candle_columns, run_backtest, technical_entries
+from Trading.strategies import exit_prices, exits_triggered
+
+TECHNICAL_PARAMS = {'rsi_length': 14, 'ema_fast': 12, 'ema_slow': 26, 'ema_signal': 9}
+
+
+def random_candles(n: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+
+    closes = 100 * np.cumprod(1 + rng.normal(0, 0.002, n))
+    opens = np.concatenate(([closes[0]], closes[:-1]))
+    highs = np.maximum(opens, closes) * (1 + rng.random(n) * 0.001)
+    lows = np.minimum(opens, closes) * (1 - rng.random(n) * 0.001)
+
+    return np.column_stack([np.arange(n) * 60000, opens, highs, lows, closes, rng.random(n) * 10])
+
+
+def reference_trades(strategy_type, candles, take_profit, stop_loss, other_params, allow_short):
+    '''
+    One position at a time, its exit searched candle by candle with the rules of the live strategies
+    '''
+
+    timestamps, opens, highs, lows, closes, volumes = candle_columns(candles)
+
+    if strategy_type == "Technical":
+        indexes, signals, prices = technical_entries(opens, closes, other_params)
+        offset = 0
+    else:
+        indexes, signals, prices = breakout_entries(highs, lows, closes, volumes, other_params)
+        offset = 1
+
+    trades = []
+    next_entry = 0
+
+    for index, signal, entry_price in zip(indexes.tolist(), signals.tolist(), prices.tolist()):
+        if index < next_entry or (signal == -1 and not allow_short):
+            continue
+
+        side = "long" if signal == 1 else "short"
+        tp_price, sl_price = exit_prices(entry_price, side, take_profit, stop_loss)
+
+        exit_index, exit_price, reason = len(closes) - 1, float(closes[-1]), "end"
+
+        for i in range(index + offset, len(closes)):
+            tp_hit, sl_hit = exits_triggered(side, lows[i], highs[i], tp_price, sl_price)
+            if sl_hit:
+                exit_index, exit_price, reason = i, sl_price, "stop_loss"
+                break
+            if tp_hit:
+                exit_index, exit_price, reason = i, tp_price, "take_profit"
+                break
+
+        trades.append((int(timestamps[index]), int(timestamps[exit_index]), side, exit_price, reason))
+        next_entry = exit_index + 1
+
+    return trades
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+@pytest.mark.parametrize("strategy_type, other_params", [("Breakout", {'min_volume': 2}),
+                                                         ("Technical", TECHNICAL_PARAMS)])
+@pytest.mark.parametrize("take_profit, stop_loss", [(0.1, 0.05), (1, 0.5), (None, 0.3), (0.5, None), (None, None)])
+@pytest.mark.parametrize("allow_short", [True, False])
+def test_backtest_matches_trade_by_trade_simulation(seed, strategy_type, other_params, take_profit, stop_loss,
+                                                    allow_short):
+    candles = random_candles(3000, seed)
+
+    result = run_backtest(strategy_type, candles, take_profit, stop_loss, other_params, allow_short=allow_short)
+    trades = [(t['entry_time'], t['exit_time'], t['side'], t['exit_price'], t['exit_reason']) for t in result.trades]
+
+    assert trades == reference_trades(strategy_type, candles, take_profit, stop_loss, other_params, allow_short)
+
+
+@pytest.mark.parametrize("n", [0, 1, 2, 3, 9])
+def test_backtest_short_series(n):
+    candles = random_candles(n, 0) if n > 0 else np.empty((0, 6))
+
+    result = run_backtest("Breakout", candles, 0.1, 0.05, {'min_volume': 0})
+    trades = [(t['entry_time'], t['exit_time'], t['side'], t['exit_price'], t['exit_reason']) for t in result.trades]
+
+    assert trades == reference_trades("Breakout", candles, 0.1, 0.05, {'min_volume': 0}, True)
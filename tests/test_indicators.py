@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from Trading.indicators import ExponentialMean, TechnicalIndicators
+from Trading.strategies import rsi_series, macd_series
+
+
+def random_closes(n: int, seed: int) -> np.ndarray:
+    '''
+    Random walk with flat stretches, where the average loss (or gain) of the RSI goes down to 0
+    '''
+
+    rng = np.random.default_rng(seed)
+    closes = 30000 * np.cumprod(1 + rng.normal(0, 0.002, n))
+
+    for start in rng.integers(0, n - 50, 20):
+        closes[start:start + rng.integers(5, 50)] = closes[start]
+
+    return np.round(closes, 2)
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_exponential_mean_matches_pandas(seed):
+    closes = random_closes(5000, seed)
+
+    for kwargs in ({'span': 12}, {'span': 26}, {'com': 13, 'min_periods': 14}):
+        mean = ExponentialMean(**kwargs)
+        incremental = np.array([mean.update(c) for c in closes])
+
+        expected = pd.Series(closes).ewm(**kwargs).mean().to_numpy()
+
+        np.testing.assert_array_equal(incremental, expected)
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_technical_indicators_match_pandas(seed):
+    closes = random_closes(5000, seed)
+    timestamps = np.arange(len(closes), dtype=np.int64) * 60000
+
+    rsi = rsi_series(closes, 14)
+    macd_line, macd_signal = macd_series(closes, 12, 26, 9)
+
+    indicators = TechnicalIndicators(12, 26, 9, 14)
+
+    # A 1000 candles history first, then the candles closed one by one or by small groups like the live updates
+    end = 1000
+    rng = np.random.default_rng(seed)
+
+    while end <= len(closes):
+        indicators.update(timestamps[:end], closes[:end])
+
+        assert indicators.last_timestamp == timestamps[end - 1]
+        np.testing.assert_array_equal(indicators.rsi, rsi[end - 1])
+        np.testing.assert_array_equal(indicators.macd, (macd_line[end - 1], macd_signal[end - 1]))
+
+        end += int(rng.integers(1, 4))
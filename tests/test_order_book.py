@@ -0,0 +1,221 @@
+import threading
+import time
+
+import pytest
+
+from connectors.binance import BinanceClient
+from connectors.bitmex import BitmexClient
+from Trading.order_book import OrderBook
+
+
+def binance_client(futures: bool, snapshots) -> BinanceClient:
+    '''
+    Client with only the depth synchronization state, the REST snapshots are read from a list
+    :param snapshots: lastUpdateId, bids, asks of each snapshot, or a function returning it
+    '''
+
+    client = BinanceClient.__new__(BinanceClient)
+    client.futures = futures
+    client.order_books = {'BTCUSDT': OrderBook('BTCUSDT')}
+    client._depth_buffers = {'BTCUSDT': []}
+    client._resyncing = set()
+    client.snapshot_requests = []
+
+    snapshots = iter(snapshots)
+
+    def make_request(method, endpoint, data):
+        client.snapshot_requests.append((endpoint, data))
+        snapshot = next(snapshots)
+        if callable(snapshot):
+            snapshot = snapshot()
+        last_update_id, bids, asks = snapshot
+        return {'lastUpdateId': last_update_id, 'bids': bids, 'asks': asks}
+
+    client._make_request = make_request
+
+    return client
+
+
+def depth_update(first_id: int, last_id: int, bids=(), asks=(), previous_id: int = None):
+    return {'e': 'depthUpdate', 's': 'BTCUSDT', 'U': first_id, 'u': last_id, 'pu': previous_id,
+            'b': [list(level) for level in bids], 'a': [list(level) for level in asks]}
+
+
+def wait_synced(book: OrderBook, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while not book.synced and time.monotonic() < deadline:
+        time.sleep(0.001)
+    assert book.synced
+
+
+def test_binance_snapshot_bridges_the_buffered_updates():
+    client = binance_client(False, [(100, [("99", "1")], [("101", "1")])])
+    book = client.order_books['BTCUSDT']
+
+    # Buffered while the snapshot is downloaded: the first update is older than the snapshot,
+    # the second one contains lastUpdateId + 1 (U <= 101 <= u)
+    client._on_depth_update(depth_update(90, 95, bids=[("98", "5")]))
+    client._on_depth_update(depth_update(96, 103, bids=[("99", "2")]))
+    client._on_depth_update(depth_update(104, 110, asks=[("101", "0"), ("102", "3")]))
+
+    client._resyncing.add('BTCUSDT')
+    client._load_order_book_snapshot('BTCUSDT')
+
+    assert book.synced
+    assert book.last_update_id == 110
+    assert book.top() == ([(99.0, 2.0)], [(102.0, 3.0)])
+    assert client.snapshot_requests == [('/api/v3/depth', {'symbol': 'BTCUSDT', 'limit': 1000})]
+    assert client._resyncing == set()
+
+    # Synced: applied directly
+    client._on_depth_update(depth_update(111, 112, bids=[("99.5", "1")]))
+    assert book.best_bid() == (99.5, 1.0)
+    assert book.last_update_id == 112
+
+
+def test_binance_gap_resyncs_the_book():
+    client = binance_client(False, [(100, [("99", "1")], [("101", "1")]),
+                                    (200, [("97", "4")], [("103", "4")])])
+    book = client.order_books['BTCUSDT']
+
+    client._resyncing.add('BTCUSDT')
+    client._load_order_book_snapshot('BTCUSDT')
+    assert book.synced and len(client.snapshot_requests) == 1
+
+    # 101 to 104 are missing
+    client._on_depth_update(depth_update(105, 110, bids=[("50", "1")]))
+    client._on_depth_update(depth_update(111, 210, bids=[("97", "6")]))
+
+    wait_synced(book)
+
+    assert len(client.snapshot_requests) == 2
+    assert book.last_update_id == 210
+    assert book.top() == ([(97.0, 6.0)], [(103.0, 4.0)])
+    assert client._resyncing == set()
+
+
+def test_binance_gap_in_the_buffer_takes_a_new_snapshot():
+    client = binance_client(False, [(100, [], [("101", "1")]), (200, [], [("103", "4")])])
+    book = client.order_books['BTCUSDT']
+
+    client._on_depth_update(depth_update(105, 150))
+    client._on_depth_update(depth_update(151, 205, asks=[("103", "5")]))
+
+    client._resyncing.add('BTCUSDT')
+    client._load_order_book_snapshot('BTCUSDT')
+
+    # The updates after the gap are kept for the second snapshot
+    assert len(client.snapshot_requests) == 2
+    assert book.synced
+    assert book.last_update_id == 205
+    assert book.best_ask() == (103.0, 5.0)
+
+
+def test_binance_one_snapshot_per_symbol_at_a_time():
+    release = threading.Event()
+
+    def slow_snapshot():
+        release.wait(5)
+        return 300, [("99", "1")], [("101", "1")]
+
+    client = binance_client(False, [(100, [], []), slow_snapshot])
+    book = client.order_books['BTCUSDT']
+
+    client._resyncing.add('BTCUSDT')
+    client._load_order_book_snapshot('BTCUSDT')
+
+    # A gap, then more resyncs (gaps, reconnections) while the second snapshot is downloaded
+    client._on_depth_update(depth_update(105, 110))
+    client._resync_order_book('BTCUSDT')
+    client._on_depth_update(depth_update(120, 130))
+    client._resync_order_book('BTCUSDT')
+
+    assert len(client.snapshot_requests) == 2
+    assert client._resyncing == {'BTCUSDT'}
+
+    release.set()
+    wait_synced(book)
+
+    assert len(client.snapshot_requests) == 2
+    assert book.last_update_id == 300
+
+
+def test_binance_futures_sequence_uses_the_previous_update_id():
+    client = binance_client(True, [(100, [("99", "1")], []), (500, [("99", "7")], [])])
+    book = client.order_books['BTCUSDT']
+
+    client._on_depth_update(depth_update(95, 102, bids=[("99", "2")], previous_id=94))
+    client._resyncing.add('BTCUSDT')
+    client._load_order_book_snapshot('BTCUSDT')
+
+    assert client.snapshot_requests[0][0] == '/fapi/v1/depth'
+    assert book.synced and book.last_update_id == 102
+
+    client._on_depth_update(depth_update(103, 108, bids=[("99", "3")], previous_id=102))
+    assert book.best_bid() == (99.0, 3.0)
+
+    # pu does not match the last update applied
+    client._on_depth_update(depth_update(110, 115, bids=[("99", "4")], previous_id=109))
+    wait_synced(book)
+
+    assert len(client.snapshot_requests) == 2
+    assert book.best_bid() == (99.0, 7.0)
+
+
+def bitmex_client() -> BitmexClient:
+    client = BitmexClient.__new__(BitmexClient)
+    client.order_books = {'XBTUSD': OrderBook('XBTUSD')}
+    client._book_levels = {'XBTUSD': dict()}
+    return client
+
+
+def test_bitmex_order_book_l2_actions():
+    client = bitmex_client()
+    book = client.order_books['XBTUSD']
+
+    # Updates received before the partial are ignored
+    client._on_order_book_l2({'action': 'update', 'data': [{'symbol': 'XBTUSD', 'id': 1, 'side': 'Buy',
+                                                            'size': 10}]})
+    assert book.top() == ([], [])
+
+    client._on_order_book_l2({'action': 'partial', 'data': [
+        {'symbol': 'XBTUSD', 'id': 1, 'side': 'Buy', 'size': 100, 'price': 99.5},
+        {'symbol': 'XBTUSD', 'id': 2, 'side': 'Buy', 'size': 200, 'price': 99.0},
+        {'symbol': 'XBTUSD', 'id': 3, 'side': 'Sell', 'size': 150, 'price': 100.0}]})
+
+    assert book.synced
+    assert book.top() == ([(99.5, 100.0), (99.0, 200.0)], [(100.0, 150.0)])
+
+    client._on_order_book_l2({'action': 'insert', 'data': [
+        {'symbol': 'XBTUSD', 'id': 4, 'side': 'Sell', 'size': 50, 'price': 100.5}]})
+
+    # The updates and deletes only have the level id, the price is the one of the partial / insert
+    client._on_order_book_l2({'action': 'update', 'data': [{'symbol': 'XBTUSD', 'id': 1, 'side': 'Buy',
+                                                            'size': 300}]})
+    client._on_order_book_l2({'action': 'delete', 'data': [{'symbol': 'XBTUSD', 'id': 3, 'side': 'Sell'}]})
+
+    # Other symbols are not tracked
+    client._on_order_book_l2({'action': 'insert', 'data': [{'symbol': 'ETHUSD', 'id': 9, 'side': 'Sell',
+                                                            'size': 1, 'price': 2000.0}]})
+
+    assert book.top() == ([(99.5, 300.0), (99.0, 200.0)], [(100.5, 50.0)])
+    assert client._book_levels['XBTUSD'] == {1: ('Buy', 99.5), 2: ('Buy', 99.0), 4: ('Sell', 100.5)}
+
+
+def test_estimate_fill_walks_the_book():
+    book = OrderBook('BTCUSDT')
+    book.apply_snapshot([(99, 1), (98, 2)], [(101, 1), (102, 1), (104, 2)])
+
+    assert book.estimate_fill('buy', 1) == (101.0, 0.0)
+
+    avg_price, slippage = book.estimate_fill('buy', 3)
+    assert avg_price == pytest.approx((101 + 102 + 104) / 3)
+    assert slippage == pytest.approx((avg_price - 101) / 101 * 100)
+
+    avg_price, slippage = book.estimate_fill('SELL', 2)
+    assert avg_price == pytest.approx(98.5)
+    assert slippage == pytest.approx(0.5 / 99 * 100)
+
+    # Not deep enough, or nothing to fill
+    assert book.estimate_fill('sell', 4) is None
+    assert book.estimate_fill('buy', 0) is None
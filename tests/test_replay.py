@@ -0,0 +1,150 @@
+import datetime
+import json
+import random
+
+from connectors.replay import ReplayBinanceClient, ReplayBitmexClient, ReplayEngine
+from connectors.tick_recorder import TickRecorder, segment_paths
+from database.candles_database import CandlesDatabase
+from database.trades_database import TradesDatabase
+from Trading.models import Balance, Candle, Contract
+from Trading.strategies import BreakoutStrategy, TechnicalStrategy
+
+START_TIME = 1600000000000
+MESSAGES = 16000
+INTERVAL_MS = 250
+
+BINANCE_CONTRACT = Contract({'symbol': "BTCUSDT", 'baseAsset': "BTC", 'quoteAsset': "USDT",
+                             'filters': [{'filterType': 'PRICE_FILTER', 'tickSize': '0.01000000'},
+                                         {'filterType': 'LOT_SIZE', 'stepSize': '0.00000100', 'minQty': '0.00000100',
+                                          'maxQty': '9000.00000000'},
+                                         {'filterType': 'MIN_NOTIONAL', 'minNotional': '10.00000000'}]},
+                            "binance_spot")
+
+BITMEX_CONTRACT = Contract({'symbol': "XBTUSD", 'rootSymbol': "XBT", 'quoteCurrency': "USD", 'tickSize': 0.5,
+                            'lotSize': 100, 'isQuanto': False, 'isInverse': True, 'multiplier': -100000000},
+                           "bitmex")
+
+
+def bitmex_time(ms: int) -> str:
+    return datetime.datetime.fromtimestamp(ms / 1000, datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.") + \
+           f"{ms % 1000:03d}Z"
+
+
+def record_segment(root: str):
+    '''
+    Binance aggTrade / bookTicker and Bitmex trade / quote messages, recorded in 10 minutes segments
+    '''
+
+    rng = random.Random(0)
+    recorder = TickRecorder(root, segment_duration=600)
+    price = 30000.0
+
+    for i in range(MESSAGES):
+        ms = START_TIME + i * INTERVAL_MS
+        price *= 1 + rng.gauss(0, 0.001)
+        qty = rng.random() * 2
+
+        if i % 4 == 0:
+            source, msg = 'binance', {"stream": "btcusdt@aggTrade", "data": {
+                "e": "aggTrade", "E": ms, "s": "BTCUSDT", "a": i, "p": f"{price:.2f}", "q": f"{qty:.6f}", "f": i,
+                "l": i, "T": ms - 5, "m": True}}
+        elif i % 4 == 1:
+            source, msg = 'binance', {"stream": "btcusdt@bookTicker", "data": {
+                "u": i, "s": "BTCUSDT", "b": f"{price - 0.01:.2f}", "B": "1.0", "a": f"{price + 0.01:.2f}",
+                "A": "1.0"}}
+        elif i % 4 == 2:
+            source, msg = 'bitmex', {"table": "trade", "action": "insert", "data": [
+                {"timestamp": bitmex_time(ms - 5), "symbol": "XBTUSD", "side": "Buy", "size": int(qty * 1000) + 100,
+                 "price": round(price * 2) / 2}]}
+        else:
+            source, msg = 'bitmex', {"table": "quote", "action": "insert", "data": [
+                {"timestamp": bitmex_time(ms), "symbol": "XBTUSD", "bidSize": 1000, "bidPrice": round(price * 2) / 2,
+                 "askPrice": round(price * 2) / 2 + 0.5, "askSize": 1000}]}
+
+        recorder.record(source, json.dumps(msg, separators=(',', ':')), ms * 1000000)
+
+    recorder.close()
+
+    return recorder.segments
+
+
+def candle_history(path: str) -> CandlesDatabase:
+    rng = random.Random(1)
+    price = 30000.0
+    rows = []
+
+    for i in range(200, 0, -1):
+        close = price * (1 + rng.gauss(0, 0.002))
+        rows.append((START_TIME - START_TIME % 60000 - i * 60000, price, max(price, close) * 1.001,
+                     min(price, close) * 0.999, close, rng.random() * 100))
+        price = close
+
+    db = CandlesDatabase(path)
+    db.save_candles("binance_spot", "BTCUSDT", "1m", Candle.from_rows(rows))
+    db.save_candles("bitmex", "XBTUSD", "1m", Candle.from_rows(rows))
+
+    return db
+
+
+def replay(paths, history: CandlesDatabase, trades_db: str):
+    '''
+    :return: Paper orders, closed trades and candles of the strategies
+    '''
+
+    binance = ReplayBinanceClient({"BTCUSDT": BINANCE_CONTRACT},
+                                  {"USDT": Balance({'free': '100000', 'locked': '0'}, "binance_spot")}, history,
+                                  futures=False, strategy_workers=None)
+    bitmex = ReplayBitmexClient({"XBTUSD": BITMEX_CONTRACT},
+                                {"XBt": Balance({'initMargin': 0, 'maintMargin': 0, 'marginBalance': 100000000,
+                                                 'walletBalance': 100000000, 'unrealisedPnl': 0}, "bitmex")},
+                                history, strategy_workers=None)
+
+    engine = ReplayEngine([binance, bitmex], paths)
+
+    technical = {'ema_fast': 12, 'ema_slow': 26, 'ema_signal': 9, 'rsi_length': 14}
+
+    for index, (client, contract) in enumerate(((binance, BINANCE_CONTRACT), (bitmex, BITMEX_CONTRACT))):
+        assert client.add_strategy(2 * index, TechnicalStrategy(client, contract, client.platform, "1m", 5, 0.2,
+                                                                0.2, technical))
+        assert client.add_strategy(2 * index + 1, BreakoutStrategy(client, contract, client.platform, "1m", 5, 0.2,
+                                                                   0.2, {'min_volume': 10}))
+
+    stats = engine.run(trades_db)
+
+    orders = binance.paper_orders + bitmex.paper_orders
+    candles = {(client.platform, b_index): [column.tolist() for column in
+                                            (s.candles.timestamps, s.candles.opens, s.candles.highs, s.candles.lows,
+                                             s.candles.closes, s.candles.volumes)]
+               for client in (binance, bitmex) for b_index, s in client.strategies.items()}
+
+    binance.close()
+    bitmex.close()
+
+    db = TradesDatabase(trades_db)
+    trades = [tuple(r) for batch in db.iter_rows() for r in batch]
+    db.close()
+
+    assert stats['messages'] == MESSAGES
+    assert stats['closed_trades'] == len(trades)
+
+    return orders, trades, candles
+
+
+def test_replay_is_deterministic(tmp_path):
+    segments = record_segment(str(tmp_path / "ticks"))
+    paths = segment_paths(str(tmp_path / "ticks"))
+    assert len(paths) > 1 and sorted(segments) == sorted(paths)
+
+    history = candle_history(str(tmp_path / "history.db"))
+
+    first_orders, first_trades, first_candles = replay(paths, history, str(tmp_path / "first.db"))
+    second_orders, second_trades, second_candles = replay(paths, history, str(tmp_path / "second.db"))
+
+    history.close()
+
+    # The recording is long enough for the strategies to open and close positions
+    assert len(first_orders) > 0 and len(first_trades) > 0
+
+    assert first_orders == second_orders
+    assert first_trades == second_trades
+    assert first_candles == second_candles
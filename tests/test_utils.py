@@ -0,0 +1,50 @@
+import datetime
+
+import dateutil.parser
+import pytest
+
+from Trading import utils
+from Trading.utils import iso_to_ms
+
+# Pre-epoch, leap days, 1 / 2 / 6 digit fractions, no fraction and time zone offsets
+EDGE_CASES = ["1970-01-01T00:00:00.000Z", "1969-12-31T23:59:59.999Z", "1969-12-31T23:59:59Z",
+              "1900-03-01T00:00:00.001Z", "2020-02-29T23:59:59.999Z", "2000-02-29T00:00:00.000Z",
+              "2021-03-01T00:00:00.000Z", "2038-01-19T03:14:08.001Z", "2100-02-28T12:00:00.500Z",
+              "2021-06-30T23:59:59Z", "2021-06-30T23:59:59.5Z", "2021-06-30T23:59:59.12Z",
+              "2021-06-30T23:59:59.123456Z", "2021-06-30T23:59:59.999+00:00", "2021-06-30T22:59:59.999-01:00",
+              "2021-06-30T23:59:59.999+05:30", "2021-01-01T04:29:59.999+04:30", "2021-12-31T23:59:59.001Z"]
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def reference_ms(timestamp: str) -> int:
+    # Exact integer arithmetic, int(dt.timestamp() * 1000) can be 1 ms off because of the float rounding
+    return (dateutil.parser.isoparse(timestamp) - EPOCH) // datetime.timedelta(milliseconds=1)
+
+
+@pytest.mark.parametrize("timestamp", EDGE_CASES)
+def test_iso_to_ms_matches_isoparse(timestamp):
+    assert iso_to_ms(timestamp) == reference_ms(timestamp)
+
+
+@pytest.mark.parametrize("fractions", [(".001", ".999", ".5", "", ".000"), (".123456", ".12", ".9")])
+def test_iso_to_ms_cached_second_prefix(fractions):
+    utils._SECOND_PREFIXES.clear()
+
+    # The first timestamp fills the cache, the next ones of the same second read it
+    for fraction in fractions:
+        timestamp = f"2021-05-19T13:00:07{fraction}Z"
+        assert iso_to_ms(timestamp) == reference_ms(timestamp)
+
+    assert list(utils._SECOND_PREFIXES) == ["2021-05-19T13:00:07"]
+
+
+def test_iso_to_ms_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(utils, '_MAX_CACHED_PREFIXES', 4)
+    utils._SECOND_PREFIXES.clear()
+
+    for second in range(10):
+        timestamp = f"2021-05-19T13:00:{second:02d}.250Z"
+        assert iso_to_ms(timestamp) == reference_ms(timestamp)
+
+    assert len(utils._SECOND_PREFIXES) <= 4